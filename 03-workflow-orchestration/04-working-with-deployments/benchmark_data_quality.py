@@ -0,0 +1,74 @@
+"""Cost of the data-quality gate compared to loading the data.
+
+For every file, times reading the parquet file into pandas without checks, the checks of
+`data_quality.check_table` on their own, and `read_checked` (read, check, filter and convert).
+The gate overhead is the time of the checks relative to the plain load. The `read_dataframe`
+of the training flow before the gate (pandas, duration per row with `apply`) is timed as well.
+
+Usage:
+    python benchmark_data_quality.py
+    python benchmark_data_quality.py ../../data/green_tripdata_2021-0*.parquet --repeat 20
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+from data_quality import check_table, read_checked
+from features import RideFeaturizer
+
+
+def best_of(repeat, fn, *args, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def load(filename):
+    return pq.read_table(filename).to_pandas()
+
+
+def read_dataframe_before(filename):
+    df = pd.read_parquet(filename)
+    df["duration"] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
+    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
+    return df[(df.duration >= 1) & (df.duration <= 60)]
+
+
+def run(files, repeat):
+    print(
+        f"{'file':<32} {'rows':>7} {'load (ms)':>10} {'checks (ms)':>12} {'overhead':>9} "
+        f"{'gated (ms)':>11} {'before (ms)':>12}"
+    )
+    for filename in files:
+        table = pq.read_table(filename)
+        pu, do = table.column("PULocationID").to_numpy(), table.column("DOLocationID").to_numpy()
+        vocabulary = RideFeaturizer().fit(pu, do).vocabulary
+
+        load_s = best_of(repeat, load, filename)
+        check_s = best_of(repeat, check_table, table, vocabulary)
+        with contextlib.redirect_stdout(io.StringIO()):
+            gated_s = best_of(repeat, read_checked, filename, known_pairs=vocabulary)
+        before_s = best_of(max(repeat // 5, 1), read_dataframe_before, filename)
+        name = filename.rsplit("/", 1)[-1]
+        print(
+            f"{name:<32} {table.num_rows:>7} {load_s * 1000:>10.1f} {check_s * 1000:>12.1f} "
+            f"{check_s / load_s:>9.1%} {gated_s * 1000:>11.1f} {before_s * 1000:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", default=["../../data/green_tripdata_2021-01.parquet"])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    files = sorted(path for pattern in args.files for path in glob.glob(pattern))
+    run(files, args.repeat)
@@ -0,0 +1,119 @@
+"""Accuracy-vs-width and speed comparison of the feature modes.
+
+Featurizes the training and validation months with the old string `DictVectorizer` pipeline, the
+fitted `RideFeaturizer` vocabulary and `HashingFeaturizer` at several widths. For each it reports
+the featurization time, the number of features, the share of PU_DO pairs that share a hashed
+column with another pair, and the validation RMSE of a model trained on the result.
+
+The model is a linear regression by default, which is quick and sensitive to collisions. Use
+`--model xgboost` to compare with the booster of the training flow (100 rounds, best params).
+
+Usage:
+    python benchmark_features.py
+    python benchmark_features.py --widths 4096 65536 --model xgboost
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from features import (
+    HashingFeaturizer,
+    RideFeaturizer,
+    cross_codes,
+)
+from orchestrate_gs_final import (
+    BEST_PARAMS,
+    engine_params,
+    read_dataframe,
+)
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_squared_error
+
+
+def dict_vectorizer_features(df_train, df_val):
+    """The featurization the training flow used before `features.py`."""
+    dv = DictVectorizer()
+    dicts = []
+    for df in (df_train, df_val):
+        pu_do = df["PULocationID"].astype(str) + "_" + df["DOLocationID"].astype(str)
+        features = pd.DataFrame({"PU_DO": pu_do, "trip_distance": df["trip_distance"]})
+        dicts.append(features.to_dict(orient="records"))
+    return dv.fit_transform(dicts[0]), dv.transform(dicts[1])
+
+
+def featurizer_features(featurizer, df_train, df_val):
+    featurizer.fit(df_train["PULocationID"], df_train["DOLocationID"])
+    return featurizer.transform_frame(df_train), featurizer.transform_frame(df_val)
+
+
+def collision_rate(df, width):
+    """Share of the distinct PU_DO pairs whose hashed column is shared with another pair."""
+    codes = np.unique(cross_codes(df["PULocationID"], df["DOLocationID"]))
+    hasher = HashingFeaturizer(width)
+    columns = hasher.hash_codes(codes) % np.uint64(width)
+    _, counts = np.unique(columns, return_counts=True)
+    return counts[counts > 1].sum() / len(codes)
+
+
+def train_and_score(model, X_train, X_val, y_train, y_val):
+    start = time.perf_counter()
+    if model == "xgboost":
+        booster = xgb.train(
+            params={**BEST_PARAMS, **engine_params()},
+            dtrain=xgb.DMatrix(X_train, label=y_train),
+            num_boost_round=100,
+        )
+        y_pred = booster.predict(xgb.DMatrix(X_val))
+    else:
+        y_pred = LinearRegression().fit(X_train, y_train).predict(X_val)
+    elapsed = time.perf_counter() - start
+    return elapsed, mean_squared_error(y_val, y_pred, squared=False)
+
+
+def run(train_path, val_path, widths, model):
+    # Call the underlying function, no need for a Prefect flow run here
+    df_train = read_dataframe.fn(train_path)
+    df_val = read_dataframe.fn(val_path)
+    y_train = df_train["duration"].values
+    y_val = df_val["duration"].values
+    print(f"Train rows: {len(df_train)}, validation rows: {len(df_val)}, model: {model}")
+
+    modes = [("dict_vectorizer", None, None), ("vocabulary", None, RideFeaturizer())]
+    modes += [("hashing", width, HashingFeaturizer(width)) for width in widths]
+
+    header = f"{'mode':<16} {'width':>7} {'features':>9} {'featurize s':>12} {'collisions':>11}"
+    print(f"{header} {'train s':>8} {'rmse':>8} {'drmse':>8}")
+    base_rmse = None
+    for name, width, featurizer in modes:
+        start = time.perf_counter()
+        if featurizer is None:
+            X_train, X_val = dict_vectorizer_features(df_train, df_val)
+        else:
+            X_train, X_val = featurizer_features(featurizer, df_train, df_val)
+        featurize_time = time.perf_counter() - start
+
+        train_time, rmse = train_and_score(model, X_train, X_val, y_train, y_val)
+        if base_rmse is None:
+            base_rmse = rmse
+        collisions = f"{collision_rate(df_train, width):.1%}" if width else "-"
+        print(
+            f"{name:<16} {width or '-':>7} {X_train.shape[1]:>9} {featurize_time:>12.3f} "
+            f"{collisions:>11} {train_time:>8.2f} {rmse:>8.4f} {rmse - base_rmse:>+8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--train-path", default="../../data/green_tripdata_2021-01.parquet")
+    parser.add_argument("--val-path", default="../../data/green_tripdata_2021-02.parquet")
+    parser.add_argument(
+        "--widths", type=int, nargs="+", default=[1024, 4096, 16384, 65536, 262144]
+    )
+    parser.add_argument("--model", choices=["linear", "xgboost"], default="linear")
+    args = parser.parse_args()
+
+    run(args.train_path, args.val_path, args.widths, args.model)
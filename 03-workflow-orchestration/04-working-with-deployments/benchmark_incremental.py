@@ -0,0 +1,99 @@
+"""Incremental retraining against full retraining when a new month of data arrives.
+
+The previous model is trained on `--base` (January). When `--new` (February) arrives it is
+either retrained from scratch on both months, or its vocabulary is extended with the new PU_DO
+pairs and boosting continues on the new month only for `--rounds` rounds, as the flow does with
+`incremental=True`. Both are scored on `--val` (March), next to the previous model unchanged.
+Times include featurization and training.
+
+Usage:
+    python benchmark_incremental.py
+    python benchmark_incremental.py --rounds 10 20 50
+"""
+
+import argparse
+import copy
+import time
+
+import pandas as pd
+import xgboost as xgb
+from orchestrate_gs_final import (
+    BEST_PARAMS,
+    add_features,
+    engine_params,
+    read_dataframe,
+)
+from sklearn.metrics import mean_squared_error
+
+
+def train(X_train, y_train, X_val, y_val, num_boost_round, warm_start=None):
+    params = {**BEST_PARAMS, **engine_params()}
+    return xgb.train(
+        params=params,
+        dtrain=xgb.DMatrix(X_train, label=y_train),
+        num_boost_round=num_boost_round,
+        evals=[(xgb.DMatrix(X_val, label=y_val), "validation")],
+        early_stopping_rounds=20,
+        verbose_eval=False,
+        xgb_model=warm_start,
+    )
+
+
+def score(booster, featurizer, df_val):
+    X_val = featurizer.transform_frame(df_val)
+    y_pred = booster.predict(xgb.DMatrix(X_val))
+    return mean_squared_error(df_val["duration"].values, y_pred, squared=False)
+
+
+def run(base_path, new_path, val_path, rounds_list):
+    # Call the underlying functions, no need for a Prefect flow run here
+    df_base = read_dataframe.fn(base_path)
+    df_new = read_dataframe.fn(new_path)
+    df_val = read_dataframe.fn(val_path)
+
+    # The previously registered model, validated on the month after it as the flow does
+    X_base, X_next, y_base, y_next, featurizer = add_features.fn(df_base, df_new)
+    previous = train(X_base, y_base, X_next, y_next, 100)
+    print(f"Previous model: {previous.num_boosted_rounds()} rounds")
+
+    print(f"{'training':<22} {'rounds':>7} {'features':>9} {'time (s)':>9} {'rmse':>8}")
+    rmse = score(previous, featurizer, df_val)
+    print(f"{'previous model':<22} {'':>7} {featurizer.n_features:>9} {'':>9} {rmse:>8.3f}")
+
+    start = time.perf_counter()
+    df_all = pd.concat([df_base, df_new], ignore_index=True)
+    X_all, X_val, y_all, y_val, full_featurizer = add_features.fn(df_all, df_val)
+    full = train(X_all, y_all, X_val, y_val, 100)
+    elapsed = time.perf_counter() - start
+    rmse = score(full, full_featurizer, df_val)
+    print(
+        f"{'full retrain':<22} {full.num_boosted_rounds():>7} {full_featurizer.n_features:>9} "
+        f"{elapsed:>9.2f} {rmse:>8.3f}"
+    )
+
+    for rounds in rounds_list:
+        start = time.perf_counter()
+        extended = copy.deepcopy(featurizer)
+        X_new, X_val, y_new, y_val, extended = add_features.fn(
+            df_new, df_val, extended, extend=True
+        )
+        warm_start = previous.copy()
+        warm_start.set_param({"num_feature": extended.n_features})
+        booster = train(X_new, y_new, X_val, y_val, rounds, warm_start)
+        elapsed = time.perf_counter() - start
+        rmse = score(booster, extended, df_val)
+        print(
+            f"{'incremental':<22} {booster.num_boosted_rounds():>7} {extended.n_features:>9} "
+            f"{elapsed:>9.2f} {rmse:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default="../../data/green_tripdata_2021-01.parquet")
+    parser.add_argument("--new", default="../../data/green_tripdata_2021-02.parquet")
+    parser.add_argument("--val", default="../../data/green_tripdata_2021-03.parquet")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 20, 50])
+    args = parser.parse_args()
+
+    run(args.base, args.new, args.val, args.rounds)
@@ -0,0 +1,57 @@
+"""Core-scaling benchmark for the parallel featurization.
+
+Featurizes the given months with `transform_frame` at 1/2/4/8 processes and reports the time,
+rows/sec and speedup over one process, and checks that the result equals the serial matrix. The
+vocabulary is fitted once on the first file, as the training flow does.
+
+A green taxi month has fewer than 100k rides, so `--repeat` tiles the data to the size of a
+large month (yellow taxi months have several million rides).
+
+Usage:
+    python benchmark_parallel_features.py
+    python benchmark_parallel_features.py --jobs 1 2 4 8 16 --repeat 20 --mode hashing
+"""
+
+import argparse
+import glob
+import time
+
+import pandas as pd
+from features import make_featurizer
+
+COLUMNS = ["PULocationID", "DOLocationID", "trip_distance"]
+
+
+def run(pattern, repeat, jobs, mode):
+    files = sorted(glob.glob(pattern))
+    months = [pd.read_parquet(filename, columns=COLUMNS).dropna() for filename in files]
+    featurizer = make_featurizer(mode)
+    featurizer.fit(months[0]["PULocationID"], months[0]["DOLocationID"])
+
+    df = pd.concat(months * repeat, ignore_index=True)
+    print(f"{len(df)} rows from {len(files)} files x{repeat}, mode: {mode}")
+    print(f"{'jobs':>5} {'time (s)':>9} {'rows/s':>12} {'speedup':>8} {'equal':>6}")
+
+    expected, base_time = None, None
+    for n in jobs:
+        start = time.perf_counter()
+        X = featurizer.transform_frame(df, n_jobs=n)
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            expected, base_time = X, elapsed
+        equal = (X != expected).nnz == 0
+        print(
+            f"{n:>5} {elapsed:>9.3f} {len(df) / elapsed:>12,.0f} {base_time / elapsed:>7.2f}x "
+            f"{str(equal):>6}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="../../data/green_tripdata_*.parquet")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--mode", choices=["vocabulary", "hashing"], default="vocabulary")
+    args = parser.parse_args()
+
+    run(args.data, args.repeat, args.jobs, args.mode)
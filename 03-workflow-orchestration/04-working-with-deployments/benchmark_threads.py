@@ -0,0 +1,81 @@
+"""Core-scaling benchmark for the XGBoost training engine.
+
+Trains the best model with the `hist` tree method at 1/2/4/8 threads and reports training time,
+speedup and RMSE parity against the single-threaded run. The default `exact` tree method is
+trained once with all cores as a reference.
+
+Usage:
+    python benchmark_threads.py
+    python benchmark_threads.py --threads 1 2 4 8 16 --max-bin 128
+"""
+
+import argparse
+import os
+import time
+
+import xgboost as xgb
+from orchestrate_gs_final import (
+    BEST_PARAMS,
+    add_features,
+    engine_params,
+    read_dataframe,
+)
+from sklearn.metrics import mean_squared_error
+
+
+def train_and_score(train, valid, y_val, engine):
+    params = {**BEST_PARAMS, **engine}
+    start = time.perf_counter()
+    booster = xgb.train(
+        params=params,
+        dtrain=train,
+        num_boost_round=100,
+        evals=[(valid, "validation")],
+        early_stopping_rounds=20,
+        verbose_eval=False,
+    )
+    elapsed = time.perf_counter() - start
+    rmse = mean_squared_error(y_val, booster.predict(valid), squared=False)
+    return elapsed, rmse
+
+
+def run(train_path, val_path, threads, max_bin):
+    # Call the underlying functions, no need for a Prefect flow run here
+    df_train = read_dataframe.fn(train_path)
+    df_val = read_dataframe.fn(val_path)
+    X_train, X_val, y_train, y_val, _ = add_features.fn(df_train, df_val)
+
+    train = xgb.DMatrix(X_train, label=y_train)
+    valid = xgb.DMatrix(X_val, label=y_val)
+
+    print(f"Train rows: {X_train.shape[0]}, features: {X_train.shape[1]}")
+    print(f"{'engine':<10} {'threads':>7} {'time (s)':>9} {'speedup':>8} {'rmse':>8} {'Δrmse':>9}")
+
+    base_time, base_rmse = None, None
+    for n in threads:
+        engine = engine_params(tree_method="hist", nthread=n, max_bin=max_bin)
+        elapsed, rmse = train_and_score(train, valid, y_val, engine)
+        if base_time is None:
+            base_time, base_rmse = elapsed, rmse
+        print(
+            f"{'hist':<10} {n:>7} {elapsed:>9.2f} {base_time / elapsed:>7.2f}x "
+            f"{rmse:>8.4f} {rmse - base_rmse:>+9.4f}"
+        )
+
+    n = os.cpu_count()
+    elapsed, rmse = train_and_score(train, valid, y_val, engine_params("exact", nthread=n))
+    print(
+        f"{'exact':<10} {n:>7} {elapsed:>9.2f} {base_time / elapsed:>7.2f}x "
+        f"{rmse:>8.4f} {rmse - base_rmse:>+9.4f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--train-path", default="../../data/green_tripdata_2021-01.parquet")
+    parser.add_argument("--val-path", default="../../data/green_tripdata_2021-02.parquet")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-bin", type=int, default=256)
+    args = parser.parse_args()
+
+    run(args.train_path, args.val_path, args.threads, args.max_bin)
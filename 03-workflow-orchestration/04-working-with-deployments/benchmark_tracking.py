@@ -0,0 +1,85 @@
+"""Sweep throughput with synchronous MLflow logging and with `TrackingBatcher`.
+
+Simulates a hyperparameter sweep against a fresh SQLite tracking store: every run logs its
+params, a train and validation metric per boosting round, a final metric and two small
+artifacts. The rounds themselves take `--round-ms` of fake training time. Reports runs per second
+and the tracking overhead per run for both ways of logging.
+
+Usage:
+    python benchmark_tracking.py
+    python benchmark_tracking.py --runs 50 --rounds 200 --round-ms 1
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import mlflow
+from orchestrate_gs_final import BEST_PARAMS
+from tracking import TrackingBatcher
+
+
+def write_artifacts(directory, run_index):
+    paths = []
+    for name in ("preprocessor.txt", "report.md"):
+        path = os.path.join(directory, name)
+        with open(path, "w") as f_out:
+            f_out.write(f"run {run_index}\n")
+        paths.append(path)
+    return paths
+
+
+def sweep(runs, rounds, round_s, tracker_factory, artifact_dir):
+    start = time.perf_counter()
+    for i in range(runs):
+        with mlflow.start_run() as run:
+            tracker = tracker_factory(run.info.run_id)
+            params = {**BEST_PARAMS, "max_depth": random.randint(4, 100)}
+            tracker.log_params(params)
+            for step in range(rounds):
+                time.sleep(round_s)
+                tracker.log_metrics(
+                    {"train_rmse": 10 - step / rounds, "validation_rmse": 11 - step / rounds},
+                    step=step,
+                )
+            tracker.log_metric("rmse", random.uniform(6, 7))
+            for path in write_artifacts(artifact_dir, i):
+                tracker.log_artifact(path, artifact_path="artifacts")
+            if tracker is not mlflow:
+                tracker.close()
+    return time.perf_counter() - start
+
+
+def run(runs, rounds, round_ms):
+    round_s = round_ms / 1000
+    print(f"{runs} runs x {rounds} rounds, {round_ms} ms of training per round")
+    print(f"{'logging':<12} {'time (s)':>9} {'runs/s':>8} {'overhead/run (ms)':>18}")
+
+    training_s = rounds * round_s
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, factory in (
+            ("synchronous", lambda run_id: mlflow),
+            ("batched", lambda run_id: TrackingBatcher(run_id)),
+        ):
+            store = os.path.join(tmp_dir, f"{name}.db")
+            mlflow.set_tracking_uri(f"sqlite:///{store}")
+            # Keep the run artifacts out of ./mlruns of the lesson
+            experiment_id = mlflow.create_experiment(
+                f"benchmark-{name}", artifact_location=os.path.join(tmp_dir, f"{name}-artifacts")
+            )
+            mlflow.set_experiment(experiment_id=experiment_id)
+            elapsed = sweep(runs, rounds, round_s, factory, tmp_dir)
+            overhead_ms = (elapsed / runs - training_s) * 1000
+            print(f"{name:<12} {elapsed:>9.2f} {runs / elapsed:>8.2f} {overhead_ms:>18.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--round-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    run(args.runs, args.rounds, args.round_ms)
@@ -0,0 +1,165 @@
+"""Concurrency test for the local tracking store: N training flows logging at the same time.
+
+Starts `--flows` processes that run the tracking side of `train_best_model` against one SQLite
+store at the same moment: create a run, log the params, log a train and validation metric per
+boosting round, log the final RMSE, search the experiment for the best run and end the run.
+Every store call is timed, and calls that fail with "database is locked" are counted and
+retried. The rounds take `--round-ms` of fake training time.
+
+The test runs once against a plain `sqlite:///` store (rollback journal, driver defaults) and
+once against a store prepared by `tracking_store.setup_tracking`. The time of a store call above
+the uncontended one is spent waiting for the lock, so the p95 and max latencies show the lock
+waits, and the lock errors show the calls that gave up waiting.
+
+Usage:
+    python benchmark_tracking_store.py
+    python benchmark_tracking_store.py --flows 16 --runs 5 --rounds 100 --round-ms 2
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import mlflow
+import numpy as np
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+from orchestrate_gs_final import BEST_PARAMS
+from tracking_store import register_pragmas, setup_tracking
+
+EXPERIMENT = "store-benchmark"
+MAX_RETRIES = 20
+
+
+class TimedClient:
+    """Times every store call and retries the ones that hit a locked database."""
+
+    def __init__(self, client: MlflowClient):
+        self.client = client
+        self.latencies = []
+        self.lock_errors = 0
+
+    def call(self, method, *args, **kwargs):
+        for attempt in range(MAX_RETRIES):
+            start = time.perf_counter()
+            try:
+                result = getattr(self.client, method)(*args, **kwargs)
+            except Exception as e:
+                if "database is locked" not in str(e):
+                    raise
+                self.lock_errors += 1
+                time.sleep(0.05 * (attempt + 1))
+                continue
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+            return result
+        raise RuntimeError(f"{method} failed {MAX_RETRIES} times on a locked database")
+
+
+def training_flow(uri, tuned, runs, rounds, round_s, start_event, results):
+    if tuned:
+        register_pragmas()
+    mlflow.set_tracking_uri(uri)
+    client = TimedClient(MlflowClient())
+    experiment_id = client.call("get_experiment_by_name", EXPERIMENT).experiment_id
+    params = [Param(key, str(value)) for key, value in BEST_PARAMS.items()]
+
+    start_event.wait()
+    start = time.perf_counter()
+    for _ in range(runs):
+        run_id = client.call("create_run", experiment_id).info.run_id
+        client.call("log_batch", run_id, params=params)
+        for step in range(rounds):
+            time.sleep(round_s)
+            timestamp = int(time.time() * 1000)
+            metrics = [
+                Metric("train_rmse", 10 - step / rounds, timestamp, step),
+                Metric("validation_rmse", 11 - step / rounds, timestamp, step),
+            ]
+            client.call("log_batch", run_id, metrics=metrics)
+        client.call("log_metric", run_id, "rmse", float(np.random.uniform(6, 7)))
+        client.call("search_runs", [experiment_id], order_by=["metrics.rmse ASC"], max_results=5)
+        client.call("set_terminated", run_id)
+    results.put(
+        {
+            "seconds": time.perf_counter() - start,
+            "latencies": client.latencies,
+            "lock_errors": client.lock_errors,
+        }
+    )
+
+
+def run_store(name, uri, tuned, args):
+    mlflow.set_tracking_uri(uri)
+    MlflowClient().create_experiment(EXPERIMENT)
+
+    # Fresh interpreters, so every flow has its own engine like a separate Prefect run
+    context = multiprocessing.get_context("spawn")
+    start_event, results = context.Event(), context.Queue()
+    flows = [
+        context.Process(
+            target=training_flow,
+            args=(uri, tuned, args.runs, args.rounds, args.round_ms / 1000, start_event, results),
+        )
+        for _ in range(args.flows)
+    ]
+    for process in flows:
+        process.start()
+    time.sleep(args.warm_up)
+    start = time.perf_counter()
+    start_event.set()
+    reports = [results.get() for _ in flows]
+    elapsed = time.perf_counter() - start
+    for process in flows:
+        process.join()
+
+    latencies_ms = np.concatenate([report["latencies"] for report in reports]) * 1000
+    return {
+        "store": name,
+        "seconds": elapsed,
+        "calls": len(latencies_ms),
+        "lock_errors": sum(report["lock_errors"] for report in reports),
+        "p50_ms": np.percentile(latencies_ms, 50),
+        "p95_ms": np.percentile(latencies_ms, 95),
+        "max_ms": latencies_ms.max(),
+        "runs_per_s": args.flows * args.runs / elapsed,
+    }
+
+
+def run(args):
+    print(
+        f"{args.flows} parallel flows x {args.runs} runs x {args.rounds} rounds, "
+        f"{args.round_ms} ms of training per round"
+    )
+    print(
+        f"{'store':<8} {'time (s)':>9} {'runs/s':>7} {'calls':>7} {'locked':>7} "
+        f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}"
+    )
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Run artifacts go to ./mlruns of the temporary directory
+        os.chdir(tmp_dir)
+        plain_uri = f"sqlite:///{os.path.join(tmp_dir, 'plain.db')}"
+        for name, tuned in (("plain", False), ("tuned", True)):
+            uri = setup_tracking(os.path.join(tmp_dir, "tuned.db")) if tuned else plain_uri
+            result = run_store(name, uri, tuned, args)
+            print(
+                f"{name:<8} {result['seconds']:>9.2f} {result['runs_per_s']:>7.2f} "
+                f"{result['calls']:>7} {result['lock_errors']:>7} {result['p50_ms']:>9.1f} "
+                f"{result['p95_ms']:>9.1f} {result['max_ms']:>9.1f}"
+            )
+        os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flows", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--round-ms", type=float, default=0.0)
+    parser.add_argument("--warm-up", type=float, default=5.0, help="Seconds for the imports.")
+    args = parser.parse_args()
+
+    run(args)
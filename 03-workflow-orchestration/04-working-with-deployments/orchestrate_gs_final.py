@@ -1,68 +1,108 @@
+import os
 import pathlib
-import pickle
 from datetime import date
 
 import mlflow
 import numpy as np
 import pandas as pd
 import scipy
-import sklearn
 import xgboost as xgb
+from data_quality import read_checked
+from features import (
+    DEFAULT_HASH_WIDTH,
+    RideFeaturizer,
+    make_featurizer,
+)
+from mlflow.exceptions import MlflowException
+from mlflow.tracking import MlflowClient
+from model_bundle import load_bundle, save_bundle
 from prefect import flow, task
 from prefect.artifacts import create_markdown_artifact
 from prefect_gcp import GcsBucket
-from sklearn.feature_extraction import DictVectorizer
+from profiling import StageProfiler
 from sklearn.metrics import mean_squared_error
+from tracking import TrackingBatcher
+from tracking_store import setup_tracking
+
+BEST_PARAMS = {
+    "learning_rate": 0.09585355369315604,
+    "max_depth": 30,
+    "min_child_weight": 1.060597050922164,
+    "objective": "reg:squarederror",
+    "reg_alpha": 0.018060244040060163,
+    "reg_lambda": 0.011658731377413597,
+    "seed": 42,
+}
+
+MODEL_NAME = "nyc-taxi-xgboost"
+# Alias of the promoted version that incremental runs continue from
+CHAMPION_ALIAS = "champion"
+
+
+def engine_params(tree_method: str = "hist", nthread: int = None, max_bin: int = 256) -> dict:
+    """XGBoost training engine settings, `nthread` defaults to all available cores."""
+    params = {
+        "tree_method": tree_method,
+        "nthread": nthread or os.cpu_count(),
+    }
+    if tree_method in ("hist", "approx"):
+        params["max_bin"] = max_bin
+    return params
 
 
 @task(retries=3, retry_delay_seconds=2)
-def read_dataframe(filename):
+def read_dataframe(filename, quality_action: str = "fail"):
     """Read data into DataFrame."""
-    df = pd.read_parquet(filename)
+    # Validated and filtered in one pass, bad months fail before training, see data_quality.py
+    return read_checked(filename, action=quality_action)
 
-    # Calculate duration
-    df["duration"] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
 
-    # Filter between 1 min and 60 mins
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
-
-    return df
+@task
+def load_previous_model(model_name: str = MODEL_NAME, alias: str = CHAMPION_ALIAS):
+    """Featurizer, booster and version of the model under `alias`, None if there is none."""
+    try:
+        champion = MlflowClient().get_model_version_by_alias(model_name, alias)
+    except MlflowException:
+        return None
+    path = mlflow.artifacts.download_artifacts(
+        run_id=champion.run_id, artifact_path="bundle/model.bundle"
+    )
+    bundle = load_bundle(path, use_mmap=False)
+    return bundle.featurizer, bundle.model.booster, champion.version
 
 
 @task
 def add_features(
-    df_train: pd.DataFrame, df_val: pd.DataFrame
+    df_train: pd.DataFrame,
+    df_val: pd.DataFrame,
+    featurizer: RideFeaturizer = None,
+    n_jobs: int = 1,
+    extend: bool = False,
 ) -> tuple(
     [
         scipy.sparse._csr.csr_matrix,
         scipy.sparse._csr.csr_matrix,
         np.ndarray,
         np.ndarray,
-        sklearn.feature_extraction.DictVectorizer,
+        RideFeaturizer,
     ]
 ):
     """Add features to the model."""
-    df_train["PU_DO"] = df_train["PULocationID"] + "_" + df_train["DOLocationID"]
-    df_val["PU_DO"] = df_val["PULocationID"] + "_" + df_val["DOLocationID"]
-
-    categorical = ["PU_DO"]  #'PULocationID', 'DOLocationID']
-    numerical = ["trip_distance"]
-
-    dv = DictVectorizer()
-
-    train_dicts = df_train[categorical + numerical].to_dict(orient="records")
-    X_train = dv.fit_transform(train_dicts)
-
-    val_dicts = df_val[categorical + numerical].to_dict(orient="records")
-    X_val = dv.transform(val_dicts)
+    # PU_DO cross feature from the integer location IDs, see features.py
+    featurizer = featurizer or RideFeaturizer()
+    if extend:
+        # Keep the columns of the previous model, new pairs are added after them
+        featurizer.extend(df_train["PULocationID"], df_train["DOLocationID"])
+    else:
+        featurizer.fit(df_train["PULocationID"], df_train["DOLocationID"])
+
+    # With n_jobs > 1 large months are featurized in row chunks across a process pool
+    X_train = featurizer.transform_frame(df_train, n_jobs=n_jobs)
+    X_val = featurizer.transform_frame(df_val, n_jobs=n_jobs)
 
     y_train = df_train["duration"].values
     y_val = df_val["duration"].values
-    return X_train, X_val, y_train, y_val, dv
+    return X_train, X_val, y_train, y_val, featurizer
 
 
 @task(log_prints=True)
@@ -71,44 +111,86 @@ def train_best_model(
     X_val: scipy.sparse._csr.csr_matrix,
     y_train: np.ndarray,
     y_val: np.ndarray,
-    dv: sklearn.feature_extraction.DictVectorizer,
+    featurizer: RideFeaturizer,
+    profiler: StageProfiler,
+    engine: dict = None,
+    previous: tuple = None,
+    num_boost_round: int = 100,
+    model_name: str = MODEL_NAME,
+    promote: bool = False,
 ) -> None:
-    """Train a model with best hyperparams and write everything out."""
-
-    with mlflow.start_run():
-        train = xgb.DMatrix(X_train, label=y_train)
-        valid = xgb.DMatrix(X_val, label=y_val)
-
-        best_params = {
-            "learning_rate": 0.09585355369315604,
-            "max_depth": 30,
-            "min_child_weight": 1.060597050922164,
-            "objective": "reg:linear",
-            "reg_alpha": 0.018060244040060163,
-            "reg_lambda": 0.011658731377413597,
-            "seed": 42,
-        }
-
-        mlflow.log_params(best_params)
-
-        booster = xgb.train(
-            params=best_params,
-            dtrain=train,
-            num_boost_round=100,
-            evals=[(valid, "validation")],
-            early_stopping_rounds=20,
+    """Train a model with best hyperparams and write everything out.
+
+    With `previous` (a `(booster, version)` pair) boosting continues from that booster for
+    `num_boost_round` more rounds instead of starting from scratch.
+
+    Only with `promote` is the model registered and made the champion, the base of the next
+    incremental run. A warm-started model is only promoted if its RMSE on the validation month
+    is not worse than that of the model it started from.
+    """
+
+    # Params and metrics are sent in batches from a background thread, see tracking.py
+    with mlflow.start_run() as run, TrackingBatcher(run.info.run_id) as tracker:
+        with profiler.stage("dmatrix", rows=X_train.shape[0] + X_val.shape[0]):
+            train = xgb.DMatrix(X_train, label=y_train)
+            valid = xgb.DMatrix(X_val, label=y_val)
+
+        best_params = {**BEST_PARAMS, **(engine or engine_params())}
+
+        tracker.log_params(best_params)
+        tracker.log_params(
+            {"featurizer": type(featurizer).__name__, "n_features": X_train.shape[1]}
         )
 
+        warm_start, step_offset, previous_rmse = None, 0, None
+        if previous is not None:
+            warm_start, previous_version = previous
+            step_offset = warm_start.num_boosted_rounds()
+            tracker.log_params(
+                {
+                    "warm_start_version": previous_version,
+                    "new_features": X_train.shape[1] - warm_start.num_features(),
+                }
+            )
+            # The trees never split on the added columns, so the booster only needs widening
+            warm_start.set_param({"num_feature": X_train.shape[1]})
+            previous_rmse = mean_squared_error(y_val, warm_start.predict(valid), squared=False)
+            tracker.log_metric("previous_rmse", previous_rmse)
+
+        with profiler.stage("xgb_train", rows=X_train.shape[0]):
+            booster = xgb.train(
+                params=best_params,
+                dtrain=train,
+                num_boost_round=num_boost_round,
+                evals=[(valid, "validation")],
+                early_stopping_rounds=20,
+                callbacks=[tracker.xgb_callback(step_offset)],
+                xgb_model=warm_start,
+            )
+
         y_pred = booster.predict(valid)
         rmse = mean_squared_error(y_val, y_pred, squared=False)
-        mlflow.log_metric("rmse", rmse)
-
-        pathlib.Path("models").mkdir(exist_ok=True)
-        with open("models/preprocessor.b", "wb") as f_out:
-            pickle.dump(dv, f_out)
-        mlflow.log_artifact("models/preprocessor.b", artifact_path="preprocessor")
-
-        mlflow.xgboost.log_model(booster, artifact_path="models_mlflow")
+        tracker.log_metric("rmse", rmse)
+
+        with profiler.stage("log_artifacts"):
+            pathlib.Path("models").mkdir(exist_ok=True)
+            # Featurizer and booster in one file, see model_bundle.py
+            metadata = {"run_id": run.info.run_id, "rmse": float(rmse)}
+            save_bundle("models/model.bundle", featurizer, booster, metadata)
+            tracker.log_artifact("models/model.bundle", artifact_path="bundle")
+
+            mlflow.xgboost.log_model(booster, artifact_path="models_mlflow")
+            tracker.flush()
+
+        promoted = promote and (previous_rmse is None or rmse <= previous_rmse)
+        mlflow.set_tag("promoted", promoted)
+        if promoted:
+            # The next incremental run continues from this version
+            version = mlflow.register_model(f"runs:/{run.info.run_id}/models_mlflow", model_name)
+            MlflowClient().set_registered_model_alias(model_name, CHAMPION_ALIAS, version.version)
+            print(f"Promoted {model_name} version {version.version} to @{CHAMPION_ALIAS}")
+        elif promote:
+            print(f"Not promoted, RMSE {rmse:.3f} is worse than {previous_rmse:.3f}")
 
         # Artifact report
         markdown__rmse_report = f"""# RMSE Report
@@ -126,6 +208,11 @@ def train_best_model(
 
         create_markdown_artifact(key="duration-model-report", markdown=markdown__rmse_report)
 
+        # Profiling report
+        profiler.log_to_mlflow(tracker)
+        create_markdown_artifact(key="training-profile-report", markdown=profiler.to_markdown())
+        print(profiler.to_markdown())
+
     return None
 
 
@@ -133,24 +220,68 @@ def train_best_model(
 def main_flow_gcs(
     train_path: str = "../../data/green_tripdata_2021-01.parquet",
     val_path: str = "../../data/green_tripdata_2021-02.parquet",
+    tree_method: str = "hist",
+    nthread: int = None,
+    max_bin: int = 256,
+    feature_mode: str = "vocabulary",
+    hash_width: int = DEFAULT_HASH_WIDTH,
+    feature_jobs: int = 1,
+    incremental: bool = False,
+    incremental_rounds: int = 20,
+    quality_action: str = "fail",
+    promote: bool = False,
 ) -> None:
-    """The main training pipeline."""
+    """The main training pipeline.
 
-    # Mlflow settings
-    mlflow.set_tracking_uri("sqlite:///mlflow.db")
+    With `incremental=True` the `@champion` version of the registered model continues training
+    on `train_path` (the new month) for `incremental_rounds` rounds, instead of training from
+    scratch. Runs are only registered, and become the champion, with `promote=True`.
+    """
+
+    # Mlflow settings, a WAL-mode SQLite store shared by parallel runs (see tracking_store.py)
+    mlflow.set_tracking_uri(setup_tracking("mlflow.db"))
     mlflow.set_experiment("nyc-taxi-experiment")
 
     # Load data from GCS
     gcs_bucket = GcsBucket.load("orchestration-bucket-1")
     gcs_bucket.download_folder_to_path(from_folder="data/", to_folder="../../data/")
-    df_train = read_dataframe(train_path)
-    df_val = read_dataframe(val_path)
+    profiler = StageProfiler()
+    with profiler.stage("read_dataframe") as stage:
+        df_train = read_dataframe(train_path, quality_action)
+        df_val = read_dataframe(val_path, quality_action)
+        stage["rows"] = len(df_train) + len(df_val)
+
+    previous, num_boost_round = None, 100
+    if incremental:
+        loaded = load_previous_model(MODEL_NAME)
+        if loaded is None:
+            print(f"No {MODEL_NAME}@{CHAMPION_ALIAS} model yet, training from scratch")
+        else:
+            featurizer, booster, version = loaded
+            previous, num_boost_round = (booster, version), incremental_rounds
 
     # Transform
-    X_train, X_val, y_train, y_val, dv = add_features(df_train, df_val)
+    with profiler.stage("add_features", rows=len(df_train) + len(df_val)):
+        if previous is None:
+            featurizer = make_featurizer(feature_mode, hash_width)
+        X_train, X_val, y_train, y_val, featurizer = add_features(
+            df_train, df_val, featurizer, n_jobs=feature_jobs, extend=previous is not None
+        )
 
     # Train
-    train_best_model(X_train, X_val, y_train, y_val, dv)
+    engine = engine_params(tree_method=tree_method, nthread=nthread, max_bin=max_bin)
+    train_best_model(
+        X_train,
+        X_val,
+        y_train,
+        y_val,
+        featurizer,
+        profiler,
+        engine,
+        previous=previous,
+        num_boost_round=num_boost_round,
+        promote=promote,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+"""Stage-level profiling for the training pipeline.
+
+Records wall time, CPU time, peak RSS and rows/sec for each stage of a flow run, so the numbers
+can be logged to MLflow and published as a Prefect markdown artifact.
+
+The operating system only keeps the peak RSS of the whole process so far, never of a stage. So
+each stage reports that process peak when it ends (`process_peak_rss_mb`) and how much the stage
+raised it (`peak_rss_growth_mb`). A stage with no growth stayed below the peak of an earlier one,
+which does not mean it allocated nothing.
+"""
+
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import mlflow
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process since it started, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / 1024**2
+    return peak / 1024
+
+
+class StageProfiler:
+    """Collect timings for named pipeline stages.
+
+    Usage:
+        profiler = StageProfiler()
+        with profiler.stage("read_dataframe") as stage:
+            df = read_dataframe(path)
+            stage["rows"] = len(df)
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        record = {"rows": rows}
+        peak_start = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            rows = record["rows"]
+            peak = peak_rss_mb()
+            self.stages[name] = {
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "process_peak_rss_mb": peak,
+                "peak_rss_growth_mb": peak - peak_start,
+                "rows": rows,
+                "rows_per_s": rows / wall if rows and wall > 0 else None,
+            }
+
+    def as_metrics(self):
+        """Flatten the stage records into `{stage}_{measure}` MLflow metric names."""
+        metrics = {}
+        for name, record in self.stages.items():
+            for measure in (
+                "wall_s",
+                "cpu_s",
+                "process_peak_rss_mb",
+                "peak_rss_growth_mb",
+                "rows_per_s",
+            ):
+                if record[measure] is not None:
+                    metrics[f"profile_{name}_{measure}"] = record[measure]
+        metrics["profile_total_wall_s"] = sum(r["wall_s"] for r in self.stages.values())
+        return metrics
+
+    def log_to_mlflow(self, tracker=None):
+        """Log all stage measurements to the active MLflow run, or through a `TrackingBatcher`."""
+        (tracker or mlflow).log_metrics(self.as_metrics())
+
+    def to_markdown(self):
+        """Render the stage measurements as a markdown table."""
+        lines = [
+            "# Training Pipeline Profile",
+            "",
+            f"Run date: {date.today()}",
+            "",
+            "| Stage | Wall (s) | CPU (s) | Process peak RSS (MB) | Peak RSS growth (MB) "
+            "| Rows | Rows/s |",
+            "|:------|---------:|--------:|----------------------:|---------------------:"
+            "|-----:|-------:|",
+        ]
+        for name, record in self.stages.items():
+            rows = record["rows"] if record["rows"] is not None else "-"
+            rows_per_s = f"{record['rows_per_s']:,.0f}" if record["rows_per_s"] else "-"
+            lines.append(
+                f"| {name} | {record['wall_s']:.2f} | {record['cpu_s']:.2f} "
+                f"| {record['process_peak_rss_mb']:.0f} | {record['peak_rss_growth_mb']:.0f} "
+                f"| {rows} | {rows_per_s} |"
+            )
+        return "\n".join(lines)
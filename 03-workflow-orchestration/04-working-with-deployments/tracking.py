@@ -0,0 +1,187 @@
+"""Asynchronous, batched MLflow logging for the training flows.
+
+`TrackingBatcher` has the `log_param(s)`, `log_metric(s)` and `log_artifact` calls of the
+`mlflow` module, but only buffers them in memory. A background thread sends the buffer with one
+`MlflowClient.log_batch` call per interval (or when `max_pending` entries are waiting), so a
+sweep that logs a validation metric per boosting round makes a handful of store writes per run
+instead of one per value. Artifacts are coalesced: every file queued for the same artifact path
+is uploaded in a single `log_artifacts` call when the batcher is flushed or closed.
+
+    with mlflow.start_run() as run, TrackingBatcher(run.info.run_id) as tracker:
+        tracker.log_params(params)
+        booster = xgb.train(..., callbacks=[tracker.xgb_callback()])
+        tracker.log_metric("rmse", rmse)
+
+Leaving the `with` block flushes everything, and errors of the background thread are raised
+there (or on `flush()`).
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import xgboost as xgb
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+
+# Limits of a single log_batch request of the MLflow REST API
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+
+
+class TrackingBatcher:
+    def __init__(
+        self,
+        run_id: str,
+        client: MlflowClient = None,
+        flush_interval: float = 1.0,
+        max_pending: int = MAX_METRICS_PER_BATCH,
+    ):
+        self.run_id = run_id
+        self.client = client or MlflowClient()
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._params = {}
+        self._metrics = []
+        self._artifacts = {}  # artifact path -> {file name: local path}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self._in_flight = False
+        self._closed = False
+        self._error = None
+        self.batches_sent = 0
+        self._thread = threading.Thread(target=self._run, name="mlflow-batcher", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Same calls as the mlflow module
+
+    def log_param(self, key, value):
+        self.log_params({key: value})
+
+    def log_params(self, params: dict):
+        with self._lock:
+            # A param can only be logged once per run, the last value wins
+            self._params.update({key: str(value) for key, value in params.items()})
+        self._wake.set()
+
+    def log_metric(self, key, value, step: int = None):
+        self.log_metrics({key: value}, step)
+
+    def log_metrics(self, metrics: dict, step: int = None):
+        timestamp = int(time.time() * 1000)
+        step = step or 0
+        entries = [Metric(key, float(value), timestamp, step) for key, value in metrics.items()]
+        with self._lock:
+            self._metrics.extend(entries)
+            full = len(self._metrics) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def log_artifact(self, local_path: str, artifact_path: str = None):
+        """Queue a file for upload, a later file with the same name replaces it."""
+        with self._lock:
+            files = self._artifacts.setdefault(artifact_path, {})
+            files[os.path.basename(local_path)] = os.path.abspath(local_path)
+
+    def xgb_callback(self, step_offset: int = 0):
+        """XGBoost callback logging every evaluation metric after each boosting round."""
+        return _EvaluationLogger(self, step_offset)
+
+    # Background thread
+
+    def _take(self):
+        with self._lock:
+            params, metrics = self._params, self._metrics
+            self._params, self._metrics = {}, []
+            self._in_flight = bool(params or metrics)
+        return params, metrics
+
+    def _send(self, params, metrics):
+        params = [Param(key, value) for key, value in params.items()]
+        while params or metrics:
+            batch_params, params = params[:MAX_PARAMS_PER_BATCH], params[MAX_PARAMS_PER_BATCH:]
+            batch_metrics = metrics[: MAX_METRICS_PER_BATCH - len(batch_params)]
+            metrics = metrics[len(batch_metrics) :]
+            self.client.log_batch(self.run_id, metrics=batch_metrics, params=batch_params)
+            self.batches_sent += 1
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            params, metrics = self._take()
+            try:
+                self._send(params, metrics)
+            except Exception as e:
+                # Raised to the training code on the next flush() or close()
+                self._error = e
+            with self._lock:
+                self._in_flight = False
+                self._idle.notify_all()
+                if self._closed and not (self._params or self._metrics):
+                    return
+
+    def _upload_artifacts(self):
+        with self._lock:
+            artifacts, self._artifacts = self._artifacts, {}
+        for artifact_path, files in artifacts.items():
+            if len(files) == 1:
+                (local_path,) = files.values()
+                self.client.log_artifact(self.run_id, local_path, artifact_path)
+                continue
+            # One upload of a directory instead of one per file
+            with tempfile.TemporaryDirectory() as staging:
+                for name, local_path in files.items():
+                    shutil.copy(local_path, os.path.join(staging, name))
+                self.client.log_artifacts(self.run_id, staging, artifact_path)
+
+    def flush(self, timeout: float = None):
+        """Send everything buffered so far and upload the queued artifacts."""
+        self._wake.set()
+        with self._lock:
+            self._idle.wait_for(
+                lambda: not (self._params or self._metrics or self._in_flight), timeout
+            )
+        self._raise_error()
+        self._upload_artifacts()
+
+    def close(self):
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._raise_error()
+        self._upload_artifacts()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Logging to MLflow failed") from error
+
+
+class _EvaluationLogger(xgb.callback.TrainingCallback):
+    def __init__(self, tracker: TrackingBatcher, step_offset: int):
+        super().__init__()
+        self.tracker = tracker
+        self.step_offset = step_offset
+
+    def after_iteration(self, model, epoch, evals_log):
+        metrics = {
+            f"{data}_{metric}": history[-1]
+            for data, data_log in evals_log.items()
+            for metric, history in data_log.items()
+        }
+        self.tracker.log_metrics(metrics, step=self.step_offset + epoch)
+        return False
@@ -0,0 +1,122 @@
+"""Local SQLite tracking store for MLflow, set up for parallel training flows.
+
+A plain `sqlite:///mlflow.db` store uses SQLite's rollback journal: a writer locks the whole
+file, readers wait for it, and a connection gives up with "database is locked" after 5 seconds.
+With several Prefect flow runs logging at once, that is what fails. `setup_tracking` prepares the
+store once and returns the URI to pass to `mlflow.set_tracking_uri`:
+
+- WAL journal mode, so run searches and the UI read while a flow writes. Writers still take
+  turns, but wait on the busy timeout (`BUSY_TIMEOUT_S`) instead of failing.
+- `synchronous=NORMAL` on every connection, which is safe with WAL and syncs only at checkpoints.
+- Indexes for the lookups the flows and the UI make: metric history of a run and key, runs of
+  an experiment by start time, and runs by tag value.
+- A bounded SQLAlchemy connection pool per process (`POOL_SIZE`, `MAX_OVERFLOW`).
+- The schema is created before the flows start, instead of by whichever run connects first.
+
+    mlflow.set_tracking_uri(setup_tracking("mlflow.db"))
+
+An existing store (for example `04-deployment/web-service-mlflow/mfllow.db`) is upgraded in
+place with:
+
+    python tracking_store.py mlflow.db
+"""
+
+import argparse
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUSY_TIMEOUT_S = 60
+POOL_SIZE = 4
+MAX_OVERFLOW = 4
+
+# Name -> indexed columns. MLflow itself only indexes run_uuid on these tables.
+INDEXES = {
+    "index_metrics_run_uuid_key_step": "metrics (run_uuid, key, step)",
+    "index_runs_experiment_id_start_time": "runs (experiment_id, lifecycle_stage, start_time)",
+    "index_tags_key_value": "tags (key, value)",
+}
+
+_pragmas_registered = False
+
+
+def tracking_uri(db_path: str) -> str:
+    """SQLAlchemy URI of the store, with the busy timeout of the sqlite3 driver."""
+    return f"sqlite:///{os.path.abspath(db_path)}?timeout={BUSY_TIMEOUT_S}"
+
+
+def _set_connection_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+def register_pragmas():
+    """Apply the per-connection settings to every SQLite engine of this process."""
+    global _pragmas_registered
+    if not _pragmas_registered:
+        event.listen(Engine, "connect", _set_connection_pragmas)
+        _pragmas_registered = True
+
+
+def configure_pool(pool_size: int = POOL_SIZE, max_overflow: int = MAX_OVERFLOW):
+    """Pool settings MLflow reads when it creates the engine, explicit ones are kept."""
+    os.environ.setdefault("MLFLOW_SQLALCHEMYSTORE_POOL_SIZE", str(pool_size))
+    os.environ.setdefault("MLFLOW_SQLALCHEMYSTORE_MAX_OVERFLOW", str(max_overflow))
+
+
+def create_schema(db_path: str, artifact_root: str = "./mlruns"):
+    """Create the MLflow tables of a new store, older schemas need `mlflow db upgrade`."""
+    from mlflow.store.tracking.sqlalchemy_store import SqlAlchemyStore
+
+    SqlAlchemyStore(tracking_uri(db_path), artifact_root)
+
+
+def prepare_store(db_path: str, artifact_root: str = "./mlruns") -> dict:
+    """Create the schema, switch the store to WAL and add the indexes. Safe to run again."""
+    create_schema(db_path, artifact_root)
+    with sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_S) as connection:
+        # The journal mode is stored in the database file, unlike the other pragmas
+        (journal_mode,) = connection.execute("PRAGMA journal_mode=WAL").fetchone()
+        for name, columns in INDEXES.items():
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+        connection.execute("ANALYZE")
+    connection.close()
+    return {"journal_mode": journal_mode, "indexes": list(INDEXES)}
+
+
+def setup_tracking(db_path: str = "mlflow.db", artifact_root: str = "./mlruns") -> str:
+    """Prepare the store and configure this process for it, returns the tracking URI."""
+    register_pragmas()
+    configure_pool()
+    prepare_store(db_path, artifact_root)
+    return tracking_uri(db_path)
+
+
+def describe(db_path: str) -> dict:
+    with sqlite3.connect(db_path) as connection:
+        (journal_mode,) = connection.execute("PRAGMA journal_mode").fetchone()
+        indexes = [
+            name
+            for (name,) in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+            )
+        ]
+    connection.close()
+    return {"journal_mode": journal_mode, "indexes": sorted(indexes)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("db_path", nargs="?", default="mlflow.db")
+    parser.add_argument("--artifact-root", default="./mlruns")
+    args = parser.parse_args()
+
+    prepare_store(args.db_path, args.artifact_root)
+    info = describe(args.db_path)
+    print(f"{args.db_path}: journal_mode={info['journal_mode']}")
+    for name in info["indexes"]:
+        print(f"  {name}")
@@ -0,0 +1,84 @@
+"""Size/time benchmark of the batch scoring output stage.
+
+Compares the previous output stage with the Arrow output stage in `make_result_table` on a
+monthly trip file. The previous stage assigns columns one by one into an empty DataFrame and
+repeats the run ID on every row. Predictions are synthetic because the output cost does not
+depend on the model.
+
+Usage:
+    python benchmark_output.py
+    python benchmark_output.py --input ../../data/green_tripdata_2021-03.parquet
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from score_scheduled import make_result_table, read_dataframe
+
+RUN_ID = "553def03f5224f649fe56bc1567daccc"
+
+
+def pandas_output(df, y_pred, run_id):
+    df_result = pd.DataFrame()
+    df_result["ride_id"] = df["ride_id"]
+    df_result["lpep_pickup_datetime"] = df["lpep_pickup_datetime"]
+    df_result["PULocationID"] = df["PULocationID"]
+    df_result["DOLocationID"] = df["DOLocationID"]
+    df_result["actual_duration"] = df["duration"]
+    df_result["predicted_duration"] = y_pred
+    df_result["diff"] = df_result["actual_duration"] - df_result["predicted_duration"]
+    df_result["model_version"] = run_id
+    return df_result
+
+
+def timed(fn, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(input_file, repeat):
+    df = read_dataframe(input_file)
+    rng = np.random.default_rng(42)
+    y_pred = df["duration"].to_numpy() + rng.normal(0, 5, len(df))
+    print(f"Rows: {len(df)}")
+
+    build_pd, df_result = timed(lambda: pandas_output(df, y_pred, RUN_ID), repeat)
+    build_pa, table = timed(lambda: make_result_table(df, y_pred, RUN_ID), repeat)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pd_path = os.path.join(tmp_dir, "pandas.parquet")
+        pa_path = os.path.join(tmp_dir, "arrow.parquet")
+        write_pd, _ = timed(lambda: df_result.to_parquet(pd_path, index=False), repeat)
+        write_pa, _ = timed(lambda: pq.write_table(table, pa_path), repeat)
+        size_pd = os.path.getsize(pd_path)
+        size_pa = os.path.getsize(pa_path)
+
+    mem_pd = df_result.memory_usage(deep=True).sum()
+    mem_pa = table.nbytes
+
+    print(f"{'':<16} {'pandas':>12} {'arrow':>12} {'ratio':>7}")
+    for name, old, new in [
+        ("build (ms)", build_pd * 1000, build_pa * 1000),
+        ("write (ms)", write_pd * 1000, write_pa * 1000),
+        ("memory (MB)", mem_pd / 1024**2, mem_pa / 1024**2),
+        ("parquet (MB)", size_pd / 1024**2, size_pa / 1024**2),
+    ]:
+        print(f"{name:<16} {old:>12.2f} {new:>12.2f} {old / new:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", default="../../data/green_tripdata_2021-02.parquet")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run(args.input, args.repeat)
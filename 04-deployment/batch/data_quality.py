@@ -0,0 +1,213 @@
+# Generated from shared/data_quality.py by shared/sync.py, edit that file instead.
+"""Data-quality gate for the trip data, run when a month is loaded for training or scoring.
+
+`check_table` validates the Arrow columns of a parquet file in one vectorized pass, before the
+data reaches pandas and the expensive steps:
+
+- null counts of the columns the models use
+- trip duration outside 1-60 minutes (the rows `read_dataframe` used to drop silently)
+- trip distance outside 0-100 miles
+- location IDs outside the known taxi zones
+- with a fitted vocabulary, the share of PU_DO pairs the model has not seen
+
+Rows failing a check are dropped, and a batch where the share of failing rows is above the
+limit of a check (`MAX_RATES`) is rejected: `read_checked` raises `DataQualityError`, and with
+`action="quarantine"` first writes the batch and its report to the quarantine directory.
+
+    df = read_checked("data/green_tripdata_2021-01.parquet", action="quarantine")
+"""
+
+import json
+import os
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from features import CROSS_BASE, cross_codes
+from pyarrow import fs as pafs
+
+REQUIRED_COLUMNS = (
+    "lpep_pickup_datetime",
+    "lpep_dropoff_datetime",
+    "PULocationID",
+    "DOLocationID",
+    "trip_distance",
+)
+DURATION_RANGE = (1, 60)  # minutes, the rides the models are trained for
+DISTANCE_RANGE = (0, 100)  # miles
+ZONE_RANGE = (1, 265)  # taxi zone IDs, 264 and 265 are the unknown zones
+
+# Largest share of rows a check may reject before the whole batch is rejected. About 5% of the
+# rides of a month fall outside the duration range.
+MAX_RATES = {
+    "nulls": 0.01,
+    "duration": 0.10,
+    "trip_distance": 0.01,
+    "unknown_zone": 0.01,
+    "unseen_pair": 0.10,
+}
+
+QUARANTINE_DIR = "quarantine"
+
+
+class DataQualityError(ValueError):
+    def __init__(self, message, report=None, quarantine_path=None):
+        super().__init__(message)
+        self.report = report
+        self.quarantine_path = quarantine_path
+
+
+class QualityReport:
+    def __init__(self, rows, null_counts, violations, max_rates, valid, trip_time):
+        self.rows = rows
+        self.null_counts = null_counts
+        self.violations = violations
+        self.max_rates = max_rates
+        self.valid = valid  # row mask of the rows passing every check
+        self.trip_time = trip_time  # dropoff - pickup as timedelta64
+
+    @property
+    def rates(self) -> dict:
+        rows = max(self.rows, 1)
+        return {check: count / rows for check, count in self.violations.items()}
+
+    @property
+    def failures(self) -> list:
+        return [check for check, rate in self.rates.items() if rate > self.max_rates[check]]
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+    def to_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "valid_rows": int(np.count_nonzero(self.valid)),
+            "null_counts": self.null_counts,
+            "violations": self.violations,
+            "rates": self.rates,
+            "max_rates": self.max_rates,
+            "failures": self.failures,
+        }
+
+    def summary(self) -> str:
+        rates = ", ".join(f"{check} {rate:.2%}" for check, rate in self.rates.items())
+        status = "passed" if self.passed else f"failed on {', '.join(self.failures)}"
+        return f"{self.rows} rows, {np.count_nonzero(self.valid)} valid ({rates}): {status}"
+
+
+def _outside(values, bounds) -> np.ndarray:
+    low, high = bounds
+    # NaN and NaT compare False on both sides, so they count as outside
+    return ~((values >= low) & (values <= high))
+
+
+def check_table(table: pa.Table, known_pairs=None, max_rates: dict = None) -> QualityReport:
+    """Run every check over the columns of `table`.
+
+    `known_pairs` is the sorted PU_DO code vocabulary of the model, unseen pairs are counted
+    but kept, since the model ignores them.
+    """
+    max_rates = {**MAX_RATES, **(max_rates or {})}
+    missing = [name for name in REQUIRED_COLUMNS if name not in table.column_names]
+    if missing:
+        raise DataQualityError(f"The data has no {missing} columns")
+
+    rows = table.num_rows
+    valid = np.ones(rows, dtype=bool)
+    null_counts = {}
+    for name in REQUIRED_COLUMNS:
+        column = table.column(name)
+        null_counts[name] = column.null_count
+        if column.null_count:
+            valid &= column.is_valid().to_numpy(zero_copy_only=False)
+    violations = {"nulls": rows - int(np.count_nonzero(valid))}
+    not_null = valid.copy()
+
+    # Nulls become NaT and NaN here, which the mask above already covers
+    pickup = table.column("lpep_pickup_datetime").to_numpy()
+    dropoff = table.column("lpep_dropoff_datetime").to_numpy()
+    trip_time = dropoff - pickup
+    minute = np.timedelta64(1, "m")
+    pu = table.column("PULocationID").to_numpy()
+    do = table.column("DOLocationID").to_numpy()
+
+    checks = {
+        "duration": _outside(trip_time, (DURATION_RANGE[0] * minute, DURATION_RANGE[1] * minute)),
+        "trip_distance": _outside(table.column("trip_distance").to_numpy(), DISTANCE_RANGE),
+        "unknown_zone": _outside(pu, ZONE_RANGE) | _outside(do, ZONE_RANGE),
+    }
+    for check, failed in checks.items():
+        violations[check] = int(np.count_nonzero(failed & not_null))
+        valid &= ~failed
+
+    if known_pairs is not None and len(known_pairs):
+        # A lookup table over every possible code, much faster than searching the vocabulary
+        high = ZONE_RANGE[1]
+        known = np.zeros(high * CROSS_BASE + high + 1, dtype=bool)
+        known[known_pairs[known_pairs < len(known)]] = True
+        if violations["nulls"]:
+            pu, do = np.nan_to_num(pu), np.nan_to_num(do)
+        codes = cross_codes(pu, do)
+        codes[~valid] = 0
+        violations["unseen_pair"] = int(np.count_nonzero(valid & ~known[codes]))
+
+    return QualityReport(rows, null_counts, violations, max_rates, valid, trip_time)
+
+
+def quarantine(table: pa.Table, report: QualityReport, name: str, quarantine_dir: str) -> str:
+    """Write the rejected batch and its report to `quarantine_dir`, return the batch path."""
+    if "://" in quarantine_dir:
+        filesystem, directory = pafs.FileSystem.from_uri(quarantine_dir)
+    else:
+        filesystem, directory = pafs.LocalFileSystem(), os.path.abspath(quarantine_dir)
+    filesystem.create_dir(directory, recursive=True)
+
+    path = f"{directory}/{name}.parquet"
+    pq.write_table(table, path, filesystem=filesystem)
+    with filesystem.open_output_stream(f"{directory}/{name}.json") as f_out:
+        f_out.write(json.dumps(report.to_dict(), indent=2).encode("utf-8"))
+    return path
+
+
+def read_table(filename: str) -> pa.Table:
+    """Read a local, `gs://` or `s3://` parquet file, or download it over HTTP."""
+    if filename.startswith(("http://", "https://")):
+        with urllib.request.urlopen(filename) as response:
+            return pq.read_table(pa.BufferReader(response.read()))
+    return pq.read_table(filename)
+
+
+def read_checked(
+    filename: str,
+    action: str = "fail",
+    quarantine_dir: str = QUARANTINE_DIR,
+    known_pairs=None,
+    max_rates: dict = None,
+) -> pd.DataFrame:
+    """Read a month of trips through the gate, with the valid rows and a `duration` column.
+
+    A rejected batch raises `DataQualityError`, with `action="quarantine"` it is written to
+    `quarantine_dir` first.
+    """
+    if action not in ("fail", "quarantine"):
+        raise ValueError(f"Unknown data-quality action {action!r}")
+
+    table = read_table(filename)
+    report = check_table(table, known_pairs, max_rates)
+    print(f"Data quality of {filename}: {report.summary()}")
+
+    if not report.passed:
+        path = None
+        if action == "quarantine":
+            name = os.path.splitext(os.path.basename(filename))[0]
+            path = quarantine(table, report, name, quarantine_dir)
+        raise DataQualityError(
+            f"{filename} failed the data-quality checks {report.failures}", report, path
+        )
+
+    df = table.filter(report.valid).to_pandas()
+    df["duration"] = report.trip_time[report.valid] / np.timedelta64(1, "m")
+    return df
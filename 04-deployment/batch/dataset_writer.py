@@ -0,0 +1,327 @@
+"""Partitioned parquet dataset writer for the batch scoring output.
+
+Every partition (`taxi_type=.../year=.../month=...`) keeps a `_manifest.json` that lists its
+files together with the model version, row counts and the pickup-time range of every row group.
+Readers use the manifest to open only the row groups they need, and `compact` merges the small
+files that pile up from appended writes into one sorted file per model version.
+
+Writers update the manifest with a compare-and-swap: the change is published only if nobody
+else published a manifest since it was read, otherwise it is applied again to the new manifest.
+On GCS this is an upload with `if_generation_match`, on a local disk a generation counter in
+the manifest, compared and replaced under a lock. Other filesystems have no conditional write,
+so a partition there must have a single writer at a time.
+
+Usage:
+    python dataset_writer.py compact gs://taxi-ride-prediction/output
+    python dataset_writer.py compact output/ --taxi-type green --year 2021 --month 2
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs as pafs
+
+MANIFEST = "_manifest.json"
+SORT_COLUMN = "lpep_pickup_datetime"
+# A green taxi month has ~80k rows, so a row group holds about three days of rides
+ROW_GROUP_SIZE = 8192
+# Files are rolled over once they hold this many rows
+MAX_ROWS_PER_FILE = 1_000_000
+# Attempts to publish a manifest before giving up on concurrent writers
+MANIFEST_RETRIES = 5
+
+
+class ManifestConflict(Exception):
+    """The manifest kept changing while a writer tried to publish its own."""
+
+
+def get_filesystem(uri: str):
+    """Return `(filesystem, path)` for a local path or a `gs://`, `s3://` URI."""
+    if "://" in uri:
+        return pafs.FileSystem.from_uri(uri)
+    return pafs.LocalFileSystem(), os.path.abspath(uri)
+
+
+def partition_path(root: str, taxi_type: str, year: int, month: int) -> str:
+    return f"{root.rstrip('/')}/taxi_type={taxi_type}/year={year:04d}/month={month:02d}"
+
+
+def _empty_manifest() -> dict:
+    return {"sort_column": SORT_COLUMN, "generation": 0, "files": []}
+
+
+def _gcs_manifest(path: str):
+    """Return the bucket and the object name of the manifest of a GCS partition."""
+    from google.cloud import storage
+
+    bucket, prefix = path.split("/", 1)
+    return storage.Client().bucket(bucket), f"{prefix}/{MANIFEST}"
+
+
+def _read_versioned(filesystem, path: str):
+    """Return the manifest and the generation a conditional write has to match."""
+    if filesystem.type_name == "gcs":
+        bucket, name = _gcs_manifest(path)
+        blob = bucket.get_blob(name)
+        if blob is None:
+            return _empty_manifest(), 0
+        data = blob.download_as_bytes(if_generation_match=blob.generation)
+        return json.loads(data), blob.generation
+
+    manifest_path = f"{path}/{MANIFEST}"
+    if filesystem.get_file_info(manifest_path).type == pafs.FileType.NotFound:
+        return _empty_manifest(), 0
+    with filesystem.open_input_stream(manifest_path) as f_in:
+        manifest = json.loads(f_in.read())
+    return manifest, manifest.get("generation", 0)
+
+
+def read_manifest(filesystem, path: str) -> dict:
+    return _read_versioned(filesystem, path)[0]
+
+
+def _write(filesystem, path: str, manifest: dict) -> None:
+    # Write to a temporary file first so readers never see a half-written manifest
+    tmp_path = f"{path}/{MANIFEST}.{uuid.uuid4().hex[:8]}.tmp"
+    with filesystem.open_output_stream(tmp_path) as f_out:
+        f_out.write(json.dumps(manifest, indent=2).encode("utf-8"))
+    filesystem.move(tmp_path, f"{path}/{MANIFEST}")
+
+
+def _publish(filesystem, path: str, manifest: dict, generation: int) -> bool:
+    """Write `manifest` if the published one is still at `generation`, return whether it was."""
+    if filesystem.type_name == "gcs":
+        from google.api_core.exceptions import PreconditionFailed
+
+        bucket, name = _gcs_manifest(path)
+        data = json.dumps(manifest, indent=2)
+        try:
+            # A generation of 0 only matches when there is no manifest yet
+            bucket.blob(name).upload_from_string(
+                data, content_type="application/json", if_generation_match=generation
+            )
+        except PreconditionFailed:
+            return False
+        return True
+
+    if filesystem.type_name == "local":
+        # Held only to compare and replace, not while the data files are written
+        with open(f"{path}/{MANIFEST}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if _read_versioned(filesystem, path)[1] != generation:
+                return False
+            _write(filesystem, path, manifest)
+        return True
+
+    _write(filesystem, path, manifest)
+    return True
+
+
+def update_manifest(filesystem, path: str, update) -> dict:
+    """Apply `update(manifest)` to the latest manifest and publish it, retrying on conflicts.
+
+    `update` changes the manifest in place and can be called again on a newer manifest when
+    another writer published one in between.
+    """
+    for _ in range(MANIFEST_RETRIES):
+        manifest, generation = _read_versioned(filesystem, path)
+        update(manifest)
+        manifest["generation"] = manifest.get("generation", 0) + 1
+        if _publish(filesystem, path, manifest, generation):
+            return manifest
+    raise ManifestConflict(f"{path}/{MANIFEST} changed {MANIFEST_RETRIES} times while writing")
+
+
+def _stat_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _file_entry(filesystem, file_path: str, name: str, version: str) -> dict:
+    metadata = pq.read_metadata(file_path, filesystem=filesystem)
+    sort_idx = metadata.schema.to_arrow_schema().get_field_index(SORT_COLUMN)
+
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(sort_idx).statistics
+        row_groups.append(
+            {
+                "num_rows": metadata.row_group(i).num_rows,
+                "min": _stat_value(stats.min) if stats is not None else None,
+                "max": _stat_value(stats.max) if stats is not None else None,
+            }
+        )
+
+    return {
+        "file": name,
+        "version": version,
+        "num_rows": metadata.num_rows,
+        "row_groups": row_groups,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+
+def _write_files(filesystem, path: str, table: pa.Table, version: str, row_group_size: int):
+    entries = []
+    for offset in range(0, max(table.num_rows, 1), MAX_ROWS_PER_FILE):
+        chunk = table.slice(offset, MAX_ROWS_PER_FILE)
+        name = f"part-{version}-{uuid.uuid4().hex[:8]}.parquet"
+        pq.write_table(
+            chunk,
+            f"{path}/{name}",
+            filesystem=filesystem,
+            row_group_size=row_group_size,
+            write_statistics=True,
+        )
+        entries.append(_file_entry(filesystem, f"{path}/{name}", name, version))
+    return entries
+
+
+def write_partition(
+    data, partition_dir: str, version: str, replace: bool = True, row_group_size=ROW_GROUP_SIZE
+):
+    """Write `data` (DataFrame or Arrow table) sorted by pickup time into a partition.
+
+    With `replace=True` a re-run supersedes the files previously written for the same model
+    version, otherwise the new files are appended and can be merged later with `compact`.
+    """
+    if not isinstance(data, pa.Table):
+        data = pa.Table.from_pandas(data, preserve_index=False)
+    table = data.sort_by(SORT_COLUMN)
+
+    filesystem, path = get_filesystem(partition_dir)
+    filesystem.create_dir(path, recursive=True)
+
+    entries = _write_files(filesystem, path, table, version, row_group_size)
+    stale = []
+
+    def update(manifest):
+        # Recomputed on every attempt, a concurrent re-run may have added files of this version
+        stale[:] = [e["file"] for e in manifest["files"] if replace and e["version"] == version]
+        manifest["files"] = [entry for entry in manifest["files"] if entry["file"] not in stale]
+        manifest["files"].extend(entries)
+
+    manifest = update_manifest(filesystem, path, update)
+
+    for name in stale:
+        filesystem.delete_file(f"{path}/{name}")
+    return manifest
+
+
+def _overlaps(row_group: dict, start, end) -> bool:
+    if row_group["min"] is None:
+        return True
+    if start is not None and datetime.fromisoformat(row_group["max"]) < start:
+        return False
+    if end is not None and datetime.fromisoformat(row_group["min"]) >= end:
+        return False
+    return True
+
+
+def read_partition(
+    partition_dir: str, columns=None, start=None, end=None, version: str = None
+) -> pd.DataFrame:
+    """Read rides with `start <= pickup < end`, touching only the overlapping row groups."""
+    filesystem, path = get_filesystem(partition_dir)
+    manifest = read_manifest(filesystem, path)
+
+    tables = []
+    for entry in manifest["files"]:
+        if version is not None and entry["version"] != version:
+            continue
+        row_groups = [i for i, rg in enumerate(entry["row_groups"]) if _overlaps(rg, start, end)]
+        if not row_groups:
+            continue
+        with filesystem.open_input_file(f"{path}/{entry['file']}") as f_in:
+            tables.append(pq.ParquetFile(f_in).read_row_groups(row_groups, columns=columns))
+
+    if not tables:
+        return pd.DataFrame(columns=columns)
+
+    df = pa.concat_tables(tables).to_pandas()
+    if start is not None:
+        df = df[df[SORT_COLUMN] >= start]
+    if end is not None:
+        df = df[df[SORT_COLUMN] < end]
+    return df
+
+
+def compact_partition(partition_dir: str, row_group_size: int = ROW_GROUP_SIZE) -> int:
+    """Merge the files of every model version into one sorted file, return files removed."""
+    filesystem, path = get_filesystem(partition_dir)
+    manifest = read_manifest(filesystem, path)
+
+    by_version = {}
+    for entry in manifest["files"]:
+        by_version.setdefault(entry["version"], []).append(entry)
+
+    merged, removed = [], []
+    for version, entries in by_version.items():
+        if len(entries) == 1:
+            continue
+        table = pa.concat_tables(
+            [pq.read_table(f"{path}/{entry['file']}", filesystem=filesystem) for entry in entries]
+        ).sort_by(SORT_COLUMN)
+        merged.extend(_write_files(filesystem, path, table, version, row_group_size))
+        removed.extend(entry["file"] for entry in entries)
+    if not removed:
+        return 0
+
+    def update(manifest):
+        names = {entry["file"] for entry in manifest["files"]}
+        if not names.issuperset(removed):
+            raise ManifestConflict(f"Files of {path} were replaced while compacting them")
+        # Files appended meanwhile are kept as they are
+        manifest["files"] = [e for e in manifest["files"] if e["file"] not in removed] + merged
+
+    # Publish the new manifest before deleting anything so readers never miss rows
+    try:
+        update_manifest(filesystem, path, update)
+    except ManifestConflict:
+        for entry in merged:
+            filesystem.delete_file(f"{path}/{entry['file']}")
+        raise
+    for name in removed:
+        filesystem.delete_file(f"{path}/{name}")
+    return len(removed)
+
+
+def find_partitions(root: str):
+    """Yield every partition directory under `root` that has a manifest."""
+    filesystem, path = get_filesystem(root)
+    selector = pafs.FileSelector(path, recursive=True, allow_not_found=True)
+    prefix = root.split("://")[0] + "://" if "://" in root else ""
+    for info in filesystem.get_file_info(selector):
+        if info.base_name == MANIFEST:
+            yield prefix + info.path.rsplit("/", 1)[0]
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Manage the batch scoring output dataset.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact = subparsers.add_parser("compact", help="Merge small files in each partition.")
+    compact.add_argument("root", help="Dataset root, e.g. gs://taxi-ride-prediction/output")
+    compact.add_argument("--taxi-type")
+    compact.add_argument("--year", type=int)
+    compact.add_argument("--month", type=int)
+    compact.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    if args.taxi_type and args.year and args.month:
+        partitions = [partition_path(args.root, args.taxi_type, args.year, args.month)]
+    else:
+        partitions = list(find_partitions(args.root))
+
+    for partition in partitions:
+        removed = compact_partition(partition, row_group_size=args.row_group_size)
+        print(f"Compacted {partition}: merged {removed} files")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,337 @@
+# Generated from shared/features.py by shared/sync.py, edit that file instead.
+"""Integer-keyed features for the ride duration models.
+
+The pickup/dropoff cross feature is encoded as the integer `PU * 1000 + DO` (taxi zone IDs go up
+to 265), instead of the string `"{PU}_{DO}"` that `DictVectorizer` one-hot encodes. A fitted
+`RideFeaturizer` holds a sorted vocabulary array of those codes and builds the sparse model input
+directly from the location ID and distance columns, without creating a dict or a string per ride.
+
+The model input is a CSR matrix with one column per known PU_DO pair followed by the numerical
+features, as `DictVectorizer` produced it. Pairs that were not seen in training are ignored.
+`extend` adds new pairs as columns after all existing ones, so a model can continue training on
+a new month without moving any of the features it was trained on.
+
+`HashingFeaturizer` is the alternative mode without fitted state: every code is hashed into one of
+a fixed number of columns, so unseen pairs never grow the feature space and chunks of data can be
+featurized independently, at the cost of some hash collisions.
+
+`transform_frame(df, n_jobs=...)` splits large inputs into row chunks and featurizes them across a
+process pool. The fitted featurizer and the input columns are handed to every worker once, and the
+CSR chunks are copied straight into the preallocated arrays of the result.
+
+Existing pickled preprocessors can be migrated with `RideFeaturizer.from_dict_vectorizer`, which
+keeps the column of every feature, so models trained on the old input keep working unchanged:
+
+    python features.py migrate models/lin_reg.bin models/lin_reg_int.bin
+"""
+
+import abc
+import argparse
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+CROSS_FEATURE = "PU_DO"
+NUMERICAL = ("trip_distance",)
+
+# Larger than the highest taxi zone ID, so every (PU, DO) pair gets its own code
+CROSS_BASE = 1000
+
+# 2**64 / golden ratio, spreads consecutive codes over the whole 64-bit range
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+DEFAULT_HASH_WIDTH = 2**16
+
+# Below this many rows per worker the pool costs more than it saves
+MIN_PARALLEL_ROWS = 50_000
+
+
+def cross_codes(pu, do) -> np.ndarray:
+    """Integer code of every (PU, DO) pair."""
+    pu = np.asarray(pu, dtype=np.int64)
+    do = np.asarray(do, dtype=np.int64)
+    return pu * CROSS_BASE + do
+
+
+def sparse_rows(columns, data, values, numerical_columns, n_features) -> sp.csr_matrix:
+    """CSR matrix with the cross feature of every row followed by its numerical features.
+
+    `columns` and `data` hold the cross feature column and value of every row, a column of -1
+    leaves the row without a cross feature.
+    """
+    has_cross = columns >= 0
+    n_numerical = len(numerical_columns)
+    indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    np.cumsum(has_cross.astype(np.int64) + n_numerical, out=indptr[1:])
+
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    matrix_data = np.empty(indptr[-1], dtype=np.float64)
+    starts = indptr[:-1]
+    indices[starts[has_cross]] = columns[has_cross]
+    matrix_data[starts[has_cross]] = data[has_cross]
+    first_numerical = starts + has_cross
+    for j in range(n_numerical):
+        indices[first_numerical + j] = numerical_columns[j]
+        matrix_data[first_numerical + j] = values[:, j]
+
+    return sp.csr_matrix((matrix_data, indices, indptr), shape=(len(columns), n_features))
+
+
+class _Featurizer(abc.ABC):
+    numerical = NUMERICAL
+
+    @abc.abstractmethod
+    def transform(self, pu, do, values) -> sp.csr_matrix:
+        """Build the model input from location ID arrays and a `(n, len(numerical))` array."""
+
+    def transform_frame(self, df, n_jobs: int = 1) -> sp.csr_matrix:
+        """Build the model input from a DataFrame, with `n_jobs` processes (None for all cores)."""
+        pu = df["PULocationID"].to_numpy()
+        do = df["DOLocationID"].to_numpy()
+        values = df[list(self.numerical)].to_numpy(dtype=np.float64)
+        n_jobs = n_jobs or os.cpu_count()
+        if n_jobs > 1 and len(df) >= 2 * MIN_PARALLEL_ROWS:
+            return parallel_transform(self, pu, do, values, n_jobs)
+        return self.transform(pu, do, values)
+
+    def transform_rides(self, rides) -> sp.csr_matrix:
+        """Build the model input from ride dicts, as received by the prediction services."""
+        n = len(rides)
+        pu = np.fromiter((ride["PULocationID"] for ride in rides), dtype=np.int64, count=n)
+        do = np.fromiter((ride["DOLocationID"] for ride in rides), dtype=np.int64, count=n)
+        values = np.array(
+            [[ride[name] for name in self.numerical] for ride in rides], dtype=np.float64
+        )
+        return self.transform(pu, do, values)
+
+
+class RideFeaturizer(_Featurizer):
+    def __init__(self, numerical=NUMERICAL):
+        self.numerical = tuple(numerical)
+        self.vocabulary = np.empty(0, dtype=np.int64)  # sorted PU_DO codes
+        self.columns = np.empty(0, dtype=np.int32)  # matrix column of each code
+        self.numerical_columns = np.empty(0, dtype=np.int32)
+        self.n_features = 0
+
+    def fit(self, pu, do):
+        self.vocabulary = np.unique(cross_codes(pu, do))
+        n_codes = len(self.vocabulary)
+        self.columns = np.arange(n_codes, dtype=np.int32)
+        self.numerical_columns = np.arange(n_codes, n_codes + len(self.numerical), dtype=np.int32)
+        self.n_features = n_codes + len(self.numerical)
+        return self
+
+    def extend(self, pu, do):
+        """Add a column for every pair not in the vocabulary yet, after all existing columns.
+
+        The known pairs and the numerical features keep their columns, so a model trained on the
+        old input reads the wider matrix the same way and can continue training on it.
+        """
+        if not self.n_features:
+            return self.fit(pu, do)
+        codes = np.unique(cross_codes(pu, do))
+        new_codes = codes[~np.isin(codes, self.vocabulary, assume_unique=True)]
+        new_columns = np.arange(self.n_features, self.n_features + len(new_codes), dtype=np.int32)
+        vocabulary = np.concatenate([self.vocabulary, new_codes])
+        order = np.argsort(vocabulary, kind="stable")
+        self.vocabulary = vocabulary[order]
+        self.columns = np.concatenate([self.columns, new_columns])[order]
+        self.n_features += len(new_codes)
+        return self
+
+    @classmethod
+    def from_dict_vectorizer(cls, dv, numerical=NUMERICAL):
+        """Build a featurizer that produces the same matrix as a fitted `DictVectorizer`."""
+        featurizer = cls(numerical)
+        prefix = CROSS_FEATURE + dv.separator
+        codes, columns, numerical_columns = [], [], {}
+        for name, column in dv.vocabulary_.items():
+            if name.startswith(prefix):
+                pu, do = name[len(prefix) :].split("_")
+                codes.append(int(pu) * CROSS_BASE + int(do))
+                columns.append(column)
+            elif name in featurizer.numerical:
+                numerical_columns[name] = column
+            else:
+                raise ValueError(f"Cannot migrate the feature {name!r}")
+
+        missing = set(featurizer.numerical) - set(numerical_columns)
+        if missing:
+            raise ValueError(f"The DictVectorizer has no {sorted(missing)} features")
+
+        order = np.argsort(codes)
+        featurizer.vocabulary = np.asarray(codes, dtype=np.int64)[order]
+        featurizer.columns = np.asarray(columns, dtype=np.int32)[order]
+        featurizer.numerical_columns = np.array(
+            [numerical_columns[name] for name in featurizer.numerical], dtype=np.int32
+        )
+        featurizer.n_features = len(dv.vocabulary_)
+        return featurizer
+
+    def transform(self, pu, do, values) -> sp.csr_matrix:
+        """Build the model input from location ID arrays and a `(n, len(numerical))` array."""
+        if not self.n_features:
+            raise ValueError("The RideFeaturizer is not fitted")
+        codes = cross_codes(pu, do)
+        values = np.asarray(values, dtype=np.float64).reshape(len(codes), len(self.numerical))
+
+        position = np.searchsorted(self.vocabulary, codes)
+        position[position == len(self.vocabulary)] = 0
+        known = self.vocabulary[position] == codes if len(self.vocabulary) else position < 0
+
+        # Pairs that were not seen in training get no column
+        columns = np.full(len(codes), -1, dtype=np.int32)
+        columns[known] = self.columns[position[known]]
+        data = np.ones(len(codes), dtype=np.float64)
+        return sparse_rows(columns, data, values, self.numerical_columns, self.n_features)
+
+
+class HashingFeaturizer(_Featurizer):
+    """Hash the PU_DO codes into `width` columns, followed by the numerical features.
+
+    With `alternate_sign` half of the codes get the value -1 instead of 1, so colliding pairs
+    tend to cancel out rather than add up, as in sklearn's `FeatureHasher`.
+    """
+
+    def __init__(self, width=DEFAULT_HASH_WIDTH, numerical=NUMERICAL, alternate_sign=True):
+        self.width = width
+        self.numerical = tuple(numerical)
+        self.alternate_sign = alternate_sign
+        self.numerical_columns = np.arange(width, width + len(self.numerical), dtype=np.int32)
+        self.n_features = width + len(self.numerical)
+
+    def fit(self, pu=None, do=None):
+        # Nothing to learn, kept so both featurizers are used the same way
+        return self
+
+    def extend(self, pu=None, do=None):
+        # New pairs already hash into the fixed columns
+        return self
+
+    def hash_codes(self, codes) -> np.ndarray:
+        hashed = np.asarray(codes, dtype=np.int64).astype(np.uint64) * HASH_MULTIPLIER
+        hashed ^= hashed >> np.uint64(29)
+        return hashed
+
+    def transform(self, pu, do, values) -> sp.csr_matrix:
+        """Build the model input from location ID arrays and a `(n, len(numerical))` array."""
+        hashed = self.hash_codes(cross_codes(pu, do))
+        values = np.asarray(values, dtype=np.float64).reshape(len(hashed), len(self.numerical))
+
+        columns = (hashed % np.uint64(self.width)).astype(np.int32)
+        data = np.ones(len(hashed), dtype=np.float64)
+        if self.alternate_sign:
+            data[(hashed >> np.uint64(63)).astype(bool)] = -1.0
+        return sparse_rows(columns, data, values, self.numerical_columns, self.n_features)
+
+
+# Set in every pool worker by `_init_worker`
+_worker_state = None
+
+
+def _init_worker(featurizer, pu, do, values):
+    global _worker_state
+    _worker_state = (featurizer, pu, do, values)
+
+
+def _transform_chunk(bounds):
+    featurizer, pu, do, values = _worker_state
+    start, stop = bounds
+    X = featurizer.transform(pu[start:stop], do[start:stop], values[start:stop])
+    return X.data, X.indices, X.indptr
+
+
+def parallel_transform(featurizer, pu, do, values, n_jobs: int) -> sp.csr_matrix:
+    """Featurize row chunks across `n_jobs` processes and stack them into one CSR matrix."""
+    n_rows = len(pu)
+    n_chunks = min(n_jobs, max(n_rows // MIN_PARALLEL_ROWS, 1))
+    edges = np.linspace(0, n_rows, n_chunks + 1).astype(np.int64)
+    bounds = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+    # With fork the workers inherit the featurizer and the columns without pickling them
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(
+        max_workers=n_chunks,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(featurizer, pu, do, values),
+    ) as executor:
+        chunks = list(executor.map(_transform_chunk, bounds))
+
+    # Copy every chunk once into the final arrays, instead of sp.vstack going through COO
+    nnz = sum(len(data) for data, _, _ in chunks)
+    data = np.empty(nnz, dtype=np.float64)
+    indices = np.empty(nnz, dtype=np.int32)
+    # scipy would otherwise cast an int64 indptr down to the int32 of the indices
+    indptr = np.empty(n_rows + 1, dtype=np.int32 if nnz < 2**31 else np.int64)
+    indptr[0] = 0
+    offset = 0
+    for (start, stop), (chunk_data, chunk_indices, chunk_indptr) in zip(bounds, chunks):
+        data[offset : offset + len(chunk_data)] = chunk_data
+        indices[offset : offset + len(chunk_indices)] = chunk_indices
+        np.add(chunk_indptr[1:], offset, out=indptr[start + 1 : stop + 1])
+        offset += len(chunk_data)
+
+    shape = (n_rows, featurizer.n_features)
+    return sp.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+def make_featurizer(mode: str = "vocabulary", width: int = DEFAULT_HASH_WIDTH):
+    """Featurizer for the `vocabulary` (fitted, one column per pair) or `hashing` mode."""
+    if mode == "vocabulary":
+        return RideFeaturizer()
+    if mode == "hashing":
+        return HashingFeaturizer(width)
+    raise ValueError(f"Unknown feature mode {mode!r}")
+
+
+def as_featurizer(preprocessor) -> _Featurizer:
+    """Return `preprocessor` as a featurizer, a `DictVectorizer` becomes a `RideFeaturizer`."""
+    if isinstance(preprocessor, (RideFeaturizer, HashingFeaturizer)):
+        return preprocessor
+    if hasattr(preprocessor, "vocabulary_") and hasattr(preprocessor, "separator"):
+        return RideFeaturizer.from_dict_vectorizer(preprocessor)
+    raise TypeError(f"Unsupported preprocessor {type(preprocessor).__name__}")
+
+
+def split_pipeline(pipeline):
+    """Split a `make_pipeline(DictVectorizer(), model)` into `(featurizer, model)`."""
+    steps = [step for _, step in pipeline.steps]
+    featurizer = as_featurizer(steps[0])
+    if len(steps) == 2:
+        return featurizer, steps[1]
+    return featurizer, pipeline[1:]
+
+
+def migrate(input_file: str, output_file: str) -> None:
+    """Rewrite a pickled preprocessor or `(preprocessor, model)` tuple with a `RideFeaturizer`."""
+    with open(input_file, "rb") as f_in:
+        obj = pickle.load(f_in)
+
+    if isinstance(obj, tuple):
+        obj = (as_featurizer(obj[0]), *obj[1:])
+    else:
+        obj = as_featurizer(obj)
+
+    with open(output_file, "wb") as f_out:
+        pickle.dump(obj, f_out)
+    print(f"Saved the migrated preprocessor to {output_file}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate pickled DictVectorizer preprocessors.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate")
+    migrate_parser.add_argument("input_file")
+    migrate_parser.add_argument("output_file")
+    args = parser.parse_args()
+
+    # Pickle the featurizer as `features.RideFeaturizer`, not `__main__.RideFeaturizer`
+    import features
+
+    features.migrate(args.input_file, args.output_file)
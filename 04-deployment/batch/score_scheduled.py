@@ -7,9 +7,14 @@ from datetime import date
 from typing import Union
 
 import mlflow
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from data_quality import read_checked
+from dataset_writer import partition_path, write_partition
 from dateutil.relativedelta import relativedelta
 from dotenv import find_dotenv, load_dotenv
+from features import split_pipeline
 from prefect import (
     flow,
     get_run_logger,
@@ -18,7 +23,11 @@ from prefect import (
 from prefect.context import get_run_context
 
 load_dotenv(find_dotenv())
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GCS_ACCESS_TOKEN")
+# os.environ only takes strings, without the token the module could not even be imported
+if os.getenv("GCS_ACCESS_TOKEN"):
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("GCS_ACCESS_TOKEN")
+
+OUTPUT_ROOT = "gs://taxi-ride-prediction/output"
 
 
 # Utility functions
@@ -29,64 +38,81 @@ def gen_uuids(n):
     return ride_ids
 
 
-def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
-
-    df["duration"] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.dt.total_seconds() / 60
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+def read_dataframe(filename: str, quality_action: str = "fail", known_pairs=None):
+    # Validated and filtered in one pass over the Arrow columns, see data_quality.py
+    df = read_checked(filename, action=quality_action, known_pairs=known_pairs)
 
     df["ride_id"] = gen_uuids(len(df))
     return df
 
 
-def prepare_dictionaries(df: pd.DataFrame):
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
-    df["PU_DO"] = df["PULocationID"] + "_" + df["DOLocationID"]
-    categorical = ["PU_DO"]
-    numerical = ["trip_distance"]
-    dicts = df[categorical + numerical].to_dict(orient="records")
-    return dicts
+def make_result_table(df: pd.DataFrame, y_pred, run_id: str) -> pa.Table:
+    """Build the output table straight from the existing column arrays."""
+    y_pred = np.asarray(y_pred, dtype=np.float64)
+    actual = df["duration"].to_numpy(dtype=np.float64)
+
+    diff = actual.copy()
+    np.subtract(diff, y_pred, out=diff)
+
+    # One dictionary entry instead of the run ID repeated on every row
+    model_version = pa.DictionaryArray.from_arrays(
+        pa.array(np.zeros(len(df), dtype=np.int8)), pa.array([run_id])
+    )
+
+    return pa.table(
+        {
+            "ride_id": pa.array(df["ride_id"], type=pa.string()),
+            "lpep_pickup_datetime": pa.array(df["lpep_pickup_datetime"]),
+            # Taxi zone IDs go up to 265
+            "PULocationID": df["PULocationID"].to_numpy(dtype=np.int16),
+            "DOLocationID": df["DOLocationID"].to_numpy(dtype=np.int16),
+            "actual_duration": actual,
+            "predicted_duration": y_pred,
+            "diff": diff,
+            "model_version": model_version,
+        }
+    )
 
 
 def load_model(experiment_id, run_id):
+    """Load the logged `DictVectorizer` pipeline as `(featurizer, model)`.
+
+    The vectorizer is migrated to a `RideFeaturizer`, so the model is fed straight from the
+    integer location ID columns.
+    """
     logged_model = (
         f"gs://pytholic-mlops-zoomcamp-artifacts/{experiment_id}/{run_id}/artifacts/model"
     )
-    model = mlflow.pyfunc.load_model(logged_model)
-    return model
+    pipeline = mlflow.sklearn.load_model(logged_model)
+    return split_pipeline(pipeline)
+
+
+def predict(df: pd.DataFrame, featurizer, model):
+    X = featurizer.transform_frame(df)
+    return model.predict(X)
 
 
 @task
-def apply_model(input_file, experiment_id, run_id, output_file):
+def apply_model(input_file, experiment_id, run_id, output_dir, quality_action="quarantine"):
     logger = get_run_logger()
 
-    logger.info(f"Reading the data from {input_file}...")
-    df = read_dataframe(input_file)
-    dicts = prepare_dictionaries(df)
-
     logger.info(f"Loading the model with RUN_ID={run_id}...")
-    model = load_model(experiment_id, run_id)
+    featurizer, model = load_model(experiment_id, run_id)
 
-    logger.info("Applying the model...")
-    y_pred = model.predict(dicts)
+    # A rejected month is written to ./quarantine and fails the run before scoring
+    logger.info(f"Reading and checking the data from {input_file}...")
+    known_pairs = getattr(featurizer, "vocabulary", None)
+    df = read_dataframe(input_file, quality_action, known_pairs)
 
-    logger.info(f"Saving the result to {output_file}...")
-    df_result = pd.DataFrame()
-    df_result["ride_id"] = df["ride_id"]
-    df_result["lpep_pickup_datetime"] = df["lpep_pickup_datetime"]
-    df_result["PULocationID"] = df["PULocationID"]
-    df_result["DOLocationID"] = df["DOLocationID"]
-    df_result["actual_duration"] = df["duration"]
-    df_result["predicted_duration"] = y_pred
-    df_result["diff"] = df_result["actual_duration"] - df_result["predicted_duration"]
-    df_result["model_version"] = run_id
+    logger.info("Applying the model...")
+    y_pred = predict(df, featurizer, model)
 
-    df_result.to_parquet(output_file, index=False)
+    logger.info(f"Saving the result to {output_dir}...")
+    table = make_result_table(df, y_pred, run_id)
+    write_partition(table, output_dir, version=run_id)
 
 
-def get_paths(run_date, taxi_type, run_id):
+def get_paths(run_date, taxi_type, output_root: str = OUTPUT_ROOT):
     prev_month = run_date - relativedelta(months=1)
     year = prev_month.year
     month = prev_month.month
@@ -96,23 +122,31 @@ def get_paths(run_date, taxi_type, run_id):
     # input_file = (
     #     f"gs://taxi-ride-prediction/data/{taxi_type}_tripdata_{year:04d}-{month:02d}.parquet"
     # )
-    output_file = f"gs://taxi-ride-prediction/output/taxi_type={taxi_type}/year={year:04d}/month={month:02d}/{run_id}.parquet"
+    output_dir = partition_path(output_root, taxi_type, year, month)
 
-    return input_file, output_file
+    return input_file, output_dir
 
 
 @flow
 def ride_duration_prediction(
-    taxi_type: str, run_id: str, experiment_id: Union[str, int], run_date: date = None
+    taxi_type: str,
+    run_id: str,
+    experiment_id: Union[str, int],
+    run_date: date = None,
+    quality_action: str = "quarantine",
 ):
     if run_date is None:
         ctx = get_run_context()
         run_date = ctx.flow_run.expected_start_time
 
-    input_file, output_file = get_paths(run_date, taxi_type, run_id)
+    input_file, output_dir = get_paths(run_date, taxi_type)
 
     apply_model(
-        input_file=input_file, experiment_id=experiment_id, run_id=run_id, output_file=output_file
+        input_file=input_file,
+        experiment_id=experiment_id,
+        run_id=run_id,
+        output_dir=output_dir,
+        quality_action=quality_action,
     )
 
 
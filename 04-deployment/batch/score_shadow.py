@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""Shadow scoring: apply several models to the same month in one pass over the data.
+
+The month is read once and its location ID and distance columns are extracted once. Every
+model only maps them to its own vocabulary, and models with identical featurizers share one
+model input. The models are loaded and applied in parallel threads.
+
+The output has the schema of the regular scored output, with one row per ride and model, and
+goes to its own `shadow` dataset so that reads of the regular output never see it. Every model
+is written as its own version of the partition, with its diff statistics in the parquet schema
+metadata, which are also logged.
+
+Usage:
+    python score_shadow.py green 2021 2 1 553def03f5224f649fe56bc1567daccc <CANDIDATE RUN ID>
+"""
+
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import List, Union
+
+import numpy as np
+import pyarrow as pa
+from dataset_writer import write_partition
+from features import HashingFeaturizer
+from prefect import (
+    flow,
+    get_run_logger,
+    task,
+)
+from prefect.context import get_run_context
+from score_scheduled import (
+    get_paths,
+    load_model,
+    make_result_table,
+    read_dataframe,
+)
+
+SHADOW_ROOT = "gs://taxi-ride-prediction/shadow"
+
+
+def diff_stats(diff: np.ndarray) -> dict:
+    abs_diff = np.abs(diff)
+    return {
+        "count": int(len(diff)),
+        "mean": float(diff.mean()),
+        "mean_abs": float(abs_diff.mean()),
+        "rmse": float(np.sqrt(np.mean(diff**2))),
+        "p50_abs": float(np.percentile(abs_diff, 50)),
+        "p95_abs": float(np.percentile(abs_diff, 95)),
+    }
+
+
+def same_input(a, b) -> bool:
+    """Whether two featurizers build the same model input from the same rides."""
+    if type(a) is not type(b) or a.numerical != b.numerical or a.n_features != b.n_features:
+        return False
+    if isinstance(a, HashingFeaturizer):
+        return a.width == b.width and a.alternate_sign == b.alternate_sign
+    return (
+        np.array_equal(a.vocabulary, b.vocabulary)
+        and np.array_equal(a.columns, b.columns)
+        and np.array_equal(a.numerical_columns, b.numerical_columns)
+    )
+
+
+def featurize(df, featurizers) -> list:
+    """Model input of every featurizer, with the columns of `df` extracted only once."""
+    pu = df["PULocationID"].to_numpy()
+    do = df["DOLocationID"].to_numpy()
+    values = {}  # numerical columns -> array
+
+    inputs = []
+    for i, featurizer in enumerate(featurizers):
+        shared = next((j for j in range(i) if same_input(featurizers[j], featurizer)), None)
+        if shared is not None:
+            inputs.append(inputs[shared])
+            continue
+        numerical = tuple(featurizer.numerical)
+        if numerical not in values:
+            values[numerical] = df[list(numerical)].to_numpy(dtype=np.float64)
+        inputs.append(featurizer.transform(pu, do, values[numerical]))
+    return inputs
+
+
+def make_shadow_table(df, y_pred, run_id: str) -> pa.Table:
+    """The regular output table of one model, with its diff statistics in the metadata."""
+    table = make_result_table(df, y_pred, run_id)
+    stats = diff_stats(table.column("diff").to_numpy())
+    metadata = {b"diff_stats": json.dumps(stats).encode("utf-8")}
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+
+
+@task
+def apply_models(input_file, experiment_id, run_ids, output_dir):
+    logger = get_run_logger()
+
+    logger.info(f"Reading the data from {input_file}...")
+    df = read_dataframe(input_file)
+
+    with ThreadPoolExecutor(max_workers=len(run_ids)) as executor:
+        logger.info(f"Loading the models with RUN_IDS={run_ids}...")
+        models = list(executor.map(lambda run_id: load_model(experiment_id, run_id), run_ids))
+
+        logger.info("Featurizing the data...")
+        inputs = featurize(df, [featurizer for featurizer, _ in models])
+
+        logger.info("Applying the models...")
+        y_preds = list(executor.map(lambda m, X: m[1].predict(X), models, inputs))
+
+    logger.info(f"Saving the result to {output_dir}...")
+    for run_id, y_pred in zip(run_ids, y_preds):
+        table = make_shadow_table(df, y_pred, run_id)
+        logger.info(f"{run_id}: {json.loads(table.schema.metadata[b'diff_stats'])}")
+        write_partition(table, output_dir, version=run_id)
+
+
+@flow
+def ride_duration_prediction_shadow(
+    taxi_type: str, run_ids: List[str], experiment_id: Union[str, int], run_date: date = None
+):
+    if run_date is None:
+        ctx = get_run_context()
+        run_date = ctx.flow_run.expected_start_time
+
+    input_file, output_dir = get_paths(run_date, taxi_type, output_root=SHADOW_ROOT)
+
+    apply_models(
+        input_file=input_file,
+        experiment_id=experiment_id,
+        run_ids=run_ids,
+        output_dir=output_dir,
+    )
+
+
+def run():
+    """Score one month with the reference model and every candidate model."""
+    taxi_type = sys.argv[1]  # "green"
+    year = int(sys.argv[2])  # 2021
+    month = int(sys.argv[3])  # 2
+    EXPERIMENT_ID = sys.argv[4]  # 1
+    RUN_IDS = sys.argv[5:]  # ["553def03f5224f649fe56bc1567daccc", ...]
+
+    ride_duration_prediction_shadow(
+        taxi_type=taxi_type,
+        run_ids=RUN_IDS,
+        experiment_id=EXPERIMENT_ID,
+        run_date=date(year=year, month=month, day=1),
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,205 @@
+"""Load-test harness for the prediction services.
+
+Replays rides from the `data/green_tripdata_*.parquet` files against `/predict`, either with N
+concurrent connections that send back-to-back (closed loop) or at a target request rate (open
+loop). With `--batch-size` > 1 every request carries a JSON array of rides.
+
+It reports throughput, p50/p95/p99 latency and error rate, and saves the results as JSON, so
+serving changes can be compared over time. In open-loop mode latency is measured from the
+scheduled send time, so a slow server is not hidden by requests that were sent late.
+
+Usage:
+    python load_test.py --url http://127.0.0.1:9696/predict --concurrency 8 --duration 30
+    python load_test.py --rps 200 --duration 60 --label gunicorn-4-workers
+    python load_test.py --batch-size 100 --concurrency 4 --requests 1000
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+RIDE_COLUMNS = ["PULocationID", "DOLocationID", "trip_distance"]
+
+
+def load_rides(pattern: str, limit: int = None):
+    rides = []
+    for filename in sorted(glob.glob(pattern)):
+        df = pd.read_parquet(filename, columns=RIDE_COLUMNS).dropna()
+        df = df.astype({"PULocationID": int, "DOLocationID": int, "trip_distance": float})
+        rides.extend(df.to_dict(orient="records"))
+        if limit and len(rides) >= limit:
+            return rides[:limit]
+    if not rides:
+        raise FileNotFoundError(f"No rides found in {pattern}")
+    return rides
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.rides = 0
+        self.errors = 0
+        self.status_codes = {}
+        self._lock = threading.Lock()
+
+    def record(self, latency, status, rides=1):
+        with self._lock:
+            self.latencies.append(latency)
+            self.rides += rides
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            if not (isinstance(status, int) and 200 <= status < 300):
+                self.errors += 1
+
+
+class LoadTest:
+    def __init__(self, url, rides, batch_size=1, timeout=10.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.recorder = Recorder()
+        self._payloads = itertools.cycle(self._make_payloads(rides))
+        self._payloads_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _make_payloads(self, rides):
+        if self.batch_size == 1:
+            return rides
+        return [rides[i : i + self.batch_size] for i in range(0, len(rides), self.batch_size)]
+
+    def _next_payload(self):
+        with self._payloads_lock:
+            return next(self._payloads)
+
+    def _session(self):
+        # One keep-alive connection per thread
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, started=None):
+        payload = self._next_payload()
+        started = started or time.perf_counter()
+        try:
+            response = self._session().post(self.url, json=payload, timeout=self.timeout)
+            status = response.status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        # The last batch of the replayed rides can be partial
+        rides = len(payload) if isinstance(payload, list) else 1
+        self.recorder.record(time.perf_counter() - started, status, rides)
+
+    def run_closed(self, concurrency, duration=None, total=None):
+        """Every connection sends its next request as soon as the previous one returns."""
+        deadline = time.perf_counter() + duration if duration else None
+        counter = itertools.count()
+
+        def worker():
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                if total is not None and next(counter) >= total:
+                    return
+                self.send()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_open(self, rps, concurrency, duration=None, total=None):
+        """Send requests on a fixed schedule of `rps` per second, independent of the responses."""
+        total = total or int(rps * duration)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i in range(total):
+                scheduled = start + i / rps
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.send, scheduled)
+
+
+def summarize(recorder, elapsed):
+    latencies = np.array(recorder.latencies) * 1000
+    n = len(latencies)
+    return {
+        "requests": n,
+        "rides": recorder.rides,
+        "elapsed_s": elapsed,
+        "throughput_rps": n / elapsed if elapsed else 0.0,
+        "rides_per_s": recorder.rides / elapsed if elapsed else 0.0,
+        "error_rate": recorder.errors / n if n else 0.0,
+        "status_codes": {str(k): v for k, v in recorder.status_codes.items()},
+        "latency_ms": {
+            "mean": float(latencies.mean()) if n else None,
+            "p50": float(np.percentile(latencies, 50)) if n else None,
+            "p95": float(np.percentile(latencies, 95)) if n else None,
+            "p99": float(np.percentile(latencies, 99)) if n else None,
+            "max": float(latencies.max()) if n else None,
+        },
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Load test the ride duration prediction service.")
+    parser.add_argument("--url", default="http://127.0.0.1:9696/predict")
+    parser.add_argument("--data", default="../data/green_tripdata_*.parquet")
+    parser.add_argument("--limit", type=int, default=100000, help="Rides to load for replay.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rps", type=float, help="Target request rate, enables open loop.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run.")
+    parser.add_argument("--requests", type=int, help="Total requests, overrides --duration.")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output-dir", default="load_test_results")
+    args = parser.parse_args()
+
+    rides = load_rides(args.data, args.limit)
+    test = LoadTest(args.url, rides, batch_size=args.batch_size, timeout=args.timeout)
+    duration = None if args.requests else args.duration
+
+    mode = "open" if args.rps else "closed"
+    print(f"Replaying {len(rides)} rides against {args.url} ({mode} loop)...")
+    start = time.perf_counter()
+    if mode == "open":
+        test.run_open(args.rps, args.concurrency, duration=duration, total=args.requests)
+    else:
+        test.run_closed(args.concurrency, duration=duration, total=args.requests)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(test.recorder, elapsed)
+    latency = summary["latency_ms"]
+    print(
+        f"requests={summary['requests']} throughput={summary['throughput_rps']:.1f} req/s "
+        f"errors={summary['error_rate']:.2%}"
+    )
+    if summary["requests"]:
+        print(
+            f"latency ms: p50={latency['p50']:.2f} p95={latency['p95']:.2f} "
+            f"p99={latency['p99']:.2f} max={latency['max']:.2f}"
+        )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_file = os.path.join(args.output_dir, f"{timestamp}-{args.label}.json")
+    config = {k: v for k, v in vars(args).items() if k != "output_dir"}
+    with open(output_file, "w") as f_out:
+        json.dump({"timestamp": timestamp, "config": config, "results": summary}, f_out, indent=2)
+    print(f"Saved the results to {output_file}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,192 @@
+"""Per-worker memory report for the gunicorn prediction services.
+
+Reports RSS, PSS and USS (unique set size, the memory only that process uses) for a gunicorn
+master and each of its workers. USS is what grows with the worker count when every worker
+holds its own model copy; pages shared copy-on-write count in RSS but not in USS.
+
+With `--compare` it starts the service twice, first with `PRELOAD_APP=0` (every worker loads
+its own model) and then with the preloading launcher of `gunicorn.conf.py`. It sends warm-up
+requests so that every worker has served predictions, and then reports both runs side by side.
+
+Memory is read from `/proc/<pid>/smaps_rollup` (Linux), or with `psutil` when it is installed.
+
+Usage:
+    python memory_report.py --pid 12345
+    python memory_report.py --compare --app-dir web-service --workers 4
+    python memory_report.py --compare --app-dir web-service-mlflow --workers 8 --label rf
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import requests
+from load_test import load_rides
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+
+
+def read_memory(pid: int) -> dict:
+    """RSS, PSS and USS of a process in MB."""
+    if psutil is not None:
+        info = psutil.Process(pid).memory_full_info()
+        return {
+            "rss_mb": info.rss / MB,
+            "pss_mb": getattr(info, "pss", 0) / MB,
+            "uss_mb": info.uss / MB,
+        }
+
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f_in:
+        for line in f_in:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss_mb": fields["Rss"] / MB,
+        "pss_mb": fields["Pss"] / MB,
+        "uss_mb": (fields["Private_Clean"] + fields["Private_Dirty"]) / MB,
+    }
+
+
+def child_pids(pid: int):
+    if psutil is not None:
+        return [child.pid for child in psutil.Process(pid).children()]
+
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f_in:
+                # The command name may contain spaces, the parent PID follows the closing paren
+                ppid = int(f_in.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def report(master_pid: int) -> dict:
+    workers = {pid: read_memory(pid) for pid in child_pids(master_pid)}
+    return {
+        "master": read_memory(master_pid),
+        "workers": workers,
+        "workers_uss_mb": sum(memory["uss_mb"] for memory in workers.values()),
+        "workers_pss_mb": sum(memory["pss_mb"] for memory in workers.values()),
+    }
+
+
+def print_report(name: str, result: dict):
+    print(f"\n{name}")
+    print(f"{'process':<16} {'rss (MB)':>9} {'pss (MB)':>9} {'uss (MB)':>9}")
+    rows = [("master", result["master"])]
+    rows += [(f"worker {pid}", memory) for pid, memory in result["workers"].items()]
+    for label, memory in rows:
+        print(
+            f"{label:<16} {memory['rss_mb']:>9.1f} {memory['pss_mb']:>9.1f} "
+            f"{memory['uss_mb']:>9.1f}"
+        )
+    print(
+        f"{'workers total':<16} {'':>9} {result['workers_pss_mb']:>9.1f} "
+        f"{result['workers_uss_mb']:>9.1f}"
+    )
+
+
+def launch(app_dir: str, workers: int, preload: bool, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PRELOAD_APP": "1" if preload else "0",
+        "WEB_CONCURRENCY": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+    }
+    command = [sys.executable, "-m", "gunicorn", "--config=gunicorn.conf.py", "predict:app"]
+    return subprocess.Popen(command, cwd=app_dir, env=env)
+
+
+def warm_up(url: str, rides, requests_count: int, timeout: float):
+    """Wait for the service and send requests, so every worker has loaded and used the model."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            requests.post(url, json=rides[0], timeout=5).raise_for_status()
+            break
+        except requests.RequestException:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.5)
+
+    session = requests.Session()
+    for i in range(requests_count):
+        # New connections, so the requests are spread over the workers
+        session.close()
+        session.post(url, json=rides[i % len(rides)], timeout=30)
+
+
+def compare(args):
+    rides = load_rides(args.data, 1000)
+    url = f"http://127.0.0.1:{args.port}/predict"
+    results = {}
+    for name, preload in (("per-worker load", False), ("preloaded", True)):
+        process = launch(args.app_dir, args.workers, preload, args.port)
+        try:
+            warm_up(url, rides, args.requests, args.timeout)
+            time.sleep(args.settle)
+            results[name] = report(process.pid)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        print_report(name, results[name])
+
+    before, after = results["per-worker load"], results["preloaded"]
+    print(
+        f"\nWorker USS: {before['workers_uss_mb']:.1f} MB -> {after['workers_uss_mb']:.1f} MB "
+        f"with {args.workers} workers"
+    )
+    return results
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pid", type=int, help="PID of a running gunicorn master.")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--app-dir", default="web-service")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=9797)
+    parser.add_argument("--data", default="../data/green_tripdata_*.parquet")
+    parser.add_argument("--requests", type=int, default=200, help="Warm-up requests.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for start.")
+    parser.add_argument("--settle", type=float, default=1.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output-dir", default="memory_report_results")
+    args = parser.parse_args()
+
+    if args.compare:
+        results = compare(args)
+    elif args.pid:
+        results = {"running": report(args.pid)}
+        print_report(f"gunicorn master {args.pid}", results["running"])
+    else:
+        parser.error("either --pid or --compare is required")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    output_file = os.path.join(args.output_dir, f"{timestamp}-{args.label}.json")
+    config = {k: v for k, v in vars(args).items() if k != "output_dir"}
+    with open(output_file, "w") as f_out:
+        json.dump({"timestamp": timestamp, "config": config, "results": results}, f_out, indent=2)
+    print(f"Saved the results to {output_file}")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,38 +1,47 @@
-import base64
-import json
 import os
 
 import functions_framework
-import mlflow
+import ride_codec
 from google.cloud import pubsub_v1
+from model_manager import ModelManager
 
 publisher = pubsub_v1.PublisherClient()
 PROJECT_ID = os.getenv("PROJECT_ID", "mlops-demo-408506")
 TOPIC_NAME = os.getenv("PUBLISH_STREAM", "ride-predictions")
 topic_path = publisher.topic_path(PROJECT_ID, TOPIC_NAME)
 
-# Load model
+# Model registry settings
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "sqlite:///mlflow.db")
+MODEL_NAME = os.getenv("MODEL_NAME", "nyc-taxi-regressor")
+MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", "30"))
+
+# Served until a version of MODEL_NAME is promoted to MODEL_STAGE
 EXPERIMENT_ID = 1
 RUN_ID = "553def03f5224f649fe56bc1567daccc"
 logged_model = f"gs://pytholic-mlops-zoomcamp-artifacts/{EXPERIMENT_ID}/{RUN_ID}/artifacts/model"
-model = mlflow.pyfunc.load_model(logged_model)
-
 
-def prepare_features(ride):
-    features = {}
-    features["PU_DO"] = "{}_{}".format(ride["PULocationID"], ride["DOLocationID"])
-    features["trip_distance"] = ride["trip_distance"]
-    return features
+# Load model, new versions are picked up in the background
+manager = ModelManager(
+    MODEL_NAME,
+    stage=MODEL_STAGE,
+    tracking_uri=MLFLOW_TRACKING_URI,
+    poll_interval=MODEL_POLL_INTERVAL,
+    fallback_uri=logged_model,
+    fallback_version=RUN_ID,
+)
+manager.start()
 
 
-def predict(features):
-    pred = model.predict(features)
+def predict(ride, featurizer, model):
+    # The ride is featurized from its location IDs, see features.py
+    pred = model.predict(featurizer.transform_rides([ride]))
     return pred[0]
 
 
 def publish_to_topic(project_id, topic_name, message_json):
     # Encode the message json
-    message_encoded = json.dumps(message_json).encode("utf-8")
+    message_encoded = ride_codec.dumps(message_json)
     # Publish the message to the topic
     future = publisher.publish(topic_path, data=message_encoded)
     # Verify that the message has arrived
@@ -41,15 +50,17 @@ def publish_to_topic(project_id, topic_name, message_json):
 
 @functions_framework.cloud_event
 def predict_duration(cloud_event):
-    decoded = base64.b64decode(cloud_event.data["message"]["data"])
-    data = json.loads(decoded)
-    ride = data["ride"]
-    ride_id = data["ride_id"]
-    features = prepare_features(ride)
-    predicted_duration = round(predict(features))
+    try:
+        ride, ride_id = ride_codec.decode_message(cloud_event.data["message"]["data"])
+    except ride_codec.ValidationError as e:
+        # Acknowledge malformed messages instead of having Pub/Sub redeliver them forever
+        print(f"Dropping invalid message {cloud_event['id']}: {e}")
+        return None
+    model_version, featurizer, model = manager.current()
+    predicted_duration = round(predict(ride, featurizer, model))
     prediction = {
         "model": "ride_duration_prediction_model",
-        "version": 123,
+        "version": model_version,
         "prediction": {"ride_duration": predicted_duration, "ride_id": ride_id},
     }
 
@@ -0,0 +1,555 @@
+"""Local streaming runtime of the ride duration prediction, for running and profiling offline.
+
+`cloud_function.py` only runs inside Cloud Functions with a Pub/Sub trigger. This runtime runs
+the same path as a pipeline of asyncio stages in one process:
+
+    source -> decode -> featurize -> predict -> sink
+
+The stages are connected by bounded queues. When a stage falls behind, the queue in front of
+it fills up and the stages upstream wait on it, down to the source, which stops reading.
+Memory stays bounded, and the stage that makes everything wait is the bottleneck.
+
+- `decode` validates every message with `ride_codec`. Invalid messages are acknowledged and
+  dropped, like the cloud function does.
+- `featurize` collects up to `batch_size` waiting rides and transforms them in one call.
+- `predict` runs the model in a worker thread, so the event loop keeps feeding the stages.
+- `sink` writes the predictions, then acknowledges their messages.
+
+Sources and sinks are pluggable: a JSONL file replay, an in-memory queue, and Pub/Sub. Point
+the Pub/Sub clients at the emulator with `PUBSUB_EMULATOR_HOST`. A message is the JSON the
+cloud function receives, `{"ride": {...}, "ride_id": 123}`, without the base64 encoding.
+
+Every stage reports its throughput, its busy time, the time it waited on the next queue, and
+the depth of its input queue. Depths are counted in messages.
+
+Usage:
+    python stream_pipeline.py export ../../data/green_tripdata_2021-01.parquet rides.jsonl
+    python stream_pipeline.py run --source jsonl:rides.jsonl --sink jsonl:predictions.jsonl
+    python stream_pipeline.py run --source memory:../../data/green_tripdata_2021-01.parquet \\
+        --sink memory --batch-size 200 --queue-size 2000
+    PUBSUB_EMULATOR_HOST=localhost:8085 python stream_pipeline.py run \\
+        --source pubsub:rides-sub --topic rides --sink pubsub:ride-predictions
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import threading
+import time
+
+import pandas as pd
+import ride_codec
+from model_bundle import load_bundle
+
+PROJECT_ID = os.getenv("PROJECT_ID", "mlops-demo-408506")
+MODEL_FILE = os.getenv("MODEL_FILE", "../web-service/lin_reg.bundle")
+RIDE_COLUMNS = ["PULocationID", "DOLocationID", "trip_distance"]
+
+QUEUE_SIZE = 1000
+BATCH_SIZE = 100
+REPORT_INTERVAL = 5.0
+SAMPLE_INTERVAL = 0.05
+
+# Put into a queue after the last message
+END = None
+
+
+class JsonlSource:
+    """Replay a file with one message per line, at `rate` messages per second or flat out."""
+
+    def __init__(self, path: str, rate: float = None, limit: int = None):
+        self.path = path
+        self.rate = rate
+        self.limit = limit
+
+    async def messages(self):
+        start = time.perf_counter()
+        with open(self.path, "rb") as f_in:
+            for i, line in enumerate(itertools.islice(f_in, self.limit)):
+                if self.rate:
+                    delay = start + i / self.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                yield line, None
+
+
+class MemorySource:
+    """Messages put into an in-memory queue by the caller, until `END` is put.
+
+    Without a queue, one is made with `messages` followed by `END` when the pipeline starts.
+    """
+
+    def __init__(self, queue: asyncio.Queue = None, messages=()):
+        self.queue = queue
+        self.preloaded = messages
+
+    async def messages(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            for message in self.preloaded:
+                self.queue.put_nowait(message)
+            self.queue.put_nowait(END)
+        while True:
+            message = await self.queue.get()
+            if message is END:
+                return
+            yield message, None
+
+
+class PubSubSource:
+    """Pull messages from a Pub/Sub subscription, acknowledged once they reach the sink.
+
+    With `topic`, the topic and the subscription are created if they do not exist, which the
+    emulator needs after every start.
+    """
+
+    def __init__(
+        self,
+        subscription: str,
+        project_id: str = PROJECT_ID,
+        topic: str = None,
+        max_messages: int = None,
+        prefetch: int = QUEUE_SIZE,
+    ):
+        self.subscription = subscription
+        self.project_id = project_id
+        self.topic = topic
+        self.max_messages = max_messages
+        self.prefetch = prefetch
+
+    def _create(self, subscriber, subscription_path):
+        from google.api_core.exceptions import AlreadyExists
+        from google.cloud import pubsub_v1
+
+        topic_path = subscriber.topic_path(self.project_id, self.topic)
+        try:
+            pubsub_v1.PublisherClient().create_topic(request={"name": topic_path})
+        except AlreadyExists:
+            pass
+        try:
+            subscriber.create_subscription(
+                request={"name": subscription_path, "topic": topic_path}
+            )
+        except AlreadyExists:
+            pass
+
+    async def messages(self):
+        from google.cloud import pubsub_v1
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.prefetch)
+        closing = threading.Event()
+        subscriber = pubsub_v1.SubscriberClient()
+        subscription_path = subscriber.subscription_path(self.project_id, self.subscription)
+        if self.topic:
+            self._create(subscriber, subscription_path)
+
+        def callback(message):
+            # Runs in a subscriber thread, and blocks it while the pipeline is full
+            while not closing.is_set():
+                put = asyncio.wait_for(queue.put(message), timeout=1.0)
+                try:
+                    asyncio.run_coroutine_threadsafe(put, loop).result()
+                    return
+                except asyncio.TimeoutError:
+                    continue
+            message.nack()
+
+        flow_control = pubsub_v1.types.FlowControl(max_messages=self.prefetch)
+        streaming_pull = subscriber.subscribe(subscription_path, callback, flow_control)
+        try:
+            received = 0
+            while self.max_messages is None or received < self.max_messages:
+                message = await queue.get()
+                received += 1
+                yield message.data, message.ack
+        finally:
+            # Messages not handed to the pipeline are redelivered
+            closing.set()
+            while not queue.empty():
+                queue.get_nowait().nack()
+            streaming_pull.cancel()
+            await asyncio.to_thread(streaming_pull.result)
+            subscriber.close()
+
+
+class JsonlSink:
+    def __init__(self, path: str):
+        self.f_out = open(path, "wb")
+
+    async def write(self, predictions):
+        self.f_out.write(b"".join(ride_codec.dumps(p) + b"\n" for p in predictions))
+
+    async def close(self):
+        self.f_out.close()
+
+
+class MemorySink:
+    """Keep the predictions in `results`, or put them into `queue` for a consumer."""
+
+    def __init__(self, queue: asyncio.Queue = None):
+        self.queue = queue
+        self.results = []
+
+    async def write(self, predictions):
+        if self.queue is None:
+            self.results.extend(predictions)
+            return
+        for prediction in predictions:
+            await self.queue.put(prediction)
+
+    async def close(self):
+        if self.queue is not None:
+            await self.queue.put(END)
+
+
+class PubSubSink:
+    def __init__(self, topic: str, project_id: str = PROJECT_ID):
+        from google.cloud import pubsub_v1
+
+        self.publisher = pubsub_v1.PublisherClient()
+        self.topic_path = self.publisher.topic_path(project_id, topic)
+
+    async def write(self, predictions):
+        # Wait until Pub/Sub has every prediction before their messages are acknowledged
+        futures = [
+            self.publisher.publish(self.topic_path, data=ride_codec.dumps(prediction))
+            for prediction in predictions
+        ]
+        await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+
+    async def close(self):
+        await asyncio.to_thread(self.publisher.stop)
+
+
+class StageStats:
+    """Counters of one stage and of the queue in front of it."""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.messages = 0
+        self.busy_s = 0.0
+        self.blocked_s = 0.0  # waiting for room in the next queue
+        self.depth = 0  # messages waiting in the input queue
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._samples = 0
+
+    def queued(self, n: int):
+        self.depth += n
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def sample(self):
+        self._depth_sum += self.depth
+        self._samples += 1
+
+    @property
+    def mean_depth(self) -> float:
+        return self._depth_sum / max(self._samples, 1)
+
+    def to_dict(self, elapsed: float) -> dict:
+        return {
+            "stage": self.name,
+            "messages": self.messages,
+            "throughput": self.messages / elapsed,
+            "busy": self.busy_s / elapsed,
+            "blocked": self.blocked_s / elapsed,
+            "depth": self.depth,
+            "mean_depth": self.mean_depth,
+            "max_depth": self.max_depth,
+            "capacity": self.capacity,
+        }
+
+
+class StreamPipeline:
+    """source -> decode -> featurize -> predict -> sink over bounded queues.
+
+    `featurize(rides)` builds the model input of a list of rides and `predict(X)` returns
+    one duration per ride.
+    """
+
+    STAGES = ("source", "decode", "featurize", "predict", "sink")
+
+    def __init__(
+        self,
+        source,
+        sink,
+        featurize,
+        predict,
+        model_version: str = None,
+        queue_size: int = QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+        report_interval: float = REPORT_INTERVAL,
+    ):
+        self.source = source
+        self.sink = sink
+        self.featurize = featurize
+        self.predict = predict
+        self.model_version = model_version
+        self.batch_size = batch_size
+        self.report_interval = report_interval
+        self.queue_size = queue_size
+        self.queues = {}
+        self.stats = {name: StageStats(name, queue_size) for name in self.STAGES}
+        self.stats["source"].capacity = 0
+        self.dropped = 0
+        self.elapsed = 0.0
+
+    async def _put(self, stage: str, item, n: int = 1):
+        """Hand `n` messages to `stage`, waiting while its queue is full."""
+        start = time.perf_counter()
+        await self.queues[stage].put(item)
+        self.stats[self.STAGES[self.STAGES.index(stage) - 1]].blocked_s += (
+            time.perf_counter() - start
+        )
+        self.stats[stage].queued(n)
+
+    async def _get_batch(self, stage: str):
+        """Wait for a message, then take the ones already waiting, up to `batch_size`."""
+        queue = self.queues[stage]
+        batch = [await queue.get()]
+        while len(batch) < self.batch_size and not queue.empty() and batch[-1] is not END:
+            batch.append(queue.get_nowait())
+        return batch
+
+    async def _source(self):
+        stats = self.stats["source"]
+        async for message in self.source.messages():
+            stats.messages += 1
+            await self._put("decode", message)
+        await self.queues["decode"].put(END)
+
+    async def _decode(self):
+        stats = self.stats["decode"]
+        while True:
+            batch = await self._get_batch("decode")
+            start = time.perf_counter()
+            decoded = []
+            for item in batch:
+                if item is END:
+                    break
+                data, ack = item
+                try:
+                    ride, ride_id = ride_codec.decode_payload(data)
+                except ride_codec.ValidationError:
+                    self.dropped += 1
+                    if ack is not None:
+                        ack()
+                    continue
+                decoded.append((ride, ride_id, ack))
+            stats.depth -= len(batch) - (batch[-1] is END)
+            stats.messages += len(batch) - (batch[-1] is END)
+            stats.busy_s += time.perf_counter() - start
+            for item in decoded:
+                await self._put("featurize", item)
+            if batch[-1] is END:
+                await self.queues["featurize"].put(END)
+                return
+
+    async def _featurize(self):
+        stats = self.stats["featurize"]
+        while True:
+            batch = await self._get_batch("featurize")
+            done = batch[-1] is END
+            if done:
+                batch.pop()
+            if batch:
+                stats.depth -= len(batch)
+                start = time.perf_counter()
+                X = self.featurize([ride for ride, _, _ in batch])
+                stats.messages += len(batch)
+                stats.busy_s += time.perf_counter() - start
+                ride_ids = [ride_id for _, ride_id, _ in batch]
+                acks = [ack for _, _, ack in batch]
+                await self._put("predict", (X, ride_ids, acks), len(batch))
+            if done:
+                await self.queues["predict"].put(END)
+                return
+
+    def _timed_predict(self, X):
+        # Timed in the worker thread, the wait for it is not the model's time
+        start = time.perf_counter()
+        durations = self.predict(X)
+        return durations, time.perf_counter() - start
+
+    async def _predict(self):
+        stats = self.stats["predict"]
+        while True:
+            item = await self.queues["predict"].get()
+            if item is END:
+                await self.queues["sink"].put(END)
+                return
+            X, ride_ids, acks = item
+            stats.depth -= len(ride_ids)
+            durations, predict_s = await asyncio.to_thread(self._timed_predict, X)
+            start = time.perf_counter()
+            predictions = [
+                {
+                    "model": "ride_duration_prediction_model",
+                    "version": self.model_version,
+                    "prediction": {"ride_duration": duration, "ride_id": ride_id},
+                }
+                for duration, ride_id in zip(durations.round().astype(int).tolist(), ride_ids)
+            ]
+            stats.messages += len(ride_ids)
+            stats.busy_s += predict_s + time.perf_counter() - start
+            await self._put("sink", (predictions, acks), len(ride_ids))
+
+    async def _sink(self):
+        stats = self.stats["sink"]
+        while True:
+            item = await self.queues["sink"].get()
+            if item is END:
+                await self.sink.close()
+                return
+            predictions, acks = item
+            stats.depth -= len(predictions)
+            start = time.perf_counter()
+            await self.sink.write(predictions)
+            for ack in acks:
+                if ack is not None:
+                    ack()
+            stats.messages += len(predictions)
+            stats.busy_s += time.perf_counter() - start
+
+    async def _monitor(self, start: float):
+        last_report = start
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            for stats in self.stats.values():
+                stats.sample()
+            now = time.perf_counter()
+            if self.report_interval and now - last_report >= self.report_interval:
+                last_report = now
+                print(f"after {now - start:.0f}s")
+                print(self.report(now - start, header=False))
+
+    def report(self, elapsed: float, header: bool = True) -> str:
+        lines = []
+        if header:
+            lines.append(
+                f"{'stage':<10} {'messages':>9} {'msg/s':>9} {'busy':>6} {'blocked':>8} "
+                f"{'queue':>6} {'mean':>7} {'max':>6} {'size':>6}"
+            )
+        for stats in self.stats.values():
+            s = stats.to_dict(elapsed)
+            lines.append(
+                f"{s['stage']:<10} {s['messages']:>9} {s['throughput']:>9.0f} {s['busy']:>6.0%} "
+                f"{s['blocked']:>8.0%} {s['depth']:>6} {s['mean_depth']:>7.1f} "
+                f"{s['max_depth']:>6} {s['capacity']:>6}"
+            )
+        return "\n".join(lines)
+
+    async def run(self) -> dict:
+        """Run until the source is exhausted and every message reached the sink."""
+        # The queues after featurize hold batches, sized for about `queue_size` messages
+        batch_slots = max(self.queue_size // self.batch_size, 1)
+        self.queues = {
+            "decode": asyncio.Queue(self.queue_size),
+            "featurize": asyncio.Queue(self.queue_size),
+            "predict": asyncio.Queue(batch_slots),
+            "sink": asyncio.Queue(batch_slots),
+        }
+        start = time.perf_counter()
+        monitor = asyncio.create_task(self._monitor(start))
+        try:
+            await asyncio.gather(
+                self._source(), self._decode(), self._featurize(), self._predict(), self._sink()
+            )
+        finally:
+            monitor.cancel()
+        self.elapsed = time.perf_counter() - start
+        return {
+            "elapsed": self.elapsed,
+            "dropped": self.dropped,
+            "stages": [stats.to_dict(self.elapsed) for stats in self.stats.values()],
+        }
+
+
+def read_messages(path: str, limit: int = None):
+    """The rides of a trip data parquet file as Pub/Sub message payloads."""
+    df = pd.read_parquet(path, columns=RIDE_COLUMNS).dropna()
+    df = df.astype({"PULocationID": int, "DOLocationID": int, "trip_distance": float})
+    if limit:
+        df = df.head(limit)
+    return [
+        ride_codec.dumps({"ride": ride, "ride_id": i})
+        for i, ride in enumerate(df.to_dict(orient="records"))
+    ]
+
+
+def make_source(spec: str, topic: str = None, rate: float = None, limit: int = None):
+    kind, _, target = spec.partition(":")
+    if kind == "jsonl":
+        return JsonlSource(target, rate, limit)
+    if kind == "memory":
+        return MemorySource(messages=read_messages(target, limit))
+    if kind == "pubsub":
+        return PubSubSource(target, topic=topic, max_messages=limit)
+    raise ValueError(f"Unknown source {spec!r}, use jsonl:PATH, memory:PARQUET or pubsub:SUB")
+
+
+def make_sink(spec: str):
+    kind, _, target = spec.partition(":")
+    if kind == "jsonl":
+        return JsonlSink(target)
+    if kind == "memory":
+        return MemorySink()
+    if kind == "pubsub":
+        return PubSubSink(target)
+    raise ValueError(f"Unknown sink {spec!r}, use jsonl:PATH, memory or pubsub:TOPIC")
+
+
+async def run(args):
+    bundle = load_bundle(args.model)
+    pipeline = StreamPipeline(
+        make_source(args.source, args.topic, args.rate, args.limit),
+        make_sink(args.sink),
+        featurize=bundle.featurizer.transform_rides,
+        predict=bundle.model.predict,
+        model_version=bundle.version,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        report_interval=args.report_interval,
+    )
+    result = await pipeline.run()
+    print(pipeline.report(result["elapsed"]))
+    processed = pipeline.stats["sink"].messages
+    print(
+        f"{processed} predictions in {result['elapsed']:.2f}s "
+        f"({processed / result['elapsed']:.0f}/s), {result['dropped']} invalid messages dropped"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write the rides of a parquet file as JSONL")
+    export.add_argument("input")
+    export.add_argument("output")
+    export.add_argument("--limit", type=int)
+
+    run_parser = commands.add_parser("run", help="run the pipeline")
+    run_parser.add_argument(
+        "--source", required=True, help="jsonl:PATH, memory:PARQUET or pubsub:SUB"
+    )
+    run_parser.add_argument("--sink", default="memory", help="jsonl:PATH, memory, pubsub:TOPIC")
+    run_parser.add_argument("--topic", help="with a pubsub source, create it and the subscription")
+    run_parser.add_argument("--rate", type=float, help="replay rate of a jsonl source, msg/s")
+    run_parser.add_argument("--limit", type=int, help="stop after this many messages")
+    run_parser.add_argument("--model", default=MODEL_FILE)
+    run_parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    run_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    run_parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        messages = read_messages(args.input, args.limit)
+        with open(args.output, "wb") as f_out:
+            f_out.write(b"".join(message + b"\n" for message in messages))
+        print(f"Wrote {len(messages)} messages to {args.output}")
+    else:
+        asyncio.run(run(args))
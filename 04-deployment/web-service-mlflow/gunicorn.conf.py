@@ -0,0 +1,47 @@
+"""Gunicorn settings: load the model once in the master and fork the workers from it.
+
+With `preload_app` the master imports `predict.py` and loads the registry model. The workers
+are forked afterwards and share the model's pages copy-on-write. The large parts of a sklearn
+or XGBoost model are NumPy buffers, and reference counting only writes to the small object
+headers, so the buffers stay shared as long as nothing writes to them.
+
+The garbage collector is the other source of copies: a collection writes to the header of every
+tracked object it visits, which un-shares the pages the objects live on. The collector is
+therefore disabled while the app loads, and everything allocated up to then is moved to the
+permanent generation with `gc.freeze()` before forking.
+
+The model poller thread of `ModelManager` does not survive a fork. It is stopped in the master
+before forking, so no lock is held across the fork, and started again in every worker. The
+registry client of the master is not shared either: every worker drops the inherited database
+connections and builds its own client first. A model reloaded later is private to the worker
+that loads it.
+
+Set `PRELOAD_APP=0` to let every worker load its own copy, e.g. to compare the memory use with
+`../memory_report.py`.
+"""
+
+import gc
+import os
+import sys
+
+bind = os.getenv("BIND", "0.0.0.0:9696")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before the workers are forked
+    if preload_app:
+        sys.modules["predict"].manager.stop()
+        gc.freeze()
+        gc.enable()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        manager = sys.modules["predict"].manager
+        manager.after_fork()
+        manager.start()
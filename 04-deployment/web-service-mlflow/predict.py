@@ -1,12 +1,18 @@
-import mlflow
+import logging
+import os
+
+import ride_codec
 from flask import (
     Flask,
+    Response,
     jsonify,
     request,
 )
+from model_manager import ModelManager
+from prediction_cache import PredictionCache
+from serving_metrics import ServingMetrics
 
-# MLFLOW_TRACKING_URI = "http://0.0.0.0:5000"
-# mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s")
 
 # # Load dict vectorizer
 # client = MlflowClient(MLFLOW_TRACKING_URI)
@@ -16,40 +22,90 @@ from flask import (
 # with open(path, 'rb') as f_in:
 #     dv = pickle.load(f_in)
 
-# Load model
+# Model registry settings
+MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI", "sqlite:///mfllow.db")
+MODEL_NAME = os.getenv("MODEL_NAME", "nyc-taxi-regressor")
+MODEL_STAGE = os.getenv("MODEL_STAGE", "Production")
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", "30"))
+
+# Served until a version of MODEL_NAME is promoted to MODEL_STAGE
 EXPERIMENT_ID = 1
 RUN_ID = "553def03f5224f649fe56bc1567daccc"
 logged_model = f"gs://pytholic-mlops-zoomcamp-artifacts/{EXPERIMENT_ID}/{RUN_ID}/artifacts/model"
 # logged_model = f'runs:/{RUN_ID}/model'
-model = mlflow.pyfunc.load_model(logged_model)
 
+# Load model, new versions are picked up in the background
+manager = ModelManager(
+    MODEL_NAME,
+    stage=MODEL_STAGE,
+    tracking_uri=MLFLOW_TRACKING_URI,
+    poll_interval=MODEL_POLL_INTERVAL,
+    fallback_uri=logged_model,
+    fallback_version=RUN_ID,
+)
+manager.start()
+
+# Disabled unless PREDICTION_CACHE_SIZE is set, keys include the model version
+cache = PredictionCache.from_env()
 
-def prepare_features(ride):
-    features = {}
-    features["PU_DO"] = "{}_{}".format(ride["PULocationID"], ride["DOLocationID"])
-    features["trip_distance"] = ride["trip_distance"]
-    return features
+metrics = ServingMetrics()
 
 
-def predict(features):
-    # X = dv.transform(features) # use if not sklearn make_pipeline
-    preds = model.predict(features)
-    return float(preds[0])  # to avoid list
+def predict_batch(rides, featurizer, model, model_version):
+    # The rides are featurized from their location IDs, see features.py
+    with metrics.time("transform", model_version):
+        X = featurizer.transform_rides(rides)
+    with metrics.time("predict", model_version):
+        return model.predict(X)
+
+
+def json_response(obj, status=200, model_version=""):
+    with metrics.time("serialize", model_version):
+        body = ride_codec.dumps(obj)
+    return Response(body, status=status, mimetype="application/json")
 
 
 app = Flask("duration-prediction")
+metrics.instrument(app, model_version=lambda: manager.current()[0])
+
+
+@app.errorhandler(ride_codec.ValidationError)
+def validation_error(e):
+    return json_response({"error": str(e)}, status=400)
 
 
 @app.route("/predict", methods=["POST"])
 def predict_endpoint():
-    ride = request.get_json()
+    # Use one snapshot for the whole request, a reload may swap the model meanwhile
+    model_version, featurizer, model = manager.current()
+
+    # A single ride or a JSON array of rides
+    with metrics.time("parse", model_version):
+        rides, is_batch = ride_codec.decode_rides(request.get_data())
+
+    if is_batch:
+        preds = predict_batch(rides, featurizer, model, model_version)
+        result = {"durations": preds, "model_version": model_version}
+        return json_response(result, model_version=model_version)
+
+    def predict_ride(ride):
+        preds = predict_batch([ride], featurizer, model, model_version)
+        return float(preds[0])  # to avoid list
+
+    ride = rides[0]
+    if cache is None:
+        pred = predict_ride(ride)
+    else:
+        pred = cache.get_or_compute(model_version, ride, predict_ride)
+
+    result = {"duration": pred, "model_version": model_version}
 
-    features = prepare_features(ride)
-    pred = predict(features)
+    return json_response(result, model_version=model_version)
 
-    result = {"duration": pred, "model_version": RUN_ID}
 
-    return jsonify(result)
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats_endpoint():
+    return jsonify(cache.stats() if cache is not None else {"enabled": False})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+# Generated from shared/ride_codec.py by shared/sync.py, edit that file instead.
+"""JSON codec and request validation for the ride payload.
+
+The same payload is used by the Flask services and the streaming function:
+
+    {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66, "ride_id": 123}
+
+A request body can hold a single ride or a JSON array of rides. `orjson` is used for encoding
+and decoding when it is installed, otherwise the standard `json` module. The schema is compiled
+once into a list of per-field checks, so validating a ride is a single pass over its fields.
+"""
+
+import base64
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+RIDE_SCHEMA = {
+    "PULocationID": {"type": (int,), "minimum": 1, "maximum": 265, "required": True},
+    "DOLocationID": {"type": (int,), "minimum": 1, "maximum": 265, "required": True},
+    "trip_distance": {"type": (int, float), "minimum": 0, "required": True},
+    "ride_id": {"type": (int, str), "required": False},
+}
+
+MAX_BATCH_SIZE = 10000
+
+
+class ValidationError(ValueError):
+    pass
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _to_builtin(obj):
+    # numpy arrays and scalars returned by model.predict
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_to_builtin).encode("utf-8")
+
+
+def compile_validator(schema: dict):
+    """Turn `schema` into a function that validates one ride dict in place."""
+    checks = []
+    for name, spec in schema.items():
+        checks.append(
+            (
+                name,
+                spec["type"],
+                spec.get("minimum"),
+                spec.get("maximum"),
+                spec.get("required", False),
+            )
+        )
+
+    def validate(ride):
+        if not isinstance(ride, dict):
+            raise ValidationError("ride must be a JSON object")
+        for name, types, minimum, maximum, required in checks:
+            value = ride.get(name)
+            if value is None:
+                if required:
+                    raise ValidationError(f"'{name}' is required")
+                continue
+            # bool is a subclass of int, but `true` is never a valid location or distance
+            if isinstance(value, bool) or not isinstance(value, types):
+                raise ValidationError(f"'{name}' has an invalid type")
+            # The json fallback accepts NaN and Infinity, orjson rejects them when decoding
+            if isinstance(value, float) and not math.isfinite(value):
+                raise ValidationError(f"'{name}' must be a finite number")
+            if minimum is not None and value < minimum:
+                raise ValidationError(f"'{name}' must be >= {minimum}")
+            if maximum is not None and value > maximum:
+                raise ValidationError(f"'{name}' must be <= {maximum}")
+        return ride
+
+    return validate
+
+
+validate_ride = compile_validator(RIDE_SCHEMA)
+
+
+def decode_rides(body):
+    """Decode a request body into `(rides, is_batch)`, validating every ride."""
+    try:
+        payload = loads(body)
+    except ValueError as e:
+        raise ValidationError(f"invalid JSON: {e}") from e
+
+    if isinstance(payload, list):
+        if not payload:
+            raise ValidationError("batch has no rides")
+        if len(payload) > MAX_BATCH_SIZE:
+            raise ValidationError(f"batch is larger than {MAX_BATCH_SIZE} rides")
+        return [validate_ride(ride) for ride in payload], True
+    return [validate_ride(payload)], False
+
+
+def decode_payload(payload):
+    """Decode a JSON message `{"ride": {...}, "ride_id": ...}` into `(ride, ride_id)`."""
+    try:
+        message = loads(payload)
+    except ValueError as e:
+        raise ValidationError(f"invalid message: {e}") from e
+    if not isinstance(message, dict) or "ride" not in message:
+        raise ValidationError("'ride' is required")
+    return validate_ride(message["ride"]), message.get("ride_id")
+
+
+def decode_message(data):
+    """Decode a base64 Pub/Sub message `{"ride": {...}, "ride_id": ...}` into `(ride, ride_id)`."""
+    try:
+        payload = base64.b64decode(data)
+    except ValueError as e:
+        raise ValidationError(f"invalid message: {e}") from e
+    return decode_payload(payload)
@@ -0,0 +1,70 @@
+"""Load time and size of the model bundle compared with the pickled `(dv, model)` tuple.
+
+Loads the model `--number` times each way: unpickling `lin_reg.bin` (plus migrating the
+`DictVectorizer`, as the service did), reading the bundle into memory, and memory-mapping the
+bundle. It checks that all of them give the same predictions on a monthly trip file.
+
+Usage:
+    python benchmark_bundle.py
+    python benchmark_bundle.py --pickle lin_reg.bin --bundle lin_reg.bundle --number 50
+"""
+
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+from features import as_featurizer
+from model_bundle import load_bundle
+
+
+def load_pickle(path):
+    with open(path, "rb") as f_in:
+        dv, model = pickle.load(f_in)
+    return as_featurizer(dv), model
+
+
+def time_load(load, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        result = load()
+    return (time.perf_counter() - start) / number, result
+
+
+def run(pickle_file, bundle_file, input_file, number):
+    df = pd.read_parquet(input_file, columns=["PULocationID", "DOLocationID", "trip_distance"])
+
+    pickle_time, (featurizer, model) = time_load(lambda: load_pickle(pickle_file), number)
+    expected = model.predict(featurizer.transform_frame(df))
+
+    loaders = {
+        "pickle": (pickle_file, pickle_time),
+        "bundle (read)": (
+            bundle_file,
+            time_load(lambda: load_bundle(bundle_file, use_mmap=False), number)[0],
+        ),
+        "bundle (mmap)": (bundle_file, time_load(lambda: load_bundle(bundle_file), number)[0]),
+    }
+    bundle = load_bundle(bundle_file)
+    max_diff = np.abs(bundle.predict_frame(df) - expected).max()
+
+    print(f"{'format':<16} {'size (KB)':>10} {'load (ms)':>10} {'speedup':>8}")
+    for name, (path, seconds) in loaders.items():
+        print(
+            f"{name:<16} {os.path.getsize(path) / 1024:>10.1f} {seconds * 1000:>10.3f} "
+            f"{pickle_time / seconds:>7.1f}x"
+        )
+    print(f"Max prediction difference on {len(df)} rides: {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pickle", default="lin_reg.bin")
+    parser.add_argument("--bundle", default="lin_reg.bundle")
+    parser.add_argument("--input", default="../../data/green_tripdata_2021-02.parquet")
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    run(args.pickle, args.bundle, args.input, args.number)
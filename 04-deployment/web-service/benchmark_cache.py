@@ -0,0 +1,74 @@
+"""Replay a monthly trip file through the prediction path with and without the cache.
+
+Rides are replayed in pickup order, the way they would arrive at `/predict`. For every cache
+configuration it reports the hit rate, the time per request and the mean absolute change of the
+predictions caused by the distance quantization.
+
+Usage:
+    python benchmark_cache.py
+    python benchmark_cache.py --input ../../data/green_tripdata_2021-03.parquet --quantum 0.1 0.5
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from predict import MODEL_VERSION, predict_ride
+from prediction_cache import PredictionCache
+
+RIDE_COLUMNS = ["PULocationID", "DOLocationID", "trip_distance"]
+
+
+def load_rides(filename, limit):
+    df = pd.read_parquet(filename, columns=["lpep_pickup_datetime", *RIDE_COLUMNS])
+    df = df.sort_values("lpep_pickup_datetime").dropna()
+    if limit:
+        df = df.head(limit)
+    return df[RIDE_COLUMNS].to_dict(orient="records")
+
+
+def replay(rides, cache):
+    preds = np.empty(len(rides))
+    start = time.perf_counter()
+    for i, ride in enumerate(rides):
+        if cache is None:
+            preds[i] = predict_ride(ride)
+        else:
+            preds[i] = cache.get_or_compute(MODEL_VERSION, ride, predict_ride)
+    return time.perf_counter() - start, preds
+
+
+def run(input_file, limit, sizes, quanta, ttl):
+    rides = load_rides(input_file, limit)
+    print(f"Replaying {len(rides)} rides from {input_file}")
+
+    baseline_time, baseline_preds = replay(rides, None)
+    header = ["size", "quantum", "hit rate", "us/req", "speedup", "|dpred|"]
+    print(" ".join(f"{name:>9}" for name in header))
+    baseline_us = baseline_time / len(rides) * 1e6
+    print(f"{'-':>9} {'-':>9} {'-':>9} {baseline_us:>9.1f} {'1.00x':>9} {0:>9.3f}")
+
+    for size in sizes:
+        for quantum in quanta:
+            cache = PredictionCache(maxsize=size, ttl=ttl, distance_quantum=quantum)
+            elapsed, preds = replay(rides, cache)
+            stats = cache.stats()
+            error = np.abs(preds - baseline_preds).mean()
+            print(
+                f"{size:>9} {quantum:>9} {stats['hit_rate']:>9.1%} "
+                f"{elapsed / len(rides) * 1e6:>9.1f} {baseline_time / elapsed:>8.2f}x "
+                f"{error:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", default="../../data/green_tripdata_2021-02.parquet")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--quantum", type=float, nargs="+", default=[0.1, 0.5, 1.0])
+    parser.add_argument("--ttl", type=float, default=300.0)
+    args = parser.parse_args()
+
+    run(args.input, args.limit, args.sizes, args.quantum, args.ttl)
@@ -0,0 +1,84 @@
+"""Microbenchmark of the per-request encode/decode cost of the ride payload.
+
+Compares the plain `json` path the services used before (`json.loads` without validation,
+`json.dumps` of the result) with `ride_codec` on both JSON backends. It also measures the
+Pub/Sub message path and the per-ride cost of batch payloads.
+
+Usage:
+    python benchmark_codec.py
+    python benchmark_codec.py --number 200000
+"""
+
+import argparse
+import base64
+import json
+import timeit
+
+import ride_codec
+
+RIDE = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66, "ride_id": 123}
+RESULT = {"duration": 12.345678, "model_version": "553def03f5224f649fe56bc1567daccc"}
+
+
+def report(name, seconds, number, per=1):
+    print(f"{name:<40} {seconds / number / per * 1e6:>8.2f} us")
+
+
+def run(number):
+    body = json.dumps(RIDE).encode("utf-8")
+    message = base64.b64encode(json.dumps({"ride": RIDE, "ride_id": 123}).encode("utf-8"))
+
+    backends = ["json"]
+    if ride_codec.orjson is not None:
+        backends.append("orjson")
+    fast_json = ride_codec.orjson
+
+    print(f"{'single ride':<40} {'per request':>11}")
+    report("json.loads", timeit.timeit(lambda: json.loads(body), number=number), number)
+    report("json.dumps", timeit.timeit(lambda: json.dumps(RESULT), number=number), number)
+    report(
+        "validate_ride",
+        timeit.timeit(lambda: ride_codec.validate_ride(RIDE), number=number),
+        number,
+    )
+
+    for backend in backends:
+        ride_codec.orjson = fast_json if backend == "orjson" else None
+        report(
+            f"decode_rides [{backend}]",
+            timeit.timeit(lambda: ride_codec.decode_rides(body), number=number),
+            number,
+        )
+        report(
+            f"dumps [{backend}]",
+            timeit.timeit(lambda: ride_codec.dumps(RESULT), number=number),
+            number,
+        )
+        report(
+            f"decode_message [{backend}]",
+            timeit.timeit(lambda: ride_codec.decode_message(message), number=number),
+            number,
+        )
+
+    print(f"\n{'batch payload':<40} {'per ride':>11}")
+    for size in (10, 100, 1000):
+        batch = json.dumps([RIDE] * size).encode("utf-8")
+        n = max(number // size, 10)
+        for backend in backends:
+            ride_codec.orjson = fast_json if backend == "orjson" else None
+            report(
+                f"decode_rides x{size} [{backend}]",
+                timeit.timeit(lambda: ride_codec.decode_rides(batch), number=n),
+                n,
+                per=size,
+            )
+
+    ride_codec.orjson = fast_json
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    run(args.number)
@@ -0,0 +1,32 @@
+"""Gunicorn settings: load the model once in the master and fork the workers from it.
+
+With `preload_app` the master imports `predict.py`, which memory-maps the model bundle, and
+the workers are forked afterwards. The bundle arrays are read-only views of the file, so every
+worker uses the same physical pages. Reference counting only writes to the small array
+headers, never to the pages holding the data.
+
+The garbage collector is the other source of copies: a collection writes to the header of every
+tracked object it visits, which un-shares the pages the objects live on. The collector is
+therefore disabled while the app loads, and everything allocated up to then is moved to the
+permanent generation with `gc.freeze()` before forking.
+
+Set `PRELOAD_APP=0` to let every worker load its own copy, e.g. to compare the memory use with
+`../memory_report.py`.
+"""
+
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:9696")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before the workers are forked
+    if preload_app:
+        gc.freeze()
+        gc.enable()
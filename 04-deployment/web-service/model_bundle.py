@@ -0,0 +1,271 @@
+# Generated from shared/model_bundle.py by shared/sync.py, edit that file instead.
+"""Compact, versioned model bundle, replacing pickled `(dv, model)` tuples.
+
+A bundle is one file holding everything needed to predict:
+
+    magic | format version, header length | JSON header | aligned NumPy arrays | blobs
+
+The JSON header holds the metadata (run ID, training date, ...), the featurizer and model
+settings, and the dtype, shape and offset of every array. The arrays are the featurizer
+vocabulary and the linear model coefficients. An XGBoost booster is stored as a UBJSON blob.
+
+`load_bundle` memory-maps the file and wraps the arrays with `np.frombuffer`, so nothing is
+copied or unpickled: several worker processes loading the same file share one copy of the
+arrays in the page cache. A booster is parsed by XGBoost into its own memory.
+
+Usage:
+    python model_bundle.py convert lin_reg.bin lin_reg.bundle
+    python model_bundle.py info lin_reg.bundle
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+from datetime import datetime
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import features
+except ImportError:  # bundles without a featurizer, e.g. the monitoring model
+    features = None
+
+try:
+    import xgboost as xgb
+except ImportError:
+    xgb = None
+
+MAGIC = b"RIDEMDL\0"
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct("<8sII")  # magic, format version, header length
+ALIGNMENT = 64
+
+
+class LinearModel:
+    """`X @ coef + intercept`, the prediction of any sklearn linear regressor."""
+
+    def __init__(self, coef, intercept, feature_names=None):
+        self.coef = coef
+        self.intercept = float(intercept)
+        self.feature_names = feature_names
+
+    def predict(self, X):
+        if sp.issparse(X):
+            return X @ self.coef + self.intercept
+        if self.feature_names is not None and hasattr(X, "columns"):
+            X = X[self.feature_names]
+        return np.asarray(X, dtype=np.float64) @ self.coef + self.intercept
+
+
+class XGBoostModel:
+    def __init__(self, booster):
+        self.booster = booster
+
+    def predict(self, X):
+        return self.booster.inplace_predict(X)
+
+
+class ModelBundle:
+    def __init__(self, featurizer, model, metadata, version, buffer=None):
+        self.featurizer = featurizer
+        self.model = model
+        self.metadata = metadata
+        self.version = version
+        self._buffer = buffer  # keeps the memory map of the arrays open
+
+    def predict(self, X):
+        """Predict from an already featurized matrix, or from raw columns without featurizer."""
+        return self.model.predict(X)
+
+    def predict_frame(self, df):
+        if self.featurizer is None:
+            return self.model.predict(df)
+        return self.model.predict(self.featurizer.transform_frame(df))
+
+    def predict_rides(self, rides):
+        return self.model.predict(self.featurizer.transform_rides(rides))
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _featurizer_section(featurizer):
+    if featurizer is None:
+        return None, {}
+    featurizer = features.as_featurizer(featurizer)
+    section = {"numerical": list(featurizer.numerical), "n_features": featurizer.n_features}
+    arrays = {"numerical_columns": featurizer.numerical_columns}
+    if isinstance(featurizer, features.HashingFeaturizer):
+        section.update(
+            kind="hashing", width=featurizer.width, alternate_sign=featurizer.alternate_sign
+        )
+    else:
+        section["kind"] = "vocabulary"
+        arrays.update(vocabulary=featurizer.vocabulary, columns=featurizer.columns)
+    return section, arrays
+
+
+def _model_section(model):
+    if xgb is not None and hasattr(model, "get_booster"):
+        model = model.get_booster()
+    if xgb is not None and isinstance(model, (xgb.Booster, XGBoostModel)):
+        booster = model.booster if isinstance(model, XGBoostModel) else model
+        return {"kind": "xgboost"}, {}, {"booster": bytes(booster.save_raw(raw_format="ubj"))}
+
+    if isinstance(model, LinearModel):
+        coef, intercept, names = model.coef, model.intercept, model.feature_names
+    elif hasattr(model, "coef_") and np.ndim(model.coef_) == 1:
+        coef, intercept = model.coef_, model.intercept_
+        names = getattr(model, "feature_names_in_", None)
+    else:
+        raise TypeError(f"Cannot bundle a {type(model).__name__} model")
+
+    section = {
+        "kind": "linear",
+        "intercept": float(intercept),
+        "feature_names": None if names is None else [str(name) for name in names],
+    }
+    return section, {"coef": np.asarray(coef, dtype=np.float64)}, {}
+
+
+def save_bundle(path: str, featurizer, model, metadata: dict = None) -> str:
+    """Write `featurizer` (or None) and `model` to a bundle at `path`, return its version."""
+    featurizer_section, arrays = _featurizer_section(featurizer)
+    model_section, model_arrays, blobs = _model_section(model)
+    arrays.update(model_arrays)
+
+    # Lay out the data section, every array and blob starts on an aligned offset
+    layout, chunks, offset = {"arrays": {}, "blobs": {}}, [], 0
+    for kind, items in (("arrays", arrays), ("blobs", blobs)):
+        for name, value in items.items():
+            data = np.ascontiguousarray(value).tobytes() if kind == "arrays" else value
+            offset = _align(offset)
+            entry = {"offset": offset, "nbytes": len(data)}
+            if kind == "arrays":
+                entry.update(dtype=value.dtype.str, shape=list(value.shape))
+            layout[kind][name] = entry
+            chunks.append((offset, data))
+            offset += len(data)
+
+    # The version changes with the model, not with the time it was saved
+    digest = hashlib.sha256(json.dumps([featurizer_section, model_section, layout]).encode())
+    for _, data in chunks:
+        digest.update(data)
+    header = {
+        "format_version": FORMAT_VERSION,
+        "version": digest.hexdigest()[:16],
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "metadata": metadata or {},
+        "featurizer": featurizer_section,
+        "model": model_section,
+        **layout,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(PREAMBLE.size + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f_out:
+        f_out.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f_out.write(header_bytes)
+        for chunk_offset, data in chunks:
+            f_out.seek(data_start + chunk_offset)
+            f_out.write(data)
+        f_out.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return header["version"]
+
+
+def read_header(buffer) -> dict:
+    magic, format_version, header_length = PREAMBLE.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a model bundle")
+    if format_version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported model bundle format version {format_version}")
+    header = json.loads(bytes(buffer[PREAMBLE.size : PREAMBLE.size + header_length]))
+    header["data_start"] = _align(PREAMBLE.size + header_length)
+    return header
+
+
+def _load_featurizer(section, arrays):
+    if section is None:
+        return None
+    if section["kind"] == "hashing":
+        featurizer = features.HashingFeaturizer(
+            section["width"], section["numerical"], section["alternate_sign"]
+        )
+    else:
+        featurizer = features.RideFeaturizer(section["numerical"])
+        featurizer.vocabulary = arrays["vocabulary"]
+        featurizer.columns = arrays["columns"]
+    featurizer.numerical_columns = arrays["numerical_columns"]
+    featurizer.n_features = section["n_features"]
+    return featurizer
+
+
+def load_bundle(path: str, use_mmap: bool = True) -> ModelBundle:
+    """Load a bundle, with the arrays as read-only views of the memory-mapped file."""
+    with open(path, "rb") as f_in:
+        if use_mmap:
+            buffer = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = f_in.read()
+
+    header = read_header(buffer)
+    data_start = header["data_start"]
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"]))
+        offset = data_start + entry["offset"]
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+        arrays[name] = array.reshape(entry["shape"])
+
+    section = header["model"]
+    if section["kind"] == "xgboost":
+        entry = header["blobs"]["booster"]
+        start = data_start + entry["offset"]
+        booster = xgb.Booster()
+        booster.load_model(bytearray(buffer[start : start + entry["nbytes"]]))
+        model = XGBoostModel(booster)
+    else:
+        model = LinearModel(arrays["coef"], section["intercept"], section["feature_names"])
+
+    featurizer = _load_featurizer(header["featurizer"], arrays)
+    return ModelBundle(featurizer, model, header["metadata"], header["version"], buffer)
+
+
+def convert(input_file: str, output_file: str) -> None:
+    """Convert a pickled `(preprocessor, model)` tuple or a pickled model to a bundle."""
+    obj = joblib.load(input_file)
+    featurizer, model = obj if isinstance(obj, tuple) else (None, obj)
+    metadata = {"source": os.path.basename(input_file)}
+    version = save_bundle(output_file, featurizer, model, metadata)
+    print(f"Saved {output_file} ({os.path.getsize(output_file)} bytes), version {version}")
+
+
+def info(path: str) -> None:
+    with open(path, "rb") as f_in:
+        header = read_header(f_in.read())
+    print(json.dumps(header, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert and inspect model bundles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert")
+    convert_parser.add_argument("input_file")
+    convert_parser.add_argument("output_file")
+    info_parser = subparsers.add_parser("info")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert(args.input_file, args.output_file)
+    else:
+        info(args.path)
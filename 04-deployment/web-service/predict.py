@@ -1,41 +1,80 @@
-import pickle
+import os
 
+import ride_codec
 from flask import (
     Flask,
+    Response,
     jsonify,
     request,
 )
+from model_bundle import load_bundle
+from prediction_cache import PredictionCache
+from serving_metrics import ServingMetrics
 
-with open("lin_reg.bin", "rb") as f_in:
-    (dv, model) = pickle.load(f_in)
+# Memory-mapped, so all workers on a host share one copy of the arrays, see model_bundle.py
+bundle = load_bundle(os.getenv("MODEL_FILE", "lin_reg.bundle"))
+featurizer, model = bundle.featurizer, bundle.model
 
+# Changes whenever the model is replaced, so cached predictions never outlive their model
+MODEL_VERSION = bundle.version
 
-def prepare_features(ride):
-    features = {}
-    features["PU_DO"] = "{}_{}".format(ride["PULocationID"], ride["DOLocationID"])
-    features["trip_distance"] = ride["trip_distance"]
-    return features
+# Disabled unless PREDICTION_CACHE_SIZE is set
+cache = PredictionCache.from_env()
 
+metrics = ServingMetrics()
 
-def predict(features):
-    X = dv.transform(features)
-    preds = model.predict(X)
+
+def predict_batch(rides):
+    with metrics.time("transform", MODEL_VERSION):
+        X = featurizer.transform_rides(rides)
+    with metrics.time("predict", MODEL_VERSION):
+        return model.predict(X)
+
+
+def predict_ride(ride):
+    preds = predict_batch([ride])
     return preds[0]  # to avoid list
 
 
+def json_response(obj, status=200):
+    with metrics.time("serialize", MODEL_VERSION):
+        body = ride_codec.dumps(obj)
+    return Response(body, status=status, mimetype="application/json")
+
+
 app = Flask("duration-prediction")
+metrics.instrument(app, model_version=lambda: MODEL_VERSION)
+
+
+@app.errorhandler(ride_codec.ValidationError)
+def validation_error(e):
+    return json_response({"error": str(e)}, status=400)
 
 
 @app.route("/predict", methods=["POST"])
 def predict_endpoint():
-    ride = request.get_json()
+    # A single ride or a JSON array of rides
+    with metrics.time("parse", MODEL_VERSION):
+        rides, is_batch = ride_codec.decode_rides(request.get_data())
+
+    if is_batch:
+        preds = predict_batch(rides)
+        return json_response({"durations": preds})
 
-    features = prepare_features(ride)
-    pred = predict(features)
+    ride = rides[0]
+    if cache is None:
+        pred = predict_ride(ride)
+    else:
+        pred = cache.get_or_compute(MODEL_VERSION, ride, predict_ride)
 
     result = {"duration": pred}
 
-    return jsonify(result)
+    return json_response(result)
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats_endpoint():
+    return jsonify(cache.stats() if cache is not None else {"enabled": False})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+# Generated from shared/prediction_cache.py by shared/sync.py, edit that file instead.
+"""In-process prediction cache for the `/predict` endpoint.
+
+A lot of traffic repeats the same (PULocationID, DOLocationID, trip_distance) combinations. The
+cache keys predictions by model version, both location IDs and the trip distance rounded to
+`distance_quantum` miles, with LRU eviction past `maxsize` entries and a TTL per entry. On a
+miss the prediction is computed on the quantized distance, so a cached value does not depend
+on which ride filled it.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    def __init__(self, maxsize: int = 10000, ttl: float = 300.0, distance_quantum: float = 0.1):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.distance_quantum = distance_quantum
+
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from `PREDICTION_CACHE_*` variables, `None` if it is disabled."""
+        maxsize = int(os.getenv("PREDICTION_CACHE_SIZE", "0"))
+        if maxsize <= 0:
+            return None
+        return cls(
+            maxsize=maxsize,
+            ttl=float(os.getenv("PREDICTION_CACHE_TTL", "300")),
+            distance_quantum=float(os.getenv("PREDICTION_CACHE_DISTANCE_QUANTUM", "0.1")),
+        )
+
+    def quantize(self, ride: dict) -> dict:
+        """Copy of `ride` with the trip distance snapped to the quantization grid."""
+        steps = round(float(ride["trip_distance"]) / self.distance_quantum)
+        return {**ride, "trip_distance": round(steps * self.distance_quantum, 6)}
+
+    def key(self, model_version, ride: dict) -> tuple:
+        steps = round(float(ride["trip_distance"]) / self.distance_quantum)
+        return (model_version, int(ride["PULocationID"]), int(ride["DOLocationID"]), steps)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, model_version, ride: dict, compute):
+        """Return the cached prediction for `ride`, or `compute(quantized_ride)` and store it."""
+        key = self.key(model_version, ride)
+        value = self.get(key)
+        if value is None:
+            # Two concurrent misses may both compute, which is cheaper than holding the lock
+            value = compute(self.quantize(ride))
+            self.put(key, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "distance_quantum": self.distance_quantum,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -8,6 +8,5 @@ url = "http://34.64.41.41/predict"  # GKE
 response = requests.post(url, json=ride)
 print(response.json())
 
-# features = predict.prepare_features(ride)
-# pred = predict.predict(ride)
+# pred = predict.predict_ride(ride)
 # print(pred)
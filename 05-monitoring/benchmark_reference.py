@@ -0,0 +1,93 @@
+"""Drift scores and report time of the monitoring job against the reference sample size.
+
+Builds stratified references of `--sizes` rides from the training month with
+`reference_builder.py`, and the full month as the baseline. Then runs `calculate_metrics` of
+the monitoring job for every day of February 2022 against each of them, and reports per size:
+
+- the mean report time per day
+- the mean absolute difference of the prediction drift score to the full-month reference
+- on how many days the prediction drift detection agrees with the full-month reference
+- the mean number of drifted columns
+
+Evidently picks the drift test by reference size: up to 1000 rows the prediction is tested with
+Kolmogorov-Smirnov (the score is a p-value), above it with the Wasserstein distance. Scores of
+references on different sides of that line are not comparable, the `test` column shows which.
+
+The current `data/reference.parquet` (the validation part of January) is reported as well.
+
+Usage:
+    python benchmark_reference.py
+    python benchmark_reference.py --sizes 500 1000 2000 5000 10000 --days 27
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from reference_builder import build_reference
+
+
+def drift_per_day(monitoring, reference, days):
+    scores, detected, drifted_columns, seconds = [], [], [], []
+    for i in range(days):
+        current_data = monitoring.daily_data[i]
+        start = time.perf_counter()
+        prediction_drift, num_drifted_columns, _ = monitoring.calculate_metrics(
+            current_data, reference
+        )
+        seconds.append(time.perf_counter() - start)
+        scores.append(prediction_drift)
+        drifted_columns.append(num_drifted_columns)
+        # The report of the last run, for the test evidently picked and its decision
+        result = monitoring.report.as_dict()["metrics"][0]["result"]
+        detected.append(result["drift_detected"])
+    return {
+        "scores": np.array(scores),
+        "detected": np.array(detected),
+        "drifted_columns": np.array(drifted_columns),
+        "seconds": np.array(seconds),
+        "test": result["stattest_name"].split()[0],
+    }
+
+
+def run(input_path, sizes, days, model_path, seed):
+    # Loads the February data and the model at import time
+    import evidently_metrics_calculation as monitoring
+
+    references = {}
+    for size in sizes:
+        start = time.perf_counter()
+        references[f"sample {size}"], _ = build_reference(input_path, size, model_path, seed)
+        print(f"Built the {size} ride sample in {time.perf_counter() - start:.2f}s")
+    references["full month"], stats = build_reference(input_path, 10**9, model_path)
+    references["reference.parquet"] = pd.read_parquet("data/reference.parquet")
+
+    results = {name: drift_per_day(monitoring, df, days) for name, df in references.items()}
+    full = results["full month"]
+
+    print(f"\n{days} days of February 2022, full month reference: {stats['rides']} rides")
+    print(
+        f"{'reference':<18} {'rows':>7} {'test':>12} {'s/day':>7} {'|Δ drift score|':>16} "
+        f"{'same decision':>14} {'drifted cols':>13}"
+    )
+    for name, result in results.items():
+        score_diff = np.abs(result["scores"] - full["scores"]).mean()
+        agreement = np.count_nonzero(result["detected"] == full["detected"])
+        print(
+            f"{name:<18} {len(references[name]):>7} {result['test']:>12} "
+            f"{result['seconds'].mean():>7.3f} {score_diff:>16.4f} {agreement:>10}/{days:<3} "
+            f"{result['drifted_columns'].mean():>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", default="data/green_tripdata_2022-01.parquet")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 5000, 10000])
+    parser.add_argument("--days", type=int, default=27)
+    parser.add_argument("--model", default="models/lin_reg.bundle")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    run(args.input, args.sizes, args.days, args.model, args.seed)
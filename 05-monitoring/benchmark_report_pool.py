@@ -0,0 +1,74 @@
+"""Throughput of the drift reports: one shared report vs the worker pool of `report_pool.py`.
+
+Runs the reports of the monitoring job for the days of February 2022 and for its first
+`--hours` hourly windows, once serially with the module-level report, and once through
+`run_reports` for every number of workers in `--jobs`. Reports the wall time, the windows per
+second, the time until the first result could be inserted, and whether the metrics are the
+same as the serial ones. The speedup is bounded by the CPU cores of the machine.
+
+Usage:
+    python benchmark_report_pool.py
+    python benchmark_report_pool.py --jobs 1 2 4 8 --hours 168
+"""
+
+import argparse
+import datetime
+import time
+
+from report_pool import run_reports
+from time_windows import TimeWindows
+
+
+def serial(monitoring, windows):
+    results, first = [], None
+    start = time.perf_counter()
+    for i in range(len(windows)):
+        results.append((windows.start(i), *monitoring.calculate_metrics(windows[i])))
+        first = first or time.perf_counter() - start
+    return results, time.perf_counter() - start, first
+
+
+def pooled(monitoring, windows, n_jobs):
+    results, first = [], None
+    start = time.perf_counter()
+    for row in run_reports(windows, monitoring.reference_data, n_jobs):
+        results.append(row)
+        first = first or time.perf_counter() - start
+    return results, time.perf_counter() - start, first
+
+
+def run(jobs, hours):
+    # Loads the February data, the reference and the model at import time
+    import evidently_metrics_calculation as monitoring
+
+    hourly = TimeWindows(
+        monitoring.raw_data,
+        "lpep_pickup_datetime",
+        monitoring.begin,
+        datetime.timedelta(hours=1),
+        count=hours,
+    )
+    print(
+        f"{'windows':<10} {'runner':<10} {'wall (s)':>9} {'windows/s':>10} {'first (s)':>10} "
+        f"{'same':>5}"
+    )
+    for name, windows in (("days", monitoring.daily_data), ("hours", hourly)):
+        expected, wall, first = serial(monitoring, windows)
+        print(
+            f"{name:<10} {'serial':<10} {wall:>9.2f} {len(windows) / wall:>10.2f} {first:>10.2f}"
+        )
+        for n_jobs in jobs:
+            results, wall, first = pooled(monitoring, windows, n_jobs)
+            print(
+                f"{name:<10} {f'{n_jobs} jobs':<10} {wall:>9.2f} {len(windows) / wall:>10.2f} "
+                f"{first:>10.2f} {str(results == expected):>5}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--hours", type=int, default=48)
+    args = parser.parse_args()
+
+    run(args.jobs, args.hours)
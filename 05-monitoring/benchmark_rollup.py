@@ -0,0 +1,189 @@
+"""Dashboard queries over a year of metrics: raw rows, raw aggregation and the rollups.
+
+Fills a scratch database with a year of synthetic monitoring metrics (one row per `--interval`
+minutes, with a daily cycle and a few drift episodes) and builds the rollups of
+`metrics_rollup.py`. Then reports:
+
+- the cost of keeping the rollups up to date, per appended metrics row
+- for dashboard ranges from 6 hours to a year, the time to read the raw rows (the current
+  Grafana panels), to aggregate them on the fly, and to read the rollup buckets, and that the
+  aggregation and the rollups return the same values
+
+Needs the PostgreSQL service of docker-compose.yml, the `test` database is not touched.
+
+Usage:
+    python benchmark_rollup.py
+    python benchmark_rollup.py --interval 1 --repeat 5
+"""
+
+import argparse
+import datetime
+import time
+
+import numpy as np
+import psycopg
+from metrics_rollup import (
+    RESOLUTIONS,
+    ROLLUP_COLUMNS,
+    aggregate_query,
+    choose_resolution,
+    create_rollup_statement,
+    query_metrics,
+    rebuild,
+    update_rollups,
+)
+
+SERVER = "host=localhost port=5432 user=postgres password=example"
+DATABASE = "rollup_benchmark"
+
+create_table_statement = """
+drop table if exists dummy_metrics;
+create table dummy_metrics(
+	timestamp timestamp,
+	prediction_drift float,
+	num_drifted_columns integer,
+	share_missing_values float
+)
+"""
+
+RANGES = {
+    "6 hours": datetime.timedelta(hours=6),
+    "1 day": datetime.timedelta(days=1),
+    "7 days": datetime.timedelta(days=7),
+    "30 days": datetime.timedelta(days=30),
+    "90 days": datetime.timedelta(days=90),
+    "1 year": datetime.timedelta(days=365),
+}
+
+
+def synthetic_metrics(begin, end, interval, rng):
+    timestamps = np.arange(
+        np.datetime64(begin), np.datetime64(end), np.timedelta64(interval, "m")
+    ).astype("datetime64[us]")
+    hours = (timestamps - timestamps[0]) / np.timedelta64(1, "h")
+    drift = 0.05 + 0.03 * np.sin(2 * np.pi * hours / 24) + rng.gamma(2, 0.01, len(hours))
+    # A few multi-day drift episodes
+    for start in rng.choice(len(hours), size=6, replace=False):
+        drift[start : start + rng.integers(1, 5) * 24 * 60 // interval] += 0.2
+    missing = rng.beta(2, 200, len(hours))
+    drifted_columns = rng.poisson(drift * 10)
+    return timestamps.astype(datetime.datetime), drift, drifted_columns, missing
+
+
+def load(conn, rows):
+    with conn.cursor() as curr:
+        with curr.copy(
+            "copy dummy_metrics(timestamp, prediction_drift, num_drifted_columns, "
+            "share_missing_values) from stdin"
+        ) as copy:
+            for row in zip(*(column.tolist() for column in rows)):
+                copy.write_row(row)
+
+
+def best_of(repeat, fn, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def raw_rows(conn, start, end):
+    return conn.execute(
+        "select timestamp, prediction_drift, share_missing_values from dummy_metrics "
+        "where timestamp >= %s and timestamp <= %s order by timestamp",
+        (start, end),
+    ).fetchall()
+
+
+def raw_aggregate(conn, start, end, unit):
+    _, step = RESOLUTIONS[unit]
+    return conn.execute(
+        aggregate_query + " order by bucket",
+        {"unit": unit, "start": start, "end": end, "step": step},
+    ).fetchall()
+
+
+def time_appends(conn, begin, appends, interval, rng):
+    """Mean insert and rollup update time of appending metrics rows one by one."""
+    _, drift, drifted_columns, missing = synthetic_metrics(
+        begin, begin + datetime.timedelta(minutes=appends * interval), interval, rng
+    )
+    insert_s, rollup_s = [], []
+    with conn.cursor() as curr:
+        for i in range(appends):
+            timestamp = begin + datetime.timedelta(minutes=i * interval)
+            start = time.perf_counter()
+            curr.execute(
+                "insert into dummy_metrics(timestamp, prediction_drift, num_drifted_columns, "
+                "share_missing_values) values (%s, %s, %s, %s)",
+                (timestamp, drift[i], int(drifted_columns[i]), missing[i]),
+            )
+            insert_s.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            update_rollups(curr, timestamp)
+            rollup_s.append(time.perf_counter() - start)
+    return np.mean(insert_s), np.mean(rollup_s)
+
+
+def run(interval, appends, repeat, seed):
+    with psycopg.connect(SERVER, autocommit=True) as conn:
+        conn.execute(f"drop database if exists {DATABASE}")
+        conn.execute(f"create database {DATABASE}")
+
+    rng = np.random.default_rng(seed)
+    begin = datetime.datetime(2022, 1, 1)
+    end = begin + datetime.timedelta(days=365)
+    with psycopg.connect(f"{SERVER} dbname={DATABASE}", autocommit=True) as conn:
+        conn.execute(create_table_statement)
+        conn.execute(create_rollup_statement)
+        rows = synthetic_metrics(begin, end, interval, rng)
+        start = time.perf_counter()
+        load(conn, rows)
+        load_s = time.perf_counter() - start
+        start = time.perf_counter()
+        rebuild(conn)
+        conn.execute("analyze")
+        rebuild_s = time.perf_counter() - start
+        print(
+            f"Loaded a year of metrics every {interval} min ({len(rows[0])} rows) in "
+            f"{load_s:.2f}s, built the rollups in {rebuild_s:.2f}s"
+        )
+
+        insert_s, rollup_s = time_appends(conn, end, appends, interval, rng)
+        print(
+            f"Appending {appends} rows: {insert_s * 1000:.2f} ms per insert, "
+            f"{rollup_s * 1000:.2f} ms per rollup update\n"
+        )
+
+        print(
+            f"{'range':<8} {'res.':>5} {'rows':>7} {'buckets':>8} {'raw rows (ms)':>14} "
+            f"{'aggregate (ms)':>15} {'rollup (ms)':>12} {'speedup':>8} {'same':>5}"
+        )
+        for name, span in RANGES.items():
+            start, stop = end - span, end
+            unit = choose_resolution(start, stop)
+            rows_s, raw = best_of(repeat, raw_rows, conn, start, stop)
+            aggregate_s, aggregated = best_of(repeat, raw_aggregate, conn, start, stop, unit)
+            rollup_s, rollup = best_of(repeat, query_metrics, conn, start, stop, unit)
+            same = len(rollup) == len(aggregated) and np.allclose(
+                rollup[ROLLUP_COLUMNS].to_numpy(dtype=float),
+                np.array([row[2:] for row in aggregated], dtype=float),
+            )
+            print(
+                f"{name:<8} {unit:>5} {len(raw):>7} {len(rollup):>8} {rows_s * 1000:>14.2f} "
+                f"{aggregate_s * 1000:>15.2f} {rollup_s * 1000:>12.2f} "
+                f"{aggregate_s / rollup_s:>7.1f}x {str(same):>5}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=int, default=10, help="minutes between metrics")
+    parser.add_argument("--appends", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    run(args.interval, args.appends, args.repeat, args.seed)
@@ -0,0 +1,83 @@
+"""Cutting the monitoring windows: a boolean mask per window vs slices of a sorted time index.
+
+Times, for the 27 days of February 2022 and for the hours of a year of rides, the mask filter
+`calculate_metrics_postgresql` used for every window, and `TimeWindows` (sort once, one
+`searchsorted`, then an `iloc` slice per window). The year is February repeated 13 times, 28
+days apart. Masking all 8760 hours takes a while, so it is timed on `--sample` evenly spaced
+hours and extrapolated. Both ways must return the same rows for every timed window.
+
+Usage:
+    python benchmark_windows.py
+    python benchmark_windows.py --sample 500
+"""
+
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+from time_windows import TimeWindows
+
+COLUMN = "lpep_pickup_datetime"
+
+
+def mask_window(raw_data, start, freq):
+    return raw_data[(raw_data[COLUMN] >= start) & (raw_data[COLUMN] < start + freq)]
+
+
+def year_of_rides(month, begin):
+    shifted = []
+    for i in range(13):
+        df = month.copy()
+        df[COLUMN] += datetime.timedelta(days=28 * i)
+        df["lpep_dropoff_datetime"] += datetime.timedelta(days=28 * i)
+        shifted.append(df)
+    year = pd.concat(shifted, ignore_index=True)
+    end = begin + datetime.timedelta(days=365)
+    return year[(year[COLUMN] >= begin) & (year[COLUMN] < end)].reset_index(drop=True)
+
+
+def compare(name, raw_data, begin, freq, count, sample):
+    start = time.perf_counter()
+    windows = TimeWindows(raw_data, COLUMN, begin, freq, count)
+    index_s = time.perf_counter() - start
+    start = time.perf_counter()
+    sliced_rows = sum(len(current_data) for _, current_data in windows)
+    slice_s = time.perf_counter() - start
+
+    timed = np.unique(np.linspace(0, count - 1, min(sample, count)).astype(int))
+    mask_s = 0.0
+    for i in timed:
+        start = time.perf_counter()
+        current_data = mask_window(raw_data, windows.start(i), freq)
+        mask_s += time.perf_counter() - start
+        assert current_data.equals(windows[i].sort_index()), f"window {i} differs"
+    mask_s *= count / len(timed)
+
+    sorted_s = index_s + slice_s
+    print(
+        f"{name:<22} {len(raw_data):>8} {count:>8} {sliced_rows:>8} {mask_s:>10.3f} "
+        f"{index_s:>10.3f} {slice_s:>10.3f} {mask_s / sorted_s:>8.0f}x"
+    )
+
+
+def run(sample):
+    month = pd.read_parquet("data/green_tripdata_2022-02.parquet")
+    begin = datetime.datetime(2022, 2, 1)
+    year = year_of_rides(month, begin)
+
+    print(
+        f"{'data':<22} {'rows':>8} {'windows':>8} {'in them':>8} {'mask (s)':>10} "
+        f"{'index (s)':>10} {'slices (s)':>10} {'speedup':>9}"
+    )
+    compare("February, daily", month, begin, datetime.timedelta(days=1), 27, sample)
+    compare("a year, hourly", year, begin, datetime.timedelta(hours=1), 365 * 24, sample)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sample", type=int, default=200, help="masked windows to time")
+    args = parser.parse_args()
+
+    run(args.sample)
@@ -1,19 +1,21 @@
+import argparse
 import datetime
 import logging
+import os
 import random
 import time
 
-import joblib
 import pandas as pd
 import psycopg
-from evidently import ColumnMapping
-from evidently.metrics import (
-    ColumnDriftMetric,
-    DatasetDriftMetric,
-    DatasetMissingValuesMetric,
-)
-from evidently.report import Report
+from metrics_rollup import create_rollup_statement, update_rollups
+from model_bundle import load_bundle
 from prefect import flow, task
+from report_pool import (
+    make_report,
+    run_report,
+    run_reports,
+)
+from time_windows import TimeWindows, sort_by_time
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s")
 
@@ -29,33 +31,33 @@ create table dummy_metrics(
 	share_missing_values float
 )
 """
+insert_statement = """
+insert into dummy_metrics(timestamp, prediction_drift, num_drifted_columns, share_missing_values)
+values (%s, %s, %s, %s)
+"""
 
-# load reference data and model
-reference_data = pd.read_parquet("data/reference.parquet")
-with open("models/lin_reg.bin", "rb") as f_in:
-    model = joblib.load(f_in)
-
-raw_data = pd.read_parquet("data/green_tripdata_2022-02.parquet")
+# load reference data and model, a smaller sample can be built with reference_builder.py
+reference_data = pd.read_parquet(os.getenv("REFERENCE_DATA", "data/reference.parquet"))
+# Converted from models/lin_reg.bin with `python model_bundle.py convert`
+model = load_bundle("models/lin_reg.bundle")
 
 begin = datetime.datetime(2022, 2, 1, 0, 0)
 num_features = ["passenger_count", "trip_distance", "fare_amount", "total_amount"]
 cat_features = ["PULocationID", "DOLocationID"]
 
-column_mapping = ColumnMapping(
-    prediction="prediction",
-    numerical_features=num_features,
-    categorical_features=cat_features,
-    target=None,
+# Sorted by pickup time once and predicted in one call, every day is then a slice of it
+raw_data = sort_by_time(
+    pd.read_parquet("data/green_tripdata_2022-02.parquet"), "lpep_pickup_datetime"
 )
-# Generate report
-report = Report(
-    metrics=[
-        ColumnDriftMetric(column_name="prediction"),
-        DatasetDriftMetric(),
-        DatasetMissingValuesMetric(),
-    ]
+raw_data["prediction"] = model.predict(raw_data[num_features + cat_features].fillna(0))
+# The 27 days the backfill reports on
+daily_data = TimeWindows(
+    raw_data, "lpep_pickup_datetime", begin, datetime.timedelta(days=1), count=27
 )
 
+# Generate report, report_pool.py builds one per worker for parallel runs
+report = make_report()
+
 
 @task
 def prep_db():
@@ -71,32 +73,29 @@ def prep_db():
             "host=localhost port=5432 dbname=test user=postgres password=example"
         ) as conn:
             conn.execute(create_table_statement)
+            conn.execute(create_rollup_statement)
 
 
-@task
-def calculate_metrics_postgresql(curr, i):
-    current_data = raw_data[
-        (raw_data.lpep_pickup_datetime >= (begin + datetime.timedelta(i)))
-        & (raw_data.lpep_pickup_datetime < (begin + datetime.timedelta(i + 1)))
-    ]
-
+def calculate_metrics(current_data, reference=None):
+    """Run the drift report for one window and return the metrics we store."""
     # current_data.fillna(0, inplace=True)
-    current_data["prediction"] = model.predict(current_data[num_features + cat_features].fillna(0))
+    if "prediction" not in current_data:
+        predictions = model.predict(current_data[num_features + cat_features].fillna(0))
+        current_data = current_data.assign(prediction=predictions)
 
-    report.run(
-        reference_data=reference_data, current_data=current_data, column_mapping=column_mapping
-    )
+    reference = reference_data if reference is None else reference
+    return run_report(report, current_data, reference)
 
-    result = report.as_dict()
 
-    # fetch metrics
-    prediction_drift = result["metrics"][0]["result"]["drift_score"]
-    num_drifted_columns = result["metrics"][1]["result"]["number_of_drifted_columns"]
-    share_missing_values = result["metrics"][2]["result"]["current"]["share_of_missing_values"]
+@task
+def calculate_metrics_postgresql(curr, i):
+    current_data = daily_data[i]
+
+    prediction_drift, num_drifted_columns, share_missing_values = calculate_metrics(current_data)
 
     # load metrics into database
     curr.execute(
-        "insert into dummy_metrics(timestamp, prediction_drift, num_drifted_columns, share_missing_values) values (%s, %s, %s, %s)",
+        insert_statement,
         (
             begin + datetime.timedelta(i),
             prediction_drift,
@@ -104,6 +103,8 @@ def calculate_metrics_postgresql(curr, i):
             share_missing_values,
         ),
     )
+    # Refresh the hour and day buckets the dashboards read
+    update_rollups(curr, begin + datetime.timedelta(i))
 
 
 @flow
@@ -127,5 +128,39 @@ def batch_monitoring_backfill():
             logging.info("data sent")
 
 
+@task
+def insert_metrics(curr, rows):
+    curr.executemany(insert_statement, rows)
+    update_rollups(curr, rows[0][0], rows[-1][0])
+
+
+@flow
+def batch_monitoring_parallel(n_jobs: int = None, batch_size: int = 8):
+    """Run the reports of all days in a pool of workers, insert them in batches as they finish."""
+    prep_db()
+    with psycopg.connect(
+        "host=localhost port=5432 dbname=test user=postgres password=example", autocommit=True
+    ) as conn:
+        batch = []
+        for row in run_reports(daily_data, reference_data, n_jobs):
+            batch.append(row)
+            if len(batch) == batch_size:
+                with conn.cursor() as curr:
+                    insert_metrics(curr, batch)
+                logging.info(f"data sent up to {row[0]}")
+                batch = []
+        if batch:
+            with conn.cursor() as curr:
+                insert_metrics(curr, batch)
+            logging.info("data sent")
+
+
 if __name__ == "__main__":
-    batch_monitoring_backfill()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, help="run the reports in parallel workers")
+    args = parser.parse_args()
+
+    if args.jobs:
+        batch_monitoring_parallel(args.jobs)
+    else:
+        batch_monitoring_backfill()
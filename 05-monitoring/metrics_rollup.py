@@ -0,0 +1,144 @@
+"""Hourly and daily rollups of the monitoring metrics in `dummy_metrics`.
+
+Grafana used to aggregate the raw metric rows for every panel refresh. The rollup tables keep,
+per hour and per day, the count and the min, max, mean and p95 of the prediction drift and the
+share of missing values, so a dashboard range reads one row per bucket instead.
+
+The rollups are updated incrementally: after a metrics row is inserted, `update_rollups`
+recomputes only the hour and the day bucket it falls into. min, max and mean could be merged
+into the stored row, but a p95 cannot, so the bucket is aggregated again from its raw rows
+(an index range scan of at most a day of windows). This also keeps the rollups right when a
+window is recomputed or arrives late.
+
+    update_rollups(curr, timestamp)
+    df = query_metrics(conn, start, end)  # picks hourly or daily buckets for the range
+
+Usage:
+    python metrics_rollup.py rebuild
+    python metrics_rollup.py query 2022-02-01 2022-02-28 --resolution day
+"""
+
+import argparse
+import datetime
+
+import pandas as pd
+import psycopg
+
+CONNECTION = "host=localhost port=5432 dbname=test user=postgres password=example"
+
+METRICS = ("prediction_drift", "share_missing_values")
+AGGREGATES = {
+    "min": "min({metric})",
+    "max": "max({metric})",
+    "mean": "avg({metric})",
+    "p95": "percentile_cont(0.95) within group (order by {metric})",
+}
+RESOLUTIONS = {
+    "hour": ("metrics_hourly", datetime.timedelta(hours=1)),
+    "day": ("metrics_daily", datetime.timedelta(days=1)),
+}
+MAX_POINTS = 500  # about one bucket per pixel of a dashboard panel
+
+ROLLUP_COLUMNS = [f"{metric}_{name}" for metric in METRICS for name in AGGREGATES]
+AGGREGATE_COLUMNS = ", ".join(
+    f"{expression.format(metric=metric)} as {metric}_{name}"
+    for metric in METRICS
+    for name, expression in AGGREGATES.items()
+)
+
+create_rollup_statement = "".join(
+    f"""
+drop table if exists {table};
+create table {table}(
+	bucket timestamp primary key,
+	count integer,
+	{", ".join(f"{column} float" for column in ROLLUP_COLUMNS)}
+);
+"""
+    for table, _ in RESOLUTIONS.values()
+)
+# The rollup updates scan dummy_metrics by time range
+create_rollup_statement += (
+    "create index if not exists dummy_metrics_timestamp_idx on dummy_metrics(timestamp);"
+)
+
+# Buckets of `unit` overlapping [start, end], aggregated from the raw rows
+aggregate_query = f"""
+select date_trunc(%(unit)s, timestamp) as bucket, count(*) as count, {AGGREGATE_COLUMNS}
+from dummy_metrics
+where timestamp >= date_trunc(%(unit)s, %(start)s::timestamp)
+	and timestamp < date_trunc(%(unit)s, %(end)s::timestamp) + %(step)s
+group by 1
+"""
+
+upsert_statement = (
+    "insert into {table}"
+    + aggregate_query
+    + "on conflict (bucket) do update set count = excluded.count, "
+    + ", ".join(f"{column} = excluded.{column}" for column in ROLLUP_COLUMNS)
+)
+
+
+def update_rollups(curr, first: datetime.datetime, last: datetime.datetime = None):
+    """Recompute the hourly and daily buckets of the metrics between `first` and `last`."""
+    last = first if last is None else last
+    for unit, (table, step) in RESOLUTIONS.items():
+        curr.execute(
+            upsert_statement.format(table=table),
+            {"unit": unit, "start": first, "end": last, "step": step},
+        )
+
+
+def choose_resolution(start, end, max_points: int = MAX_POINTS) -> str:
+    """The finest rollup that returns at most `max_points` buckets for the range."""
+    for unit, (_, step) in RESOLUTIONS.items():
+        if (end - start) / step <= max_points:
+            return unit
+    return unit  # the coarsest one
+
+
+def query_metrics(conn, start, end, resolution: str = None, max_points: int = MAX_POINTS):
+    """Rollup buckets overlapping [start, end], with a `bucket` column and one per aggregate."""
+    resolution = resolution or choose_resolution(start, end, max_points)
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution {resolution!r}, use one of {list(RESOLUTIONS)}")
+    table, _ = RESOLUTIONS[resolution]
+
+    cursor = conn.execute(
+        f"select bucket, count, {', '.join(ROLLUP_COLUMNS)} from {table} "
+        "where bucket >= date_trunc(%(unit)s, %(start)s::timestamp) and bucket <= %(end)s "
+        "order by bucket",
+        {"unit": resolution, "start": start, "end": end},
+    )
+    return pd.DataFrame(cursor.fetchall(), columns=[column.name for column in cursor.description])
+
+
+def rebuild(conn):
+    """Recreate the rollup tables from all the raw rows of `dummy_metrics`."""
+    conn.execute(create_rollup_statement)
+    cursor = conn.execute("select min(timestamp), max(timestamp) from dummy_metrics")
+    first, last = cursor.fetchone()
+    if first is not None:
+        update_rollups(conn, first, last)
+    return first, last
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connection", default=CONNECTION)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="rebuild the rollups from dummy_metrics")
+    query = commands.add_parser("query", help="print the rollup buckets of a time range")
+    query.add_argument("start", type=datetime.datetime.fromisoformat)
+    query.add_argument("end", type=datetime.datetime.fromisoformat)
+    query.add_argument("--resolution", choices=list(RESOLUTIONS))
+    query.add_argument("--max-points", type=int, default=MAX_POINTS)
+    args = parser.parse_args()
+
+    with psycopg.connect(args.connection, autocommit=True) as conn:
+        if args.command == "rebuild":
+            first, last = rebuild(conn)
+            print(f"Rebuilt the rollups of the metrics from {first} to {last}")
+        else:
+            df = query_metrics(conn, args.start, args.end, args.resolution, args.max_points)
+            print(df.to_string(index=False))
@@ -0,0 +1,160 @@
+"""Build a stratified sample of a month of rides to use as the drift reference.
+
+The drift tests of the monitoring job get slower with the size of the reference data. This
+builder samples a month down to `--size` rows while keeping its mix of routes and times of day:
+rides are stratified by PU_DO pair and pickup hour, and every stratum gets its proportional
+share of the sample (fractional shares are rounded randomly, so the total is exact).
+
+The input parquet file is streamed in record batches and never loaded whole:
+
+1. the first pass reads only the stratum columns and counts the rides of every stratum
+2. the second pass keeps a reservoir per stratum: each ride draws a random key, and the rides
+   with the smallest keys of their stratum (a uniform sample of it) are kept
+
+The rides are filtered as in `baseline_model_nyc_taxi_data.ipynb`, and the sample gets the
+`duration_min` and `prediction` columns of `data/reference.parquet`.
+
+Usage:
+    python reference_builder.py data/green_tripdata_2022-01.parquet --size 5000
+    python reference_builder.py data/green_tripdata_2022-01.parquet --size 2000 \\
+        --output data/reference_2000.parquet --seed 1
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from model_bundle import load_bundle
+
+NUM_FEATURES = ["passenger_count", "trip_distance", "fare_amount", "total_amount"]
+CAT_FEATURES = ["PULocationID", "DOLocationID"]
+STRATUM_COLUMNS = [
+    "lpep_pickup_datetime",
+    "lpep_dropoff_datetime",
+    "passenger_count",
+    "PULocationID",
+    "DOLocationID",
+]
+BATCH_SIZE = 65_536
+
+
+def keep_mask(batch) -> np.ndarray:
+    """Rides of 0-60 minutes with 1-8 passengers, the filter of the baseline notebook."""
+    pickup = batch.column("lpep_pickup_datetime").to_numpy(zero_copy_only=False)
+    dropoff = batch.column("lpep_dropoff_datetime").to_numpy(zero_copy_only=False)
+    duration = (dropoff - pickup) / np.timedelta64(1, "m")
+    passengers = batch.column("passenger_count").to_numpy(zero_copy_only=False)
+    # Nulls are NaN and NaT here and compare False
+    return (duration >= 0) & (duration <= 60) & (passengers > 0) & (passengers <= 8)
+
+
+def stratum_keys(batch) -> np.ndarray:
+    """Integer key of the (PU, DO, pickup hour) stratum of every ride."""
+    pu = batch.column("PULocationID").to_numpy(zero_copy_only=False).astype(np.int64)
+    do = batch.column("DOLocationID").to_numpy(zero_copy_only=False).astype(np.int64)
+    pickup = batch.column("lpep_pickup_datetime").to_numpy(zero_copy_only=False)
+    hour = (pickup - pickup.astype("datetime64[D]")) // np.timedelta64(1, "h")
+    return (pu * 1000 + do) * 24 + hour.astype(np.int64)
+
+
+def count_strata(path: str, batch_size: int = BATCH_SIZE):
+    """First pass: sorted stratum keys and the number of rides in each."""
+    keys, counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=STRATUM_COLUMNS):
+        batch_keys = stratum_keys(batch)[keep_mask(batch)]
+        keys, inverse = np.unique(np.concatenate([keys, batch_keys]), return_inverse=True)
+        weights = np.concatenate([counts, np.ones(len(batch_keys), dtype=np.int64)])
+        counts = np.bincount(inverse, weights=weights, minlength=len(keys)).astype(np.int64)
+    return keys, counts
+
+
+def allocate(counts: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """Proportional number of sampled rides per stratum, summing exactly to `size`."""
+    total = counts.sum()
+    if size >= total:
+        return counts.copy()
+    shares = counts * (size / total)
+    quotas = np.floor(shares).astype(np.int64)
+    remainders = shares - quotas
+    # Systematic sampling over the fractional parts: stratum i gets one more ride with
+    # probability remainders[i], and exactly size - quotas.sum() strata get one
+    order = rng.permutation(len(counts))
+    edges = np.cumsum(remainders[order])
+    picks = rng.uniform() + np.arange(size - quotas.sum())
+    picked = np.minimum(np.searchsorted(edges, picks, side="right"), len(order) - 1)
+    quotas[order[picked]] += 1
+    return quotas
+
+
+def sample_strata(path: str, keys, quotas, rng, batch_size: int = BATCH_SIZE) -> pa.Table:
+    """Second pass: a reservoir of `quotas[i]` rides for the stratum `keys[i]`."""
+    reservoir, reservoir_keys, reservoir_priority = None, None, None
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        mask = keep_mask(batch)
+        batch = pa.Table.from_batches([batch]).filter(mask)
+        batch_keys = stratum_keys(batch)
+        batch_priority = rng.uniform(size=len(batch_keys))
+
+        if reservoir is not None:
+            batch = pa.concat_tables([reservoir, batch])
+            batch_keys = np.concatenate([reservoir_keys, batch_keys])
+            batch_priority = np.concatenate([reservoir_priority, batch_priority])
+
+        # Keep the rides with the smallest priorities of every stratum
+        order = np.lexsort((batch_priority, batch_keys))
+        sorted_keys = batch_keys[order]
+        group_start = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        group_sizes = np.diff(np.r_[group_start, len(sorted_keys)])
+        rank = np.arange(len(sorted_keys)) - np.repeat(group_start, group_sizes)
+        quota = quotas[np.searchsorted(keys, sorted_keys)]
+        kept = np.sort(order[rank < quota])
+
+        reservoir = batch.take(kept)
+        reservoir_keys = batch_keys[kept]
+        reservoir_priority = batch_priority[kept]
+    return reservoir
+
+
+def build_reference(path: str, size: int, model_path: str, seed: int = None, batch_size=None):
+    """Stratified sample of `size` rides of `path`, with the `prediction` column of the model."""
+    rng = np.random.default_rng(seed)
+    batch_size = batch_size or BATCH_SIZE
+    keys, counts = count_strata(path, batch_size)
+    quotas = allocate(counts, size, rng)
+    table = sample_strata(path, keys, quotas, rng, batch_size)
+
+    df = table.to_pandas()
+    duration = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
+    df["duration_min"] = duration.dt.total_seconds() / 60
+    model = load_bundle(model_path)
+    df["prediction"] = model.predict(df[NUM_FEATURES + CAT_FEATURES].fillna(0))
+
+    stats = {
+        "rides": int(counts.sum()),
+        "strata": len(keys),
+        "sampled_strata": int(np.count_nonzero(quotas)),
+    }
+    return df, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input")
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--output", default="data/reference_sample.parquet")
+    parser.add_argument("--model", default="models/lin_reg.bundle")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df, stats = build_reference(args.input, args.size, args.model, args.seed, args.batch_size)
+    df.to_parquet(args.output)
+    print(
+        f"Sampled {len(df)} of {stats['rides']} rides from {stats['sampled_strata']} of "
+        f"{stats['strata']} strata in {time.perf_counter() - start:.2f}s, saved to {args.output}"
+    )
@@ -0,0 +1,95 @@
+"""Run the Evidently drift reports of many windows in parallel worker processes.
+
+An Evidently `Report` keeps the state of its last run, so the single module-level report of
+the monitoring job can only run one window at a time. Here every worker process builds its
+own report and keeps the reference frame and the windows from its start: only a window index
+goes to a worker, and only the three metrics we store come back.
+
+    for start, prediction_drift, num_drifted_columns, share_missing_values in run_reports(
+        daily_data, reference_data, n_jobs=4
+    ):
+        ...
+
+The results arrive in window order while the later windows are still running, so they can be
+inserted in batches as they come.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from evidently import ColumnMapping
+from evidently.metrics import (
+    ColumnDriftMetric,
+    DatasetDriftMetric,
+    DatasetMissingValuesMetric,
+)
+from evidently.report import Report
+
+NUM_FEATURES = ["passenger_count", "trip_distance", "fare_amount", "total_amount"]
+CAT_FEATURES = ["PULocationID", "DOLocationID"]
+
+column_mapping = ColumnMapping(
+    prediction="prediction",
+    numerical_features=NUM_FEATURES,
+    categorical_features=CAT_FEATURES,
+    target=None,
+)
+
+
+def make_report() -> Report:
+    return Report(
+        metrics=[
+            ColumnDriftMetric(column_name="prediction"),
+            DatasetDriftMetric(),
+            DatasetMissingValuesMetric(),
+        ]
+    )
+
+
+def run_report(report: Report, current_data, reference_data):
+    """Run `report` on one window and fetch the metrics we store."""
+    report.run(
+        reference_data=reference_data, current_data=current_data, column_mapping=column_mapping
+    )
+    result = report.as_dict()
+
+    prediction_drift = result["metrics"][0]["result"]["drift_score"]
+    num_drifted_columns = result["metrics"][1]["result"]["number_of_drifted_columns"]
+    share_missing_values = result["metrics"][2]["result"]["current"]["share_of_missing_values"]
+    return prediction_drift, num_drifted_columns, share_missing_values
+
+
+# Set in every pool worker by `_init_worker`
+_worker_state = None
+
+
+def _init_worker(windows, reference_data):
+    global _worker_state
+    _worker_state = (make_report(), windows, reference_data)
+
+
+def _run_window(i):
+    report, windows, reference_data = _worker_state
+    return (windows.start(i), *run_report(report, windows[i], reference_data))
+
+
+def run_reports(windows, reference_data, n_jobs: int = None, indices=None):
+    """Yield `(start, prediction_drift, num_drifted_columns, share_missing_values)` per window.
+
+    `windows` is a `TimeWindows` whose rows have the `prediction` column, `indices` selects
+    some of its windows.
+    """
+    indices = range(len(windows)) if indices is None else indices
+    n_jobs = n_jobs or os.cpu_count()
+
+    # With fork the workers inherit the windows and the reference without pickling them
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(
+        max_workers=n_jobs,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(windows, reference_data),
+    ) as executor:
+        yield from executor.map(_run_window, indices)
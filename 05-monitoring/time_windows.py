@@ -0,0 +1,71 @@
+"""Fixed-size time windows over a dataframe, sliced from a sorted time index.
+
+Filtering `raw_data` with a boolean mask per window scans every row for every window. Here the
+rows are sorted by time once, the window edges are located with one `searchsorted`, and each
+window is a contiguous `iloc` slice of the sorted frame: no scan and no copy of the rows.
+The cost no longer grows with the number of windows, so hourly windows over a year of rides
+are as cheap to cut as the days of a month.
+
+    windows = TimeWindows(raw_data, "lpep_pickup_datetime", begin, datetime.timedelta(days=1))
+    for start, current_data in windows:
+        ...
+
+The slices are views of the sorted frame: copy one before changing it in place.
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def sort_by_time(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """`df` ordered by `column`, with equal times kept in file order."""
+    if df[column].is_monotonic_increasing:
+        return df
+    return df.sort_values(column, kind="stable")
+
+
+class TimeWindows:
+    """Windows of `freq` from `begin` over the rows of `df`, sorted by `column` once.
+
+    Without `count`, the windows run to the last row. Rows before `begin` or after the last
+    window belong to no window, like rows outside the range of a mask.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        column: str,
+        begin: datetime.datetime,
+        freq: datetime.timedelta,
+        count: int = None,
+    ):
+        self.df = sort_by_time(df, column)
+        self.begin = np.datetime64(begin)
+        self.freq = np.timedelta64(freq)
+        times = self.df[column].to_numpy()
+        if count is None:
+            count = max(int((times[-1] - self.begin) // self.freq) + 1, 0) if len(times) else 0
+        self.edges = self.begin + np.arange(count + 1) * self.freq
+        # offsets[i]:offsets[i + 1] are the rows of window i
+        self.offsets = times.searchsorted(self.edges.astype(times.dtype), side="left")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def start(self, i: int) -> datetime.datetime:
+        return pd.Timestamp(self.edges[i]).to_pydatetime()
+
+    def __getitem__(self, i: int) -> pd.DataFrame:
+        if not -len(self) <= i < len(self):
+            raise IndexError(f"Window {i} out of range, there are {len(self)} windows")
+        i %= len(self)
+        return self.df.iloc[self.offsets[i] : self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.start(i), self[i]
+
+    def sizes(self) -> np.ndarray:
+        return np.diff(self.offsets)
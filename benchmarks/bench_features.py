@@ -0,0 +1,35 @@
+"""Throughput of `read_dataframe` and `add_features` from the training flow."""
+
+import os
+
+from common import (
+    DATA_DIR,
+    higher,
+    load_module,
+    lower,
+    timer,
+)
+
+TRAINING_FLOW = "03-workflow-orchestration/04-working-with-deployments/orchestrate_gs_final.py"
+
+
+def run(train_month="2021-01", val_month="2021-02"):
+    training = load_module(TRAINING_FLOW)
+    train_path = os.path.join(DATA_DIR, f"green_tripdata_{train_month}.parquet")
+    val_path = os.path.join(DATA_DIR, f"green_tripdata_{val_month}.parquet")
+
+    with timer() as read:
+        df_train = training.read_dataframe.fn(train_path)
+        df_val = training.read_dataframe.fn(val_path)
+    rows = len(df_train) + len(df_val)
+
+    with timer() as features:
+        training.add_features.fn(df_train, df_val)
+
+    return {
+        "rows": rows,
+        "read_dataframe_s": lower(read["seconds"]),
+        "read_dataframe_rows_per_s": higher(rows / read["seconds"]),
+        "add_features_s": lower(features["seconds"]),
+        "add_features_rows_per_s": higher(rows / features["seconds"]),
+    }
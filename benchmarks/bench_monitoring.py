@@ -0,0 +1,54 @@
+"""Per-day drift metric computation, as done by `calculate_metrics_postgresql`.
+
+Cuts the days of February 2022 with `TimeWindows`, as `daily_data` of
+`05-monitoring/evidently_metrics_calculation.py` does, and runs `calculate_metrics` on each of
+them, without writing to PostgreSQL. Building the windows and computing the metrics are timed
+separately.
+"""
+
+import datetime
+import os
+
+from common import (
+    REPO_ROOT,
+    load_module,
+    lower,
+    timer,
+    working_directory,
+)
+
+
+def run(days=27):
+    # The monitoring script loads its data relative to its own folder at import time
+    with working_directory(os.path.join(REPO_ROOT, "05-monitoring")):
+        monitoring = load_module("05-monitoring/evidently_metrics_calculation.py")
+
+    # The rows back in file order, so the sort of the time index is timed as well
+    raw_data = monitoring.raw_data.sort_index()
+    with timer() as index:
+        daily_data = monitoring.TimeWindows(
+            raw_data,
+            "lpep_pickup_datetime",
+            monitoring.begin,
+            datetime.timedelta(days=1),
+            count=days,
+        )
+
+    per_day, slicing = [], 0.0
+    with timer() as total:
+        for i in range(days):
+            with timer() as window:
+                current_data = daily_data[i]
+            slicing += window["seconds"]
+            with timer() as day:
+                monitoring.calculate_metrics(current_data)
+            per_day.append(day["seconds"])
+
+    return {
+        "days": days,
+        "windows_index_s": lower(index["seconds"]),
+        "windows_slice_s": lower(slicing),
+        "total_s": lower(index["seconds"] + total["seconds"]),
+        "per_day_mean_s": lower(sum(per_day) / len(per_day)),
+        "per_day_max_s": lower(max(per_day)),
+    }
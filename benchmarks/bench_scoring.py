@@ -0,0 +1,47 @@
+"""Throughput of batch scoring with the locally stored `models/lin_reg.bin` model.
+
+Runs the same steps as `apply_model` in `04-deployment/batch/score_scheduled.py`, except that the
+model is the `(dv, model)` tuple from `models/` instead of a model loaded from GCS, with the
+vectorizer migrated to a `RideFeaturizer`. The output is written to a temporary directory.
+"""
+
+import os
+import pickle
+import tempfile
+
+from common import (
+    DATA_DIR,
+    REPO_ROOT,
+    higher,
+    load_module,
+    lower,
+    timer,
+)
+
+
+def run(month="2021-02"):
+    scoring = load_module("04-deployment/batch/score_scheduled.py")
+    dataset_writer = load_module("04-deployment/batch/dataset_writer.py")
+    features = load_module("04-deployment/batch/features.py")
+
+    with open(os.path.join(REPO_ROOT, "models/lin_reg.bin"), "rb") as f_in:
+        dv, model = pickle.load(f_in)
+    featurizer = features.as_featurizer(dv)
+
+    with timer() as total:
+        with timer() as read:
+            df = scoring.read_dataframe(os.path.join(DATA_DIR, f"green_tripdata_{month}.parquet"))
+        with timer() as predict:
+            y_pred = scoring.predict(df, featurizer, model)
+        with timer() as write, tempfile.TemporaryDirectory() as tmp_dir:
+            table = scoring.make_result_table(df, y_pred, "benchmark")
+            dataset_writer.write_partition(table, tmp_dir, version="benchmark")
+
+    rows = len(df)
+    return {
+        "rows": rows,
+        "read_s": lower(read["seconds"]),
+        "predict_s": lower(predict["seconds"]),
+        "write_s": lower(write["seconds"]),
+        "apply_model_rows_per_s": higher(rows / total["seconds"]),
+    }
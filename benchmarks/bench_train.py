@@ -0,0 +1,46 @@
+"""Wall time of `train_best_model` from the training flow.
+
+MLflow logs to a throwaway SQLite store in a temporary directory, so the benchmark does not
+touch `mlflow.db`.
+"""
+
+import os
+import tempfile
+
+import mlflow
+from common import (
+    DATA_DIR,
+    load_module,
+    lower,
+    timer,
+    working_directory,
+)
+
+TRAINING_FLOW = "03-workflow-orchestration/04-working-with-deployments/orchestrate_gs_final.py"
+
+
+def run(train_month="2021-01", val_month="2021-02"):
+    training = load_module(TRAINING_FLOW)
+    profiling = load_module("03-workflow-orchestration/04-working-with-deployments/profiling.py")
+
+    df_train = training.read_dataframe.fn(
+        os.path.join(DATA_DIR, f"green_tripdata_{train_month}.parquet")
+    )
+    df_val = training.read_dataframe.fn(
+        os.path.join(DATA_DIR, f"green_tripdata_{val_month}.parquet")
+    )
+    X_train, X_val, y_train, y_val, dv = training.add_features.fn(df_train, df_val)
+
+    profiler = profiling.StageProfiler()
+    with tempfile.TemporaryDirectory() as tmp_dir, working_directory(tmp_dir):
+        mlflow.set_tracking_uri(f"sqlite:///{os.path.join(tmp_dir, 'mlflow.db')}")
+        mlflow.set_experiment("benchmark")
+        with timer() as train:
+            training.train_best_model.fn(X_train, X_val, y_train, y_val, dv, profiler)
+
+    return {
+        "train_rows": X_train.shape[0],
+        "train_best_model_s": lower(train["seconds"]),
+        "xgb_train_s": lower(profiler.stages["xgb_train"]["wall_s"]),
+        "log_artifacts_s": lower(profiler.stages["log_artifacts"]["wall_s"]),
+    }
@@ -0,0 +1,76 @@
+"""Helpers shared by the benchmarks."""
+
+import importlib.util
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_ROOT, "data")
+
+# Scripts imported by `load_module`, by absolute path
+_loaded = {}
+
+
+def load_module(relative_path: str, name: str = None):
+    """Import a script from the numbered lesson folders, which are not importable packages.
+
+    The script's folder is put first on `sys.path` so that its sibling imports resolve. Several
+    folders have a module of the same name (`features`, `data_quality`, ...), so the ones that
+    were imported from another folder are dropped from `sys.modules` first, and the scripts are
+    cached by path rather than by name.
+    """
+    path = os.path.abspath(os.path.join(REPO_ROOT, relative_path))
+    if path in _loaded:
+        return _loaded[path]
+
+    folder = os.path.dirname(path)
+    if folder in sys.path:
+        sys.path.remove(folder)
+    sys.path.insert(0, folder)
+    for module_name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None) or ""
+        if (
+            module_file.startswith(REPO_ROOT + os.sep)
+            and os.path.dirname(module_file) != folder
+            and os.path.exists(os.path.join(folder, f"{module_name}.py"))
+        ):
+            del sys.modules[module_name]
+
+    name = name or os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    _loaded[path] = module
+    return module
+
+
+@contextmanager
+def working_directory(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def timer():
+    """Yield a dict whose `seconds` entry is filled in when the block exits."""
+    result = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+
+def higher(value):
+    return {"value": value, "better": "higher"}
+
+
+def lower(value):
+    return {"value": value, "better": "lower"}
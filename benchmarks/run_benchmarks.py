@@ -0,0 +1,122 @@
+"""Run the end-to-end benchmarks and compare them with a stored baseline.
+
+Every run is saved to `results/<timestamp>.json`. A metric is flagged as a regression when it is
+worse than the baseline by more than `--tolerance` (20% by default), and the script then exits
+with status 1, so it can gate a CI job.
+
+Usage:
+    python run_benchmarks.py
+    python run_benchmarks.py --only features scoring
+    python run_benchmarks.py --update-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+import bench_features
+import bench_monitoring
+import bench_scoring
+import bench_train
+
+BENCHMARKS = {
+    "features": bench_features.run,
+    "train": bench_train.run,
+    "scoring": bench_scoring.run,
+    "monitoring": bench_monitoring.run,
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def is_metric(value):
+    return isinstance(value, dict) and "better" in value
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of `(benchmark, metric, baseline, current, change)` regressions."""
+    regressions = []
+    for bench, metrics in results.items():
+        for name, metric in metrics.items():
+            reference = baseline.get(bench, {}).get(name)
+            if not is_metric(metric) or not is_metric(reference) or not reference["value"]:
+                continue
+            change = metric["value"] / reference["value"] - 1
+            worse = -change if metric["better"] == "higher" else change
+            if worse > tolerance:
+                regressions.append((bench, name, reference["value"], metric["value"], change))
+    return regressions
+
+
+def print_results(results, baseline):
+    for bench, metrics in results.items():
+        print(f"\n{bench}")
+        for name, metric in metrics.items():
+            if not is_metric(metric):
+                print(f"  {name:<28} {metric}")
+                continue
+            line = f"  {name:<28} {metric['value']:>14.4f}"
+            reference = baseline.get(bench, {}).get(name)
+            if is_metric(reference) and reference["value"]:
+                line += f"  ({metric['value'] / reference['value'] - 1:+.1%} vs baseline)"
+            print(line)
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"))
+    parser.add_argument("--results-dir", default=os.path.join(HERE, "results"))
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only:
+        print(f"Running {name}...")
+        results[name] = BENCHMARKS[name]()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f_in:
+            baseline = json.load(f_in)["results"]
+    elif not args.update_baseline:
+        print(f"No baseline at {args.baseline}, create one with --update-baseline")
+    print_results(results, baseline)
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    report = {"timestamp": timestamp, "machine": machine_info(), "results": results}
+    os.makedirs(args.results_dir, exist_ok=True)
+    output_file = os.path.join(args.results_dir, f"{timestamp}.json")
+    with open(output_file, "w") as f_out:
+        json.dump(report, f_out, indent=2)
+    print(f"\nSaved the results to {output_file}")
+
+    if args.update_baseline:
+        # Keep the baseline of benchmarks that were not part of this run
+        report["results"] = {**baseline, **results}
+        with open(args.baseline, "w") as f_out:
+            json.dump(report, f_out, indent=2)
+        print(f"Updated the baseline {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for bench, name, reference, current, change in regressions:
+        print(f"REGRESSION {bench}.{name}: {reference:.4f} -> {current:.4f} ({change:+.1%})")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,138 @@
+"""Hot model reload for the prediction services.
+
+`ModelManager` polls the MLflow model registry for a new version in a given stage, loads and
+warms it up in a background thread and then swaps it in with a single reference assignment.
+Requests take a snapshot with `current()`, so in-flight predictions finish on the model they
+started with. At most two models are alive at a time: the one being served and the one being
+loaded, because loads are serialized and the old model is released right after the swap.
+
+The logged `DictVectorizer` pipeline is split into a `RideFeaturizer` and the model, as in the
+batch scoring job, so the services featurize the rides with `transform_rides` straight from
+their location IDs.
+"""
+
+import gc
+import logging
+import threading
+
+import mlflow
+from features import split_pipeline
+from mlflow.exceptions import MlflowException
+from mlflow.tracking import MlflowClient
+
+logger = logging.getLogger(__name__)
+
+WARMUP_RIDE = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+
+
+class ModelManager:
+    def __init__(
+        self,
+        model_name: str,
+        stage: str = "Production",
+        tracking_uri: str = "sqlite:///mlflow.db",
+        poll_interval: float = 30.0,
+        fallback_uri: str = None,
+        fallback_version: str = None,
+    ):
+        self.model_name = model_name
+        self.stage = stage
+        self.poll_interval = poll_interval
+        self.fallback_uri = fallback_uri
+        self.fallback_version = fallback_version
+
+        self.tracking_uri = tracking_uri
+        mlflow.set_tracking_uri(tracking_uri)
+        self.client = MlflowClient(tracking_uri)
+
+        self._current = None  # (version, featurizer, model)
+        self._load_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """Return a `(version, featurizer, model)` snapshot of the model being served."""
+        return self._current
+
+    def latest_version(self):
+        """Latest registered version in the configured stage, `None` if there is none."""
+        try:
+            versions = self.client.get_latest_versions(self.model_name, stages=[self.stage])
+        except MlflowException:
+            logger.warning(f"Model {self.model_name} is not in the registry")
+            return None
+        return versions[0].version if versions else None
+
+    def _load(self, uri: str):
+        featurizer, model = split_pipeline(mlflow.sklearn.load_model(uri))
+        # The first prediction pays for lazy initialization, do it before serving traffic
+        model.predict(featurizer.transform_rides([WARMUP_RIDE]))
+        return featurizer, model
+
+    def refresh(self) -> bool:
+        """Load and swap in a newer version if one is registered, return whether it swapped."""
+        with self._load_lock:
+            version = self.latest_version()
+            if version is None:
+                if self._current is not None or self.fallback_uri is None:
+                    return False
+                uri, version = self.fallback_uri, self.fallback_version
+            else:
+                if self._current is not None and self._current[0] == version:
+                    return False
+                uri = f"models:/{self.model_name}/{version}"
+
+            logger.info(f"Loading model {self.model_name} version {version} from {uri}...")
+            featurizer, model = self._load(uri)
+
+            previous = self._current
+            self._current = (version, featurizer, model)
+            logger.info(f"Serving model {self.model_name} version {version}")
+
+            # Drop our reference to the old model, requests still using it keep it alive
+            del previous, featurizer, model
+            gc.collect()
+            return True
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the current model if the registry or the artifact store fails
+                logger.exception("Model refresh failed")
+
+    def after_fork(self):
+        """Drop the registry connections inherited from the parent, call it in a forked child.
+
+        MLflow keeps one SQLAlchemy engine per database URI for the whole process, so a new
+        client alone would reuse the parent's pooled connections.
+        """
+        for store in (
+            self.client._tracking_client.store,
+            self.client._get_registry_client().store,
+        ):
+            engine = getattr(store, "engine", None)
+            if engine is not None:
+                # Leaves the parent's connections open for the parent, the child opens its own
+                engine.dispose(close=False)
+        self.client = MlflowClient(self.tracking_uri)
+
+    def start(self):
+        """Load the current model if needed and start polling in a daemon thread."""
+        if self._current is None:
+            self.refresh()
+            if self._current is None:
+                raise RuntimeError(f"No {self.stage} version of model {self.model_name}")
+
+        # After a fork the polling thread does not exist in the child, so this starts a new one
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll, name="model-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,196 @@
+"""Prometheus-style metrics for the Flask prediction services.
+
+Records per-stage latency histograms, request counts and in-flight gauges, labelled with the
+model version, and serves them in the Prometheus text format at `/metrics`.
+
+Recording is low-contention: every thread writes only to its own shard of counters, so the
+request path never takes a lock. The shards are summed when `/metrics` is scraped. The shard of
+a finished thread is folded into a shared totals shard, so short-lived threads do not pile up
+shards. With several gunicorn workers every worker process keeps and serves its own numbers.
+
+Requests are labelled with their URL rule (`/predict`), not the raw path, so unknown paths
+cannot create new series: they are all counted as `unmatched`.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import (
+    Response,
+    g,
+    request,
+)
+
+# Upper bounds in seconds, the last bucket is +Inf
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class _Shard:
+    def __init__(self, thread=None):
+        self.thread = thread  # the only writer, None for the totals shard
+        self.histograms = {}  # (stage, model_version) -> [bucket counts..., sum]
+        self.requests = {}  # (endpoint, status, model_version) -> count
+        self.in_flight = {}  # endpoint -> gauge
+
+    def merge(self, other: "_Shard") -> None:
+        """Add the counts of `other` to this shard."""
+        # Other threads keep writing, list() takes a consistent snapshot of each dict
+        for key, counts in list(other.histograms.items()):
+            total = self.histograms.setdefault(key, [0] * len(counts[:-1]) + [0.0])
+            for i, value in enumerate(list(counts)):
+                total[i] += value
+        for key, value in list(other.requests.items()):
+            self.requests[key] = self.requests.get(key, 0) + value
+        for key, value in list(other.in_flight.items()):
+            self.in_flight[key] = self.in_flight.get(key, 0) + value
+
+
+def _endpoint() -> str:
+    """The URL rule of the current request, one label value per route."""
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+class ServingMetrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        self._finished = _Shard()  # the counts of the threads that have exited
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            self._local.shard = shard
+            # Taken once per thread, never on the request path afterwards
+            with self._shards_lock:
+                self._fold_finished()
+                self._shards.append(shard)
+        return shard
+
+    def _fold_finished(self) -> None:
+        """Move the shards of exited threads into the totals, with `_shards_lock` held."""
+        live = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                # Its thread is gone, so nothing writes to it anymore
+                self._finished.merge(shard)
+        self._shards = live
+
+    def observe(self, stage: str, seconds: float, model_version: str = "") -> None:
+        histograms = self._shard().histograms
+        key = (stage, model_version)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    @contextmanager
+    def time(self, stage: str, model_version: str = ""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, model_version)
+
+    def count_request(self, endpoint: str, status: int, model_version: str = "") -> None:
+        requests = self._shard().requests
+        key = (endpoint, str(status), model_version)
+        requests[key] = requests.get(key, 0) + 1
+
+    def add_in_flight(self, endpoint: str, delta: int) -> None:
+        in_flight = self._shard().in_flight
+        in_flight[endpoint] = in_flight.get(endpoint, 0) + delta
+
+    def _collect(self):
+        total = _Shard()
+        with self._shards_lock:
+            self._fold_finished()
+            total.merge(self._finished)
+            shards = list(self._shards)
+
+        for shard in shards:
+            total.merge(shard)
+        return total.histograms, total.requests, total.in_flight
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        histograms, requests, in_flight = self._collect()
+        name = "prediction_stage_latency_seconds"
+        lines = [
+            f"# HELP {name} Latency of each prediction stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for (stage, model_version), counts in sorted(histograms.items()):
+            labels = f'stage="{stage}",model_version="{model_version}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {counts[-1]}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+        lines += [
+            "# HELP prediction_requests_total Requests served.",
+            "# TYPE prediction_requests_total counter",
+        ]
+        for (endpoint, status, model_version), count in sorted(requests.items()):
+            lines.append(
+                f'prediction_requests_total{{endpoint="{endpoint}",status="{status}",'
+                f'model_version="{model_version}"}} {count}'
+            )
+
+        lines += [
+            "# HELP prediction_requests_in_flight Requests being served.",
+            "# TYPE prediction_requests_in_flight gauge",
+        ]
+        for endpoint, value in sorted(in_flight.items()):
+            lines.append(f'prediction_requests_in_flight{{endpoint="{endpoint}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def instrument(self, app, model_version):
+        """Count requests of `app`, track in-flight requests and add the `/metrics` endpoint.
+
+        `model_version` is a callable, so a hot-reloaded model is labelled correctly.
+        """
+
+        @app.before_request
+        def _start_request():
+            g.metrics_start = time.perf_counter()
+            self.add_in_flight(_endpoint(), 1)
+
+        @app.after_request
+        def _count_request(response):
+            version = model_version()
+            self.count_request(_endpoint(), response.status_code, version)
+            self.observe("total", time.perf_counter() - g.metrics_start, version)
+            return response
+
+        @app.teardown_request
+        def _end_request(exc):
+            self.add_in_flight(_endpoint(), -1)
+
+        @app.route("/metrics", methods=["GET"])
+        def metrics_endpoint():
+            return Response(self.render(), mimetype="text/plain; version=0.0.4")
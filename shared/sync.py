@@ -0,0 +1,74 @@
+"""Copy the shared modules into the lesson folders that use them.
+
+The lesson folders are deployed on their own (a Docker image, a Cloud Function, a Prefect
+deployment uploading the folder), so each of them needs its own copy of the modules it imports.
+The modules are edited here only; the copies are generated and checked in, with a header
+pointing back to this folder.
+
+Usage:
+    python shared/sync.py          # rewrite the copies
+    python shared/sync.py --check  # exit with status 1 if a copy is out of date
+"""
+
+import argparse
+import os
+import sys
+
+SHARED_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SHARED_DIR)
+
+TRAINING = "03-workflow-orchestration/04-working-with-deployments"
+BATCH = "04-deployment/batch"
+STREAMING = "04-deployment/streaming"
+WEB_SERVICE = "04-deployment/web-service"
+WEB_SERVICE_MLFLOW = "04-deployment/web-service-mlflow"
+MONITORING = "05-monitoring"
+
+COPIES = {
+    "data_quality.py": [TRAINING, BATCH],
+    "features.py": [TRAINING, BATCH, STREAMING, WEB_SERVICE, WEB_SERVICE_MLFLOW],
+    "model_bundle.py": [TRAINING, STREAMING, WEB_SERVICE, MONITORING],
+    "model_manager.py": [STREAMING, WEB_SERVICE_MLFLOW],
+    "prediction_cache.py": [WEB_SERVICE, WEB_SERVICE_MLFLOW],
+    "ride_codec.py": [STREAMING, WEB_SERVICE, WEB_SERVICE_MLFLOW],
+    "serving_metrics.py": [WEB_SERVICE, WEB_SERVICE_MLFLOW],
+}
+
+HEADER = "# Generated from shared/{name} by shared/sync.py, edit that file instead.\n"
+
+
+def expected_copies():
+    """Yield the path and the expected content of every copy."""
+    for name, folders in COPIES.items():
+        with open(os.path.join(SHARED_DIR, name)) as f_in:
+            content = HEADER.format(name=name) + f_in.read()
+        for folder in folders:
+            yield os.path.join(REPO_ROOT, folder, name), content
+
+
+def sync(check: bool = False) -> list:
+    """Write the copies that differ from the shared modules, or only list them with `check`."""
+    stale = []
+    for path, content in expected_copies():
+        if os.path.exists(path):
+            with open(path) as f_in:
+                if f_in.read() == content:
+                    continue
+        stale.append(os.path.relpath(path, REPO_ROOT))
+        if not check:
+            with open(path, "w") as f_out:
+                f_out.write(content)
+    return stale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="only report stale copies")
+    args = parser.parse_args()
+
+    stale = sync(args.check)
+    for path in stale:
+        print(f"{'Out of date' if args.check else 'Updated'}: {path}")
+    if args.check and stale:
+        print("Edit the modules in shared/ and run `python shared/sync.py`")
+        sys.exit(1)